@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os
+import stat
+import time
+import signal
+import socket
 import asyncio
+import traceback
 
 import uvloop
 from aiohttp import web
 
 from . import views
 from .utils import DB
+from .utils.db import metrics
+from .utils.db.models import base
 from .utils.web import middlewares, Router
 
 
@@ -15,6 +23,7 @@ async def create_app(loop: asyncio.AbstractEventLoop,
                      config: dict) -> web.Application:
 
     app = web.Application(loop=loop, router=Router(), middlewares=[
+        middlewares.compression_middleware,
         middlewares.error_middleware,
         middlewares.auth_middleware
     ])
@@ -77,47 +86,190 @@ async def create_app(loop: asyncio.AbstractEventLoop,
     url('*', '/comments/{comment:\w+}/history', views.CommentHistory)
     url('*', '/comments/{comment:\w+}/votes', views.CommentVoteList)
 
+    url('POST', '/batch', views.batch)
+
+    # В метриках SQL и аргументы медленных запросов - только по флагу
+    if bool(int(config['metrics'])) or bool(int(config['test'])):
+        url('GET', '/metrics', views.metrics)
+
     if bool(int(config['test'])):
         print('RUNNING IN TEST MODE')
         url('POST', '/clear_db', views.clear_db)
         url('POST', '/execute', views.execute)
+        url('GET', '/statements', views.statements)
         app.middlewares.insert(0, middlewares.timeit_middleware)
 
+    app.router.compile()
+
     config['access_key'] = config['access_key'].encode('utf-8')
     config['refresh_key'] = config['refresh_key'].encode('utf-8')
+    # Срок запроса к базе по умолчанию, сек; 0 - без срока
+    config['request_deadline'] = float(config['request_deadline'])
+
+    base.pg_json(bool(int(config['pg_json'])))
+    metrics.slow_query(float(config['slow_query_ms']))
 
     app['cfg'] = config
+    # Реплики: DSN через запятую, пусто - все идет в мастер
+    replicas = [x.strip() for x in config['db_replicas'].split(',')
+                if x.strip()]
+
+    if replicas:
+        app.middlewares.insert(1, middlewares.lsn_middleware)
+
     app['db'] = await DB.init(
         loop=loop, host=config['db_host'], port=int(config['db_port']),
         database=config['db_database'], user=config['db_user'],
         password=config['db_password'], max_size=int(config['pool_max']),
-        min_size=int(config['pool_min'])
+        min_size=int(config['pool_min']), replicas=replicas,
+        # Период сброса буфера голосов; 0 - счетчики через слоты
+        vote_flush=float(config['vote_flush_ms']) / 1e3
     )
 
     return app
 
 
-def main(config: dict):
+def _unix_socket(path: str) -> socket.socket:
+    # Сокет от прошлого запуска мешает bind
+    if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+        os.unlink(path)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    os.chmod(path, 0o666)
+
+    return sock
+
+
+def _worker(config: dict, reuse_port: bool=False,
+            sock: socket.socket=None):
     asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
-    loop = asyncio.get_event_loop()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
     app = loop.run_until_complete(create_app(loop, config))
 
     handler = app.make_handler()
-    server = loop.run_until_complete(loop.create_server(
-        handler, config['server_host'], int(config['server_port'])))
+    path = config['server_socket']
+
+    if path:
+        where = path
+        server = loop.run_until_complete(loop.create_unix_server(
+            handler, sock=sock or _unix_socket(path)))
+    else:
+        where = 'port {}'.format(config['server_port'])
+        server = loop.run_until_complete(loop.create_server(
+            handler, config['server_host'], int(config['server_port']),
+            reuse_port=reuse_port))
+
+    print('Server running at {} (pid {})'.format(where, os.getpid()))
 
-    print('Server running at port {}'.format(config['server_port']))
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, loop.stop)
 
     try:
         loop.run_forever()
-    except KeyboardInterrupt:
-        pass
     finally:
-        print('Shutting down server at port {}'.format(config['server_port']))
+        # Повторный сигнал не должен прервать дренаж
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+            signal.signal(sig, signal.SIG_IGN)
+
+        print('Shutting down server at {} (pid {})'.format(
+            where, os.getpid()))
         server.close()
         loop.run_until_complete(server.wait_closed())
-        loop.run_until_complete(app['db'].close())
         loop.run_until_complete(handler.shutdown(60.0))
+        loop.run_until_complete(app['db'].close())
 
     loop.close()
+
+    if path and sock is None:
+        os.unlink(path)
+
+
+def _supervise(config: dict, workers: int):
+    """Pre-fork: воркеры слушают один порт через SO_REUSEPORT
+
+    Unix-сокет SO_REUSEPORT не умеет, поэтому он создается здесь и
+    наследуется воркерами. Приложение и пул создаются уже в воркере,
+    пул делится между ними. Упавший воркер перезапускается,
+    SIGINT/SIGTERM дренирует всех.
+    """
+    pool_max = max(1, int(config['pool_max']) // workers)
+    pool_min = min(int(config['pool_min']) // workers, pool_max)
+    config = dict(config, pool_max=str(pool_max), pool_min=str(pool_min))
+
+    path = config['server_socket']
+    sock = _unix_socket(path) if path else None
+
+    children = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid:
+            children[pid] = time.monotonic()
+            return
+
+        status = 0
+        try:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(sig, signal.SIG_DFL)
+            _worker(config, reuse_port=True, sock=sock)
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+
+        if os.WIFSIGNALED(status):
+            status = -os.WTERMSIG(status)
+        else:
+            status = os.WEXITSTATUS(status)
+
+        print('Worker {} exited with status {}, restarting'.format(
+            pid, status))
+
+        # Воркер, падающий на старте, не должен крутить fork в цикле
+        if time.monotonic() - started < 1:
+            time.sleep(1)
+
+        spawn()
+
+    if sock is not None:
+        sock.close()
+        os.unlink(path)
+
+
+def main(config: dict, workers: int=1):
+    if workers > 1:
+        _supervise(config, workers)
+    else:
+        _worker(config)
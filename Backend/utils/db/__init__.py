@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from . import auth, models
-from .db import DB, postgres
+from . import auth, cache, metrics, models, votes
+from .db import DB, LazyConnection, SharedConnection, postgres, deadline
 
-__all__ = ('DB', 'postgres', 'auth', 'users', 'models')
+__all__ = ('DB', 'LazyConnection', 'SharedConnection', 'postgres',
+           'deadline', 'auth', 'cache', 'metrics', 'users', 'models',
+           'votes')
@@ -8,6 +8,7 @@ import asyncpg
 from passlib.hash import pbkdf2_sha256
 
 from ..web.exceptions import UsernameAlreadyTaken, AuthFail
+from .db import LazyConnection
 from .models.base import Commands
 
 _c = Commands(
@@ -41,10 +42,13 @@ async def register(conn: asyncpg.connection.Connection,
         raise UsernameAlreadyTaken
 
 
-async def login(conn: asyncpg.connection.Connection,
+async def login(conn: LazyConnection,
                 username: str, password: str) -> Tuple[int, uuid.UUID]:
     data = await _c.r.login(conn, username)
 
+    # pbkdf2 считается десятки мс - без соединения из пула
+    await conn.release()
+
     if not data or not pbkdf2_sha256.verify(password, data['password_hash']):
         raise AuthFail
 
@@ -57,16 +61,18 @@ async def check_random(conn: asyncpg.connection.Connection,
     return await _c.v.check_random(conn, user_id, uuid.UUID(bytes=random))
 
 
-async def invalidate(conn: asyncpg.connection.Connection,
+async def invalidate(conn: LazyConnection,
                      username: str, password: str):
     user_id, _ = await login(conn, username, password)
 
     await _reset_random(conn, user_id)
 
 
-async def change(conn: asyncpg.connection.Connection,
+async def change(conn: LazyConnection,
                  username: str, password: str, new_password: str):
     user_id, _ = await login(conn, username, password)
+    password_hash = pbkdf2_sha256.hash(new_password)
 
-    await _reset_random(conn, user_id)
-    await _c.e.change(conn, user_id, pbkdf2_sha256.hash(new_password))
+    async with conn.transaction():
+        await _reset_random(conn, user_id)
+        await _c.e.change(conn, user_id, password_hash)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Кэш масок checks.perms() внутри воркера
+
+Админы, модераторы и баны меняются редко, а проверяются почти на каждой
+записи. Триггеры (миграция b7e3f1a0c4d2) шлют NOTIFY perms с id юзера,
+DB слушает канал отдельным соединением и сбрасывает записи этого юзера.
+Пока слушателя нет, кэш выключен - иначе пропущенный NOTIFY жил бы до TTL.
+"""
+
+import time
+from collections import OrderedDict
+
+__all__ = ('PermsCache', 'perms')
+
+
+class PermsCache:
+    def __init__(self, users: int=10000, keys: int=64,
+                 ttl: float=60.0) -> None:
+        self.users = users
+        self.keys = keys
+        self.ttl = ttl
+
+        self.active = False
+        self.hits = 0
+        self.misses = 0
+        # Растет на каждый сброс: ответ, запрошенный до сброса, не кладем
+        self.epoch = 0
+
+        # user_id -> (expires, {(blog_id, fandom_id): mask})
+        self._data = OrderedDict()
+
+    def get(self, user_id: int, key: tuple) -> int:
+        if not self.active:
+            return None
+
+        entry = self._data.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if entry[0] < time.monotonic():
+            del self._data[user_id]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(user_id)
+        mask = entry[1].get(key)
+
+        if mask is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return mask
+
+    def put(self, user_id: int, key: tuple, mask: int, epoch: int):
+        if not self.active or epoch != self.epoch:
+            return
+
+        entry = self._data.get(user_id)
+
+        if entry is None or entry[0] < time.monotonic():
+            entry = self._data[user_id] = (time.monotonic() + self.ttl, {})
+            if len(self._data) > self.users:
+                self._data.popitem(last=False)
+        else:
+            self._data.move_to_end(user_id)
+
+        masks = entry[1]
+        if len(masks) >= self.keys:
+            del masks[next(iter(masks))]
+        masks[key] = mask
+
+    def stats(self) -> dict:
+        return dict(active=self.active, users=len(self._data),
+                    hits=self.hits, misses=self.misses)
+
+    def invalidate(self, user_id: int=None):
+        self.epoch += 1
+
+        if user_id is None:
+            self._data.clear()
+        else:
+            self._data.pop(user_id, None)
+
+    def notify(self, conn, pid: int, channel: str, payload: str):
+        """Колбэк asyncpg add_listener"""
+        self.invalidate(int(payload) if payload else None)
+
+
+perms = PermsCache()
@@ -1,56 +1,586 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import time
 import asyncio
+import traceback
+from typing import Sequence
 
 import asyncpg
 import aiohttp.web_request
+from aiohttp import hdrs
+
+from . import cache, metrics, statements, votes
+from ..web.exceptions import ServiceUnavailable, DeadlineExceeded
+
+# Как часто проверять, живо ли соединение-слушатель NOTIFY perms, сек
+_LISTEN_CHECK = 5
+
+# Как часто переносить слоты голосов в votes_up/votes_down, сек
+_ROLLUP = 1
+
+# Водяной знак: LSN последней записи клиента на мастере
+LSN_COOKIE = 'lsn'
+LSN_HEADER = 'X-LSN'
+
+_LSN_CURRENT = "SELECT pg_current_wal_lsn()::TEXT"
+_LSN_REPLAYED = "SELECT pg_last_wal_replay_lsn() >= $1::PG_LSN"
+
+
+def watermark(request: aiohttp.web_request.Request) -> str:
+    return request.headers.get(LSN_HEADER) or \
+        request.cookies.get(LSN_COOKIE)
 
 
 class DB:
-    def __init__(self, pool: asyncpg.pool.Pool) -> None:
+    def __init__(self, pool: asyncpg.pool.Pool,
+                 loop: asyncio.AbstractEventLoop) -> None:
         self._pool = pool
+        self._loop = loop
+        self._replicas = []
+        self._next = 0
+        # id(соединения) -> пул, которому его вернуть
+        self._owners = dict()
+        self._listener = None
+        self._listener_args = None
+        self._watcher = None
+        self._roller = None
+        self._flusher = None
+        self._flush_lock = asyncio.Lock(loop=loop)
 
     @classmethod
     async def init(cls, *, host: str=None, port: int=None, database: str=None,
                    user: str=None, password: str=None,
                    min_size: int, max_size: int,
-                   loop: asyncio.AbstractEventLoop) -> 'DB':
+                   loop: asyncio.AbstractEventLoop,
+                   replicas: Sequence[str]=(),
+                   vote_flush: float=0) -> 'DB':
+
+        options = dict(
+            min_size=min_size, max_size=max_size,
+            loop=loop, connection_class=statements.Connection,
+            # JSON от Postgres должен совпадать с datetime.isoformat() в UTC
+            server_settings={'timezone': 'UTC'})
 
         self = cls(await asyncpg.create_pool(
             host=host, port=port, user=user, password=password,
-            database=database, min_size=min_size, max_size=max_size,
-            loop=loop
-        ))
+            database=database,
+            # Каждое новое соединение сразу готовит весь реестр Commands
+            init=statements.Connection.prepare_all, **options
+        ), loop)
+
+        for dsn in replicas:
+            self._replicas.append(await asyncpg.create_pool(
+                dsn, init=statements.Connection.prepare_replica, **options))
+
+        # Пул на release делает UNLISTEN *, поэтому слушатель - отдельно
+        self._listener_args = dict(
+            host=host, port=port, user=user, password=password,
+            database=database, loop=loop)
+
+        await self._listen()
+        self._watcher = loop.create_task(self._watch())
+        self._roller = loop.create_task(self._roll_up())
+
+        # Счетчики голосов через буфер воркера вместо слотов
+        if vote_flush > 0:
+            for buffer in votes.buffers:
+                buffer.active = True
+            self._flusher = loop.create_task(self._flush_loop(vote_flush))
 
         return self
 
-    def acquire(self) -> asyncpg.pool.PoolAcquireContext:
-        return self._pool.acquire()
+    async def _listen(self):
+        cache.perms.active = False
+        cache.perms.invalidate()
+
+        if self._listener is not None:
+            self._listener.terminate()
+            self._listener = None
+
+        try:
+            listener = await asyncpg.connect(**self._listener_args)
+            await listener.add_listener('perms', cache.perms.notify)
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError):
+            traceback.print_exc()
+            return
+
+        self._listener = listener
+        cache.perms.active = True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(_LISTEN_CHECK, loop=self._loop)
+
+            if self._listener is not None:
+                try:
+                    await self._listener.fetchval(
+                        'SELECT 1', timeout=_LISTEN_CHECK)
+                    continue
+                except (OSError, asyncio.TimeoutError,
+                        asyncpg.PostgresError, asyncpg.InterfaceError):
+                    pass
+
+            # Пока слушателя не было, NOTIFY могли потеряться
+            await self._listen()
+
+    async def _roll_up(self):
+        """Слоты голосов -> счетчики (миграция 7a3c5e9b1d48)
+
+        Читать можно и без этого (*_counted складывают слоты), но чем
+        меньше слотов, тем дешевле чтение. Цикл есть в каждом воркере, а
+        переносит за раз только один: votes_rollup() без advisory-lock
+        сразу выходит (миграция 5b9d3f7a2c61).
+        """
+        while True:
+            await asyncio.sleep(_ROLLUP, loop=self._loop)
+
+            try:
+                await self._pool.execute(
+                    'SELECT votes_rollup()', timeout=_ROLLUP * 10)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError,
+                    asyncpg.InterfaceError):
+                traceback.print_exc()
+
+    async def _flush_loop(self, period: float):
+        while True:
+            await asyncio.sleep(period, loop=self._loop)
+            # Отмена (close) не должна оборвать UPDATE на середине
+            await asyncio.shield(self._flush_votes(), loop=self._loop)
+
+    async def _flush_votes(self):
+        async with self._flush_lock:
+            if not any(votes.buffers):
+                return
+
+            try:
+                async with self._pool.acquire() as conn:
+                    for buffer in votes.buffers:
+                        await buffer.flush(conn)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError,
+                    asyncpg.InterfaceError):
+                traceback.print_exc()
+
+    @property
+    def replicated(self) -> bool:
+        return bool(self._replicas)
+
+    def acquire(self, readonly: bool=False, lsn: str=None,
+                deadline: float=None) -> '_AcquireContext':
+        """Соединение с мастером или, для чтения, с репликой
+
+        Реплика подходит, только если уже проиграла lsn - иначе клиент не
+        увидел бы собственную запись. Если таких нет, читаем с мастера.
+        deadline (loop.time()) ограничивает ожидание пула и все запросы
+        на выданном соединении, см. statements.Connection.timeout.
+        """
+        return _AcquireContext(self, readonly, lsn, deadline)
+
+    def _left(self, deadline: float) -> float:
+        return None if deadline is None else deadline - self._loop.time()
+
+    async def _acquire(self, readonly: bool, lsn: str, deadline: float
+                       ) -> asyncpg.connection.Connection:
+
+        for _ in range(len(self._replicas) if readonly else 0):
+            pool = self._replicas[self._next % len(self._replicas)]
+            self._next += 1
+
+            start = time.perf_counter()
+            try:
+                conn = await pool.acquire(timeout=self._left(deadline))
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError):
+                continue
+            metrics.acquire['replica'].observe(time.perf_counter() - start)
+
+            try:
+                replayed = lsn is None or await conn.fetchval(
+                    _LSN_REPLAYED, lsn, timeout=self._left(deadline))
+            except (asyncio.TimeoutError, asyncpg.PostgresError):
+                # Кривой водяной знак или реплика тормозит - читаем с мастера
+                await pool.release(conn)
+                break
+            except BaseException:
+                # Обрыв соединения или отмена хендлера (клиент ушел): в
+                # _owners conn еще нет, так что слот пула возвращаем здесь
+                await pool.release(conn)
+                raise
+
+            if replayed:
+                self._owners[id(conn)] = pool
+                conn.set_deadline(deadline)
+                return conn
+
+            await pool.release(conn)
+
+        start = time.perf_counter()
+        conn = await self._pool.acquire(timeout=self._left(deadline))
+        metrics.acquire['primary'].observe(time.perf_counter() - start)
+        self._owners[id(conn)] = self._pool
+        conn.set_deadline(deadline)
+
+        return conn
+
+    async def lsn(self, conn: asyncpg.connection.Connection) -> str:
+        return await conn.fetchval(_LSN_CURRENT)
 
     async def release(self, conn: asyncpg.connection.Connection):
-        await self._pool.release(conn)
+        conn.set_deadline(None)
+        await self._owners.pop(id(conn), self._pool).release(conn)
 
     async def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+
+        if self._roller is not None:
+            self._roller.cancel()
+
+        if self._flusher is not None:
+            self._flusher.cancel()
+            # Остаток буфера - до закрытия пула
+            for buffer in votes.buffers:
+                buffer.active = False
+            await self._flush_votes()
+
+        if self._listener is not None:
+            await self._listener.close()
+
+        cache.perms.active = False
+
+        for pool in self._replicas:
+            await pool.close()
         await self._pool.close()
 
 
-def postgres(func):
-    async def wrapped(*args, **kwargs):
-        if isinstance(args[0], aiohttp.web_request.Request):
-            args[0].conn = await args[0].app['db'].acquire()
+class _AcquireContext:
+    """await db.acquire() или async with db.acquire() as conn"""
+
+    __slots__ = ('_db', '_args', '_conn')
+
+    def __init__(self, db: DB, *args) -> None:
+        self._db = db
+        self._args = args
+        self._conn = None
+
+    def __await__(self):
+        return self._db._acquire(*self._args).__await__()
 
+    async def __aenter__(self) -> asyncpg.connection.Connection:
+        self._conn = await self._db._acquire(*self._args)
+        return self._conn
+
+    async def __aexit__(self, *exc):
+        conn, self._conn = self._conn, None
+        await self._db.release(conn)
+
+
+class LazyConnection:
+    """Соединение обработчика: берется из пула только на первом запросе
+
+    Ошибки валидации и прав по токену не занимают соединение вовсе.
+    release() возвращает его сразу после последнего запроса (например,
+    перед проверкой пароля), следующий запрос возьмет новое. Соединение
+    держится непрерывно только внутри transaction().
+    """
+
+    def __init__(self, db: DB, readonly: bool, lsn: str, deadline: float,
+                 loop: asyncio.AbstractEventLoop) -> None:
+        self._db = db
+        self._readonly = readonly
+        self._watermark = lsn
+        self._deadline = deadline
+        self._loop = loop
+        self._conn = None
+        # Число открытых transaction(): пока оно не 0, release() не отдает
+        self._transactions = 0
+        # LSN записей на мастере к последнему release()
+        self.lsn = None
+
+    @property
+    def acquired(self) -> bool:
+        return self._conn is not None
+
+    @property
+    def replica(self) -> bool:
+        return self._conn is not None and self._conn.replica
+
+    async def _get(self) -> asyncpg.connection.Connection:
+        if self._conn is None:
             try:
-                return await func(*args, **kwargs)
-            finally:
-                await args[0].app['db'].release(args[0].conn)
+                self._conn = await self._db.acquire(
+                    self._readonly, self.lsn or self._watermark,
+                    self._deadline)
+            except asyncio.TimeoutError:
+                raise ServiceUnavailable
+
+        return self._conn
+
+    async def release(self):
+        if self._conn is None or self._transactions:
+            return
+
+        conn, self._conn = self._conn, None
+
+        try:
+            # Запомнить, докуда реплики должны догнать этого клиента
+            if not self._readonly and self._db.replicated:
+                try:
+                    self.lsn = await self._db.lsn(conn)
+                except (OSError, asyncpg.PostgresError,
+                        asyncpg.InterfaceError):
+                    pass
+        finally:
+            await self._db.release(conn)
+
+    def timeout(self) -> float:
+        if self._conn is not None:
+            return self._conn.timeout()
+
+        if self._deadline is None:
+            return None
+
+        left = self._deadline - self._loop.time()
+        if left <= 0:
+            raise asyncio.TimeoutError
+
+        return left
+
+    def transaction(self, **kwargs) -> '_Transaction':
+        """async with request.conn.transaction(): ..."""
+        return _Transaction(self, kwargs)
 
+    async def statement(self, sql: str
+                        ) -> asyncpg.prepared_stmt.PreparedStatement:
+        return await (await self._get()).statement(sql)
+
+    async def execute(self, *args, **kwargs):
+        return await (await self._get()).execute(*args, **kwargs)
+
+    async def fetch(self, *args, **kwargs):
+        return await (await self._get()).fetch(*args, **kwargs)
+
+    async def fetchval(self, *args, **kwargs):
+        return await (await self._get()).fetchval(*args, **kwargs)
+
+    async def fetchrow(self, *args, **kwargs):
+        return await (await self._get()).fetchrow(*args, **kwargs)
+
+
+class _Transaction:
+    """Транзакция asyncpg, на время которой LazyConnection не отпускается"""
+
+    __slots__ = ('_lazy', '_kwargs', '_transaction')
+
+    def __init__(self, lazy: LazyConnection, kwargs: dict) -> None:
+        self._lazy = lazy
+        self._kwargs = kwargs
+        self._transaction = None
+
+    async def __aenter__(self):
+        conn = await self._lazy._get()
+        self._transaction = conn.transaction(**self._kwargs)
+
+        await self._transaction.start()
+        self._lazy._transactions += 1
+
+        return self._transaction
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._lazy._transactions -= 1
+
+        if exc_type is None:
+            await self._transaction.commit()
         else:
-            args[0].request.conn = await args[0].request.app['db'].acquire()
+            await self._transaction.rollback()
 
-            try:
-                return await func(*args, **kwargs)
-            finally:
-                await args[0].request.app['db'].release(args[0].request.conn)
+
+class SharedConnection:
+    """Одно соединение на несколько конкурентных обработчиков (/batch)
+
+    asyncpg не выполняет две операции на соединении одновременно, поэтому
+    запросы к базе идут по очереди, а остальная работа - параллельно.
+    Транзакция держит замок целиком, чтобы в нее не попали чужие запросы.
+    Прочий API соединения мимо замка не пробрасывается.
+    """
+
+    def __init__(self, conn: 'LazyConnection',
+                 loop: asyncio.AbstractEventLoop) -> None:
+        self._conn = conn
+        self._lock = _TaskLock(loop)
+
+    @property
+    def replica(self) -> bool:
+        return self._conn.replica
+
+    def timeout(self) -> float:
+        return self._conn.timeout()
+
+    def transaction(self, **kwargs) -> '_SharedTransaction':
+        return _SharedTransaction(self, kwargs)
+
+    async def execute(self, *args, **kwargs):
+        async with self._lock:
+            return await self._conn.execute(*args, **kwargs)
+
+    async def fetch(self, *args, **kwargs):
+        async with self._lock:
+            return await self._conn.fetch(*args, **kwargs)
+
+    async def fetchval(self, *args, **kwargs):
+        async with self._lock:
+            return await self._conn.fetchval(*args, **kwargs)
+
+    async def fetchrow(self, *args, **kwargs):
+        async with self._lock:
+            return await self._conn.fetchrow(*args, **kwargs)
+
+    async def release(self):
+        # Соединение общее на весь /batch, его отпустит внешний postgres
+        pass
+
+    async def statement(self, sql: str) -> '_SharedStatement':
+        async with self._lock:
+            stmt = await self._conn.statement(sql)
+
+        return _SharedStatement(stmt, self._lock)
+
+
+class _TaskLock:
+    """asyncio.Lock, который задача-владелец может взять повторно
+
+    Запросы внутри транзакции SharedConnection идут из той же задачи, что
+    ее открыла, и не должны ждать сами себя.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._lock = asyncio.Lock(loop=loop)
+        self._loop = loop
+        self._owner = None
+        self._depth = 0
+
+    async def __aenter__(self):
+        task = asyncio.Task.current_task(loop=self._loop)
+
+        if self._owner is not task:
+            await self._lock.acquire()
+            self._owner = task
+
+        self._depth += 1
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._depth -= 1
+
+        if not self._depth:
+            self._owner = None
+            self._lock.release()
+
+
+class _SharedTransaction:
+    """Транзакция на SharedConnection: замок на весь блок"""
+
+    __slots__ = ('_shared', '_kwargs', '_transaction')
+
+    def __init__(self, shared: SharedConnection, kwargs: dict) -> None:
+        self._shared = shared
+        self._kwargs = kwargs
+        self._transaction = None
+
+    async def __aenter__(self):
+        await self._shared._lock.__aenter__()
+
+        try:
+            self._transaction = self._shared._conn.transaction(
+                **self._kwargs)
+            return await self._transaction.__aenter__()
+        except BaseException:
+            await self._shared._lock.__aexit__(None, None, None)
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            await self._transaction.__aexit__(exc_type, exc, tb)
+        finally:
+            await self._shared._lock.__aexit__(exc_type, exc, tb)
+
+
+class _SharedStatement:
+    """PreparedStatement, выполняемый под замком SharedConnection"""
+
+    def __init__(self, stmt: asyncpg.prepared_stmt.PreparedStatement,
+                 lock: _TaskLock) -> None:
+        self._stmt = stmt
+        self._lock = lock
+
+    async def fetch(self, *args, **kwargs):
+        async with self._lock:
+            return await self._stmt.fetch(*args, **kwargs)
+
+    async def fetchval(self, *args, **kwargs):
+        async with self._lock:
+            return await self._stmt.fetchval(*args, **kwargs)
+
+    async def fetchrow(self, *args, **kwargs):
+        async with self._lock:
+            return await self._stmt.fetchrow(*args, **kwargs)
+
+
+def _request(args: tuple) -> aiohttp.web_request.Request:
+    if isinstance(args[0], aiohttp.web_request.Request):
+        return args[0]
+    return args[0].request
+
+
+async def _bounded(coro):
+    try:
+        return await coro
+    except asyncio.TimeoutError:
+        # asyncpg уже отправил серверу отмену запроса
+        raise DeadlineExceeded
+
+
+def deadline(seconds: float):
+    """Свой срок обработчика вместо request_deadline из конфига
+
+    Ставится над @postgres, отсчет - с входа в обработчик.
+    """
+    def decorator(func):
+        async def wrapped(*args, **kwargs):
+            request = _request(args)
+            request.deadline = request.app.loop.time() + seconds
+
+            return await func(*args, **kwargs)
+
+        return wrapped
+    return decorator
+
+
+def postgres(func):
+    async def wrapped(*args, **kwargs):
+        request = _request(args)
+
+        # Подзапрос /batch: соединение (и его срок) уже взято снаружи
+        if getattr(request, 'conn', None) is not None:
+            return await _bounded(func(*args, **kwargs))
+
+        db = request.app['db']
+        readonly = request.method in (hdrs.METH_GET, hdrs.METH_HEAD)
+
+        deadline = getattr(request, 'deadline', None)
+        if deadline is None and request.app['cfg']['request_deadline']:
+            deadline = request.app.loop.time() + \
+                request.app['cfg']['request_deadline']
+
+        request.conn = LazyConnection(
+            db, readonly, watermark(request), deadline, request.app.loop)
+
+        try:
+            return await _bounded(func(*args, **kwargs))
+        finally:
+            # json_response снаружи: ответ кодируется уже без соединения
+            conn, request.conn = request.conn, None
+            await conn.release()
+
+            if conn.lsn is not None:
+                request.lsn = conn.lsn
 
     return wrapped
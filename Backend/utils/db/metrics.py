@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Метрики запросов воркера: время, строки, ожидание пула
+
+Запросы Commands и checks считаются по имени из реестра statements
+(модуль.Класс.ключ). Запрос дольше порога slow_query() печатается с
+формой аргументов - типами и длинами, без самих значений.
+"""
+
+import os
+import time
+import bisect
+
+from . import cache
+
+__all__ = ('Histogram', 'queries', 'acquire', 'slow_query', 'timed',
+           'snapshot')
+
+# Верхние границы корзин, сек; последняя - все остальное
+_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+            0.05, 0.1, 0.25, 0.5, 1.0, float('inf'))
+
+_slow = None
+
+
+class Histogram:
+    __slots__ = ('count', 'total', 'buckets')
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(_BUCKETS)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.buckets[bisect.bisect_left(_BUCKETS, seconds)] += 1
+
+    def as_dict(self) -> dict:
+        return dict(
+            count=self.count, total_ms=round(self.total * 1e3, 3),
+            buckets=[['+Inf' if x == _BUCKETS[-1] else x * 1e3, y]
+                     for (x, y) in zip(_BUCKETS, self.buckets)])
+
+
+class _Query(Histogram):
+    __slots__ = ('rows', 'errors')
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.rows = 0
+        self.errors = 0
+
+    def as_dict(self) -> dict:
+        return dict(super().as_dict(), rows=self.rows, errors=self.errors)
+
+
+# имя запроса -> _Query
+queries = dict()
+
+# Ожидание свободного соединения в пуле
+acquire = dict(primary=Histogram(), replica=Histogram())
+
+
+def slow_query(ms: float):
+    """Порог медленного запроса, мс; 0 - не логировать"""
+    global _slow
+    _slow = ms / 1e3 if ms > 0 else None
+
+
+def _shape(args: tuple) -> str:
+    def one(arg):
+        name = type(arg).__name__
+        if isinstance(arg, (list, tuple, set, frozenset)):
+            return f'{name}[{len(arg)}]'
+        if isinstance(arg, (str, bytes)):
+            return f'{name}({len(arg)})'
+        return name
+
+    return '(' + ', '.join(map(one, args)) + ')'
+
+
+def _rows(resp) -> int:
+    if isinstance(resp, list):
+        return len(resp)
+    return int(resp is not None)
+
+
+async def timed(name: str, args: tuple, coro):
+    """Выполняет coro - запрос name с аргументами args - и учитывает его"""
+    query = queries.get(name)
+    if query is None:
+        query = queries[name] = _Query()
+
+    start = time.perf_counter()
+
+    try:
+        resp = await coro
+    except Exception:
+        query.errors += 1
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        query.observe(elapsed)
+
+    query.rows += _rows(resp)
+
+    if _slow is not None and elapsed >= _slow:
+        print(f'SLOW QUERY {elapsed * 1e3:.1f}ms {name} {_shape(args)}')
+
+    return resp
+
+
+def snapshot() -> dict:
+    return dict(
+        pid=os.getpid(),
+        acquire={x: y.as_dict() for (x, y) in acquire.items()},
+        perms_cache=cache.perms.stats(),
+        queries={x: y.as_dict() for (x, y) in sorted(queries.items())})
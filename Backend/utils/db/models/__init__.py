@@ -1,14 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from .base import Page, register
 from .users import *  # noqa
 from .fandoms import *  # noqa
 from .blogs import *  # noqa
 from .posts import *  # noqa
 from .comments import *  # noqa
 
-__all__ = (users.__all__ +  # noqa
+__all__ = (('Page',) +
+           users.__all__ +  # noqa
            fandoms.__all__ +  # noqa
            blogs.__all__ +  # noqa
            posts.__all__ +  # noqa
            comments.__all__)  # noqa
+
+register(User, Fandom, Blog, Post, Comment)  # noqa
@@ -1,48 +1,345 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import sys
+import struct
+from datetime import datetime, timedelta, timezone
+from base64 import urlsafe_b64encode as b64e, urlsafe_b64decode as b64d
+
+from .. import metrics, statements
+from ...web.exceptions import ValidationError
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US = timedelta(microseconds=1)
+
+# Отдавать списки JSON-ом, собранным в Postgres (см. Obj._fetch_page)
+_pg_json = False
+
+
+def pg_json(enabled: bool):
+    global _pg_json
+    _pg_json = enabled
+
+
+# Основные модели по _type, для ?include= (см. Obj.include)
+_models = dict()
+
+
+def register(*classes):
+    for cls in classes:
+        _models[cls._type] = cls
+
 
 # Страшный костыль
 class SelectResult(tuple):
-    pass
+    # Курсор следующей страницы, если она есть
+    cursor: str = None
+    # Связанные объекты (?include=)
+    included: list = None
+    # Другое представление тех же строк (дерево и т.п.), входит в ETag
+    variant: tuple = None
+
+
+class JsonResult:
+    """Страница, которую Postgres уже отрендерил в JSON построчно"""
+
+    included: list = None
+
+    def __init__(self, rows: list, cursor: str=None) -> None:
+        self.rows = rows
+        self.cursor = cursor
+
+
+class StreamResult:
+    """Выборка, которая отдается клиенту построчно из серверного курсора"""
+
+    def __init__(self, cls, cursor, *args, user_id: int=None) -> None:
+        self._cls = cls
+        self._cursor = cursor
+        self._args = args
+        self._uid = user_id
+
+    async def iterate(self, conn):
+        # Курсор живет только внутри транзакции, открывает ее вызывающий
+        async for record in self._cursor(conn, *self._args):
+            yield self._cls(record, conn, self._uid)
+
+
+class Page:
+    """Keyset-пагинация: after - ключ сортировки последней строки страницы"""
+
+    # Начальное значение курсора для сортировки по убыванию времени
+    LATEST = datetime(9999, 12, 31, tzinfo=timezone.utc)
+
+    def __init__(self, after: tuple=None, limit: int=20,
+                 fields: dict=None) -> None:
+        self.after = after
+        self.limit = limit
+        # Sparse fieldsets: {type: (column, ...)}, см. Obj._sparse_sql
+        self.fields = fields or {}
 
+    @staticmethod
+    def encode(values: tuple) -> str:
+        ints = tuple((x - _EPOCH) // _US if isinstance(x, datetime) else x
+                     for x in values)
 
-class Obj:
-    def __init__(self, data, conn=None, user_id=None):
-        self._data = self._map(dict(data))
+        return b64e(struct.pack(f'!{len(ints)}q', *ints)) \
+            .rstrip(b'=').decode('ascii')
+
+    @staticmethod
+    def decode(cursor: str) -> tuple:
+        raw = b64d(cursor + '=' * (-len(cursor) % 4))
+        if not raw or len(raw) % 8:
+            raise ValueError(cursor)
+
+        return struct.unpack(f'!{len(raw) // 8}q', raw)
+
+    def args(self, *initial) -> tuple:
+        """Значения курсора (на первой странице - initial) и LIMIT"""
+        if self.after is None:
+            return (*initial, self.limit + 1)
+
+        if len(self.after) != len(initial):
+            raise ValidationError(details=['after: Invalid cursor'])
+
+        values = tuple(
+            _EPOCH + x * _US if isinstance(i, datetime) else x
+            for x, i in zip(self.after, initial))
+
+        return (*values, self.limit + 1)
+
+
+class _Model(type):
+    """Каждой модели - пустые __slots__ (без __dict__ на экземпляр) и
+    готовое множество колонок, не попадающих в attributes"""
+
+    def __new__(mcs, name, bases, namespace):
+        namespace.setdefault('__slots__', ())
+        cls = super().__new__(mcs, name, bases, namespace)
+        cls._skip = frozenset(('id',) + (cls._meta or ()) + cls._hidden)
+
+        return cls
+
+
+class Obj(metaclass=_Model):
+    """Строка выборки: Record как есть, без копирования в словари
+
+    attrs и meta читают прямо из записи; {type, id, meta, attributes}
+    собирается только при сериализации (_data).
+    """
+
+    __slots__ = ('_record', '_conn', '_uid', 'included')
+
+    def __init__(self, record, conn=None, user_id=None):
+        self._record = record
         self._conn = conn
         self._uid = user_id
+        # Связанные объекты (?include=)
+        self.included = None
 
     @property
     def id(self):
-        return self._data['id']
+        return self._record['id']
 
     @property
     def attrs(self):
-        return self._data['attributes']
+        return self._record
 
     @property
     def meta(self):
-        return self._data['meta']
+        return self._record
+
+    @property
+    def _data(self) -> dict:
+        record = self._record
+        data = {'type': self._type, 'id': record['id']}
+
+        if self._meta is not None:
+            meta = {x: record[x] for x in self._meta if x in record}
+            if meta:
+                data['meta'] = meta
+
+        skip = self._skip
+        data['attributes'] = {k: x for k, x in record.items()
+                              if k not in skip}
+
+        return data
+
+    @property
+    def version(self) -> tuple:
+        """(type, id, edited_at, *meta) - основа для ETag"""
+        record = self._record
+        edited_at = record.get('edited_at')
+
+        if edited_at is None:
+            # Связи (модеры, баны, голоса) без edited_at - по всем полям
+            return (self._type, self.id, None, repr(tuple(record.items())))
+
+        return (self._type, self.id, edited_at) + \
+            tuple(record.get(x) for x in self._meta or ())
+
+    @classmethod
+    async def version_by_id(cls, conn, target_id: int) -> tuple:
+        """То же, что version, без загрузки всей строки (команда version)"""
+        row = await cls._c.r.version(conn, target_id)
+        if row is None:
+            return None
+
+        return (cls._type, row['id'], row['edited_at']) + \
+            tuple(row[x] for x in cls._meta or ())
+
+    @classmethod
+    async def include(cls, conn, data: list, names: tuple) -> list:
+        """Связанные объекты для ?include=, по одному select_by_id на тип
+
+        data - элементы в виде _data ({type, id, attributes}). Объекты,
+        уже попавшие в data, и повторы в результат не попадают. Связь,
+        чью колонку отрезал fields[type], - ошибка, а не пустой included.
+        """
+        unknown = [x for x in names if x not in cls._includes]
+        if unknown:
+            raise ValidationError(details=[
+                f'include: Unknown relation {x}' for x in unknown])
+
+        cut = [x for x in names
+               if any(cls._includes[x][1] not in y['attributes']
+                      for y in data)]
+        if cut:
+            raise ValidationError(details=[
+                f'include: Relation {x} needs {cls._includes[x][1]} '
+                f'in fields[{cls._type}]' for x in cut])
+
+        ids = dict()
+        for name in names:
+            target, column = cls._includes[name]
+            ids.setdefault(target, set()).update(
+                x['attributes'].get(column) for x in data)
+
+        seen = {(x['type'], x['id']) for x in data}
+        included = list()
+
+        for target, target_ids in ids.items():
+            target_ids.discard(None)
+            target_ids.discard(0)
+            if not target_ids:
+                continue
+
+            model = _models[target]
+            rows = await model._c.select_by_id(conn, sorted(target_ids))
+
+            for obj in model._result(rows, conn):
+                if (obj._type, obj.id) not in seen:
+                    seen.add((obj._type, obj.id))
+                    included.append(obj)
+
+        return included
 
     def __repr__(self):
         return f'<{type(self).__name__} id={self.id}>'
 
     _type = ''
     _meta: tuple = None
+    # Служебные колонки выборки, которые клиенту не отдаются
+    _hidden: tuple = ()
+    # Колонки, доступные в fields[type]. Смотрит на них только _fetch_page
+    # (списки постов и комментариев): там при пустом _fields любой
+    # fields[type] - ошибка, остальные ответы fields[] не учитывают
+    _fields: tuple = ()
+    # ?include=: имя связи -> (_type связанной модели, колонка с ее id)
+    _includes: dict = {}
+
+    @classmethod
+    def _result(cls, rows, conn=None, user_id=None, page: Page=None,
+                key: tuple=('id',)) -> SelectResult:
+
+        if page is None or len(rows) <= page.limit:
+            return SelectResult(cls(x, conn, user_id) for x in rows)
+
+        rows = rows[:page.limit]
+        result = SelectResult(cls(x, conn, user_id) for x in rows)
+        result.cursor = Page.encode(tuple(rows[-1][k] for k in key))
+
+        return result
+
+    @classmethod
+    async def _fetch_page(cls, command, conn, user_id: int, page: Page,
+                          *args, initial: tuple=(0,), key: tuple=('id',)):
+
+        sql = cls._sparse_sql(command.__name__, page, key)
+
+        # Запрос динамический, но считается как исходная команда
+        name = statements.name(cls._c.sql[command.__name__])
+        args += page.args(*initial)
+
+        if not _pg_json:
+            resp = await metrics.timed(name, args, conn.fetch(
+                sql, *args, timeout=conn.timeout()))
+            return cls._result(resp, conn, user_id, page, key)
+
+        rows = await metrics.timed(name, args, conn.fetch(
+            cls._json_sql(sql, key), *args, timeout=conn.timeout()))
+
+        result = JsonResult([x['json'].encode('utf-8')
+                             for x in rows[:page.limit]])
+        if len(rows) > page.limit:
+            result.cursor = Page.encode(
+                tuple(rows[page.limit - 1][k] for k in key))
+
+        return result
 
     @classmethod
-    def _map(cls, data: dict) -> dict:
-        resp = dict(type=cls._type, id=data.pop('id'))
+    def _sparse_sql(cls, name: str, page: Page, key: tuple) -> str:
+        """SELECT * команды name -> только колонки из fields[type]
 
-        if cls._meta is not None:
-            _m = {x: data.pop(x) for x in cls._meta if x in data}
-            if _m:
-                resp['meta'] = _m
+        Колонки берутся из белого списка _fields; id и ключ сортировки
+        выбираются всегда. Команды с явным списком колонок не меняются.
+        """
+        sql = cls._c.sql[name]
+        fields = page.fields.get(cls._type)
+
+        if not fields or not sql.startswith('SELECT * '):
+            return sql
+
+        unknown = [x for x in fields if x not in cls._fields]
+        if unknown:
+            raise ValidationError(details=[
+                f'fields[{cls._type}]: Unknown field {x}' for x in unknown])
+
+        columns = ['id'] + [x for x in key if x != 'id']
+        columns += [x for x in cls._fields
+                    if x in fields and x not in columns]
+
+        return f'SELECT {", ".join(columns)} {sql[9:]}'
+
+    @classmethod
+    def _json_sql(cls, sql: str, key: tuple) -> str:
+        """Оборачивает запрос так, чтобы каждая строка пришла готовым
+        JSON в том же виде, что и у _data"""
+        cache = cls.__dict__.get('_json_sqls')
+        if cache is None:
+            cache = cls._json_sqls = dict()
 
-        resp['attributes'] = data
+        if (sql, key) in cache:
+            return cache[sql, key]
 
-        return resp
+        meta = cls._meta or ()
+        drop = ''.join(f" - '{x}'" for x in ('id',) + meta + cls._hidden)
+
+        obj = f"jsonb_build_object('type', '{cls._type}', 'id', j->'id', " \
+              f"'attributes', j{drop})"
+
+        if meta:
+            keys = ', '.join(f"'{x}'" for x in meta)
+            obj += f" || CASE WHEN j ?| ARRAY[{keys}] " \
+                   f"THEN jsonb_build_object('meta', (" \
+                   f"SELECT jsonb_object_agg(key, value) FROM jsonb_each(j) " \
+                   f"WHERE key IN ({keys}))) ELSE '{{}}' END"
+
+        cache[sql, key] = f"SELECT ({obj})::TEXT AS json" \
+                          f"{''.join(f', s.{x}' for x in key)} " \
+                          f"FROM ({sql}) AS s, LATERAL to_jsonb(s) AS j"
+
+        return cache[sql, key]
 
 
 class Commands:
@@ -50,25 +347,51 @@ class Commands:
         if __type == 0:
             action = 'fetch'
         elif __type == 1:
-            action = 'execute'
+            # У PreparedStatement нет execute, статус команды нигде не нужен
+            action = 'fetch'
         elif __type == 2:
             action = 'fetchval'
-        else:
+        elif __type == 3:
             action = 'fetchrow'
+        else:
+            action = 'cursor'
 
         definition = 'class _Commands:\n'
 
+        if __type == 0:
+            # Имя для метрик: модуль.Класс того, кто объявил Commands
+            frame = sys._getframe(1)
+            owner = frame.f_globals['__name__'].rsplit('.', 1)[-1]
+            if frame.f_code.co_name != '<module>':
+                owner += '.' + frame.f_code.co_name
+
         for (key, val) in sqls.items():
+            if __type == 0:
+                statements.register(f'{owner}.{key}', val)
+
+            # Курсор - не корутина, итерируется через async for
+            if __type == 4:
+                definition += f'    @staticmethod\n' \
+                              f'    def {key}(conn, *args):\n' \
+                              f'        return conn.{action}(\n' \
+                              f'            {repr(val)}, *args\n' \
+                              f'        )\n\n'
+                continue
+
+            # Выражение уже подготовлено на соединении (см. statements)
             definition += f'    @staticmethod\n' \
                           f'    async def {key}(conn, *args):\n' \
-                          f'        return await conn.{action}(\n' \
-                          f'            {repr(val)}, *args\n' \
+                          f'        return await statements.run(\n' \
+                          f'            conn, {repr(val)}, {repr(action)}, ' \
+                          f'args\n' \
                           f'        )\n\n'
 
         if __type == 0:
-            definition += f'    e = Commands(1, **{str(sqls)})\n'\
+            definition += f'    sql = {str(sqls)}\n' \
+                          f'    e = Commands(1, **{str(sqls)})\n'\
                           f'    v = Commands(2, **{str(sqls)})\n'\
-                          f'    r = Commands(3, **{str(sqls)})\n'
+                          f'    r = Commands(3, **{str(sqls)})\n'\
+                          f'    c = Commands(4, **{str(sqls)})\n'
 
         local = dict()
 
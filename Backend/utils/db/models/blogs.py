@@ -6,7 +6,7 @@ from typing import Union, Tuple
 import asyncpg
 
 from . import checks as C
-from .base import Obj, SelectResult, Commands
+from .base import Obj, Commands, Page, StreamResult
 from ...web.exceptions import (Forbidden, ObjectNotFound, UserIsBanned,
                                UserIsModer, UserIsOwner, BlogUrlAlreadyTaken)
 from .posts import Post
@@ -20,12 +20,13 @@ class BlogModer(Obj):
              'create_p', 'edit_p', 'edit_c')
 
     _c = Commands(
-        # args: blog_id
+        # args: blog_id, after_id, limit
         select="SELECT u.*, bm.target_id AS blog_id, bm.edit_b, bm.manage_b,"
                "bm.ban_b, bm.create_p, bm.edit_p, bm.edit_c "
                "FROM blog_moders AS bm "
                "INNER JOIN users AS u ON bm.user_id=u.id "
-               "WHERE bm.target_id=$1 ORDER BY u.id ASC",
+               "WHERE bm.target_id=$1 AND bm.user_id > $2 "
+               "ORDER BY bm.user_id ASC LIMIT $3",
 
         # args: blog_id, user_ids
         select_by_id="SELECT u.*, bm.target_id AS blog_id, bm.edit_b, "
@@ -56,8 +57,8 @@ class BlogModer(Obj):
 
     @classmethod
     async def select(cls, conn: asyncpg.connection.Connection, user_id: int,
-                     blog_id: int, *target_ids: Union[int, str]
-                     ) -> Tuple['BlogModer', ...]:
+                     blog_id: int, *target_ids: Union[int, str],
+                     page: Page=None) -> Tuple['BlogModer', ...]:
 
         # Ищем по ID
         if target_ids:
@@ -66,37 +67,33 @@ class BlogModer(Obj):
 
         # Возвращаем все
         else:
-            resp = await cls._c.select(conn, blog_id)
+            page = page or Page()
+            resp = await cls._c.select(conn, blog_id, *page.args(0))
 
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+        return cls._result(resp, conn, user_id, page)
 
     @classmethod
     async def insert(cls, conn: asyncpg.connection.Connection, user_id: int,
                      fandom_id: int, blog_id: int, fields: dict):
 
         # Проверка
-        if (
-            not await C.blog_owner(
-                conn, user_id, blog_id) and
-            not await C.blog_moder(
-                conn, user_id, blog_id, 'manage_b') and
-            not await C.admin(
-                conn, user_id)
-        ):
+        if not C.can(await C.perms(conn, user_id, blog_id), 'manage_b'):
             raise Forbidden
 
+        target = await C.perms(conn, fields['user_id'], blog_id, fandom_id)
+
         # Существует ли юзер
-        if not await C.user(conn, fields['user_id']):
+        if not target & C.USER:
             raise ObjectNotFound
 
         # А не овнер ли он?
-        if await C.blog_owner(conn, fields['user_id'], blog_id):
+        if target & C.OWNER:
             raise UserIsOwner('moder', 'blog')
 
         # А не забанен ли он?
-        if await C.blog_banned(conn, fields['user_id'], blog_id):
+        if target & C.BLOG_BANNED:
             raise UserIsBanned('moder', 'blog')
-        if await C.fandom_banned(conn, fields['user_id'], fandom_id):
+        if target & C.FANDOM_BANNED:
             raise UserIsBanned('moder', 'fandom')
 
         try:
@@ -110,14 +107,8 @@ class BlogModer(Obj):
     async def update(self, fields: dict):
 
         # Проверка
-        if (
-            not await C.blog_owner(
-                self._conn, self._uid, self.id) and
-            not await C.blog_moder(
-                self._conn, self._uid, self.meta['blog_id'], 'manage_b') and
-            not await C.admin(
-                self._conn, self._uid)
-        ):
+        if not C.can(await C.perms(
+                self._conn, self._uid, self.meta['blog_id']), 'manage_b'):
             raise Forbidden
 
         await self._c.e.update(
@@ -129,14 +120,8 @@ class BlogModer(Obj):
     async def delete(self):
 
         # Проверка
-        if (
-            not await C.blog_owner(
-                self._conn, self._uid, self.meta['blog_id']) and
-            not await C.blog_moder(
-                self._conn, self._uid, self.meta['blog_id'], 'manage_f') and
-            not await C.admin(
-                self._conn, self._uid)
-        ):
+        if not C.can(await C.perms(
+                self._conn, self._uid, self.meta['blog_id']), 'manage_b'):
             raise Forbidden
 
         await self._c.e.delete(self._conn, self.id, self.meta['fandom_id'])
@@ -146,11 +131,12 @@ class BlogBanned(Obj):
     _meta = ('blog_id', 'set_by', 'reason')
 
     _c = Commands(
-        # args: blog_id
+        # args: blog_id, after_id, limit
         select="SELECT u.*, bb.target_id as blog_id, bb.set_by, bb.reason "
                "FROM blog_bans as bb "
                "INNER JOIN users AS u ON bb.user_id=u.id "
-               "WHERE bb.target_id=$1 ORDER BY u.id ASC",
+               "WHERE bb.target_id=$1 AND bb.user_id > $2 "
+               "ORDER BY bb.user_id ASC LIMIT $3",
 
         # args: blog_id, user_ids
         select_by_id="SELECT u.*, bb.target_id as blog_id, bb.set_by, "
@@ -172,7 +158,8 @@ class BlogBanned(Obj):
 
     @classmethod
     async def select(cls, conn: asyncpg.connection.Connection, user_id: int,
-                     blog_id: int, *target_ids: Union[int, str]):
+                     blog_id: int, *target_ids: Union[int, str],
+                     page: Page=None) -> Tuple['BlogBanned', ...]:
 
         # Ищем по ID
         if target_ids:
@@ -181,33 +168,29 @@ class BlogBanned(Obj):
 
         # Возвращаем все
         else:
-            resp = await cls._c.select(conn, blog_id)
+            page = page or Page()
+            resp = await cls._c.select(conn, blog_id, *page.args(0))
 
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+        return cls._result(resp, conn, user_id, page)
 
     @classmethod
     async def insert(cls, conn: asyncpg.connection.Connection, user_id: int,
                      fandom_id: int, blog_id: int, fields: dict):
 
         # Проверка
-        if (
-            not await C.blog_owner(
-                conn, user_id, blog_id) and
-            not await C.blog_moder(
-                conn, user_id, blog_id, 'manage_b') and
-            not await C.admin(
-                conn, user_id)
-        ):
+        if not C.can(await C.perms(conn, user_id, blog_id), 'manage_b'):
             raise Forbidden
 
+        target = await C.perms(conn, fields['user_id'], blog_id, fandom_id)
+
         # Существует ли юзер
-        if not await C.user(conn, fields['user_id']):
+        if not target & C.USER:
             raise ObjectNotFound
 
         # А не модер ли он?
-        if await C.blog_moder(conn, fields['user_id'], blog_id):
+        if target & C.BLOG_MODER:
             raise UserIsModer('ban', 'blog')
-        if await C.fandom_moder(conn, fields['user_id'], fandom_id):
+        if target & C.FANDOM_MODER:
             raise UserIsModer('ban', 'fandom')
 
         try:
@@ -220,14 +203,8 @@ class BlogBanned(Obj):
     async def delete(self):
 
         # Проверка
-        if (
-            not await C.blog_owner(
-                self._conn, self._uid, self.meta['blog_id']) and
-            not await C.blog_moder(
-                self._conn, self._uid, self.meta['blog_id']) and
-            not await C.admin(
-                self._conn, self._uid)
-        ):
+        if not C.can(await C.perms(
+                self._conn, self._uid, self.meta['blog_id'])):
             raise Forbidden
 
         await self._c.e.delete(self._conn, self.id, self.meta['blog_id'])
@@ -235,7 +212,10 @@ class BlogBanned(Obj):
 
 class Blog(Obj):
     _c = Commands(
-        select="SELECT * FROM blogs ORDER BY id ASC",
+        stream="SELECT * FROM blogs ORDER BY id ASC",
+
+        # args: after_id, limit
+        select="SELECT * FROM blogs WHERE id > $1 ORDER BY id ASC LIMIT $2",
 
         # args: fandom_id, blog_urls
         select_by_u_in_fandom="SELECT * FROM blogs "
@@ -244,19 +224,23 @@ class Blog(Obj):
 
         # args: fandom_id, blog_ids
         select_by_id_in_fandom="SELECT * FROM blogs "
-                               "WHERE fandom_id = $1"
-                               "AND id = ANY($2::BIGINT[])  ORDER BY id ASC",
+                               "WHERE fandom_id = $1 "
+                               "AND id = ANY($2::BIGINT[]) ORDER BY id ASC",
 
         # args: blog_ids
         select_by_id="SELECT * FROM blogs "
                      "WHERE id = ANY($1::BIGINT[]) ORDER BY id ASC",
 
-        # args: fandom_id
-        select_by_fandom="SELECT * FROM blogs "
-                         "WHERE fandom_id = $1 ORDER BY id ASC",
+        # args: blog_id
+        version="SELECT id, edited_at FROM blogs WHERE id = $1",
 
-        # args: user_id
-        select_by_owner="SELECT * FROM blogs WHERE owner = $1 ORDER BY id ASC",
+        # args: fandom_id, after_id, limit
+        select_by_fandom="SELECT * FROM blogs WHERE fandom_id = $1 "
+                         "AND id > $2 ORDER BY id ASC LIMIT $3",
+
+        # args: user_id, after_id, limit
+        select_by_owner="SELECT * FROM blogs WHERE owner = $1 "
+                        "AND id > $2 ORDER BY id ASC LIMIT $3",
 
         # args: user_id, fandom_id, url, title, description, avatar
         insert="SELECT blogs_create($1, $2, $3, $4, $5, $6)",
@@ -265,11 +249,14 @@ class Blog(Obj):
         update="UPDATE blogs SET edited_by=$1, "
                "title=$3, description=$4, avatar=$5 WHERE id=$2",
 
-        # args: blog_id
-        history="SELECT * FROM blogs_history($1) ORDER BY edited_at DESC",
+        # args: blog_id, before_edited_at, limit
+        history="SELECT * FROM blogs_history($1) WHERE edited_at < $2 "
+                "ORDER BY edited_at DESC LIMIT $3",
     )
 
     _type = 'blogs'
+    _includes = {'owner': ('users', 'owner'),
+                 'fandom': ('fandoms', 'fandom_id')}
 
     @classmethod
     async def id_u(cls, request) -> 'Blog':
@@ -285,7 +272,7 @@ class Blog(Obj):
     @classmethod
     async def select(cls, conn: asyncpg.connection.Connection, user_id: int,
                      fandom_id: int, *target_ids: Union[int, str],
-                     u: bool=False) -> Tuple['Blog', ...]:
+                     u: bool=False, page: Page=None) -> Tuple['Blog', ...]:
 
         # Ищем по url в фандоме
         if u and target_ids and fandom_id:
@@ -303,31 +290,37 @@ class Blog(Obj):
 
         # Ищем по фандому
         elif fandom_id:
-            resp = await cls._c.select_by_fandom(conn, fandom_id)
+            page = page or Page()
+            resp = await cls._c.select_by_fandom(
+                conn, fandom_id, *page.args(0))
 
         # Возвращаем все
         else:
-            resp = await cls._c.select(conn)
+            page = page or Page()
+            resp = await cls._c.select(conn, *page.args(0))
 
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+        return cls._result(resp, conn, user_id, page)
+
+    @classmethod
+    def stream(cls, user_id: int) -> StreamResult:
+        return StreamResult(cls, cls._c.c.stream, user_id=user_id)
 
     @classmethod
     async def select_by_owner(cls, conn: asyncpg.connection.Connection,
-                              user_id: int, target_id: int
+                              user_id: int, target_id: int, page: Page=None
                               ) -> Tuple['Blog', ...]:
 
-        resp = await cls._c.select_by_owner(conn, target_id)
+        page = page or Page()
+        resp = await cls._c.select_by_owner(conn, target_id, *page.args(0))
 
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+        return cls._result(resp, conn, user_id, page)
 
     @classmethod
     async def insert(cls, conn: asyncpg.connection.Connection, user_id: int,
                      fandom_id: int, fields: dict) -> int:
 
         # TODO: Больше проверок
-        if (
-            await C.fandom_banned(conn, user_id, fandom_id)
-        ):
+        if await C.perms(conn, user_id, 0, fandom_id) & C.FANDOM_BANNED:
             raise Forbidden
 
         try:
@@ -340,38 +333,28 @@ class Blog(Obj):
     async def update(self, fields: dict):
 
         # Проверка
-        if (
-            self.attrs['owner'] != self._uid and
-            not await C.blog_moder(
-                self._conn, self._uid, self.id, 'edit_b') and
-            not await C.fandom_moder(
-                self._conn, self._uid, self.attrs['fandom_id'], 'edit_b') and
-            not await C.admin(
-                self._conn, self._uid)
-        ):
-            return Forbidden
+        if not C.can(await C.perms(
+                self._conn, self._uid, self.id, self.attrs['fandom_id']),
+                'edit_b'):
+            raise Forbidden
 
         await self._c.e.update(
             self._conn, self._uid, self.id,
             fields['title'], fields['description'], fields['avatar'])
 
-    async def history(self) -> Tuple['Blog', ...]:
+    async def history(self, page: Page=None) -> Tuple['Blog', ...]:
 
         # Проверка
-        if (
-            self.attrs['owner'] != self._uid and
-            not await C.blog_moder(
-                self._conn, self._uid, self.id, 'edit_b') and
-            not await C.fandom_moder(
-                self._conn, self._uid, self.attrs['fandom_id'], 'edit_b') and
-            not await C.admin(
-                self._conn, self._uid)
-        ):
+        if not C.can(await C.perms(
+                self._conn, self._uid, self.id, self.attrs['fandom_id']),
+                'edit_b'):
             raise Forbidden
 
-        resp = await self._c.history(self._conn, self.id)
+        page = page or Page()
+        resp = await self._c.history(
+            self._conn, self.id, *page.args(Page.LATEST))
 
-        return SelectResult(self.__class__(x) for x in resp)
+        return self._result(resp, page=page, key=('edited_at',))
 
     # Moders
 
@@ -383,11 +366,11 @@ class Blog(Obj):
         except (IndexError, ValueError):
             raise ObjectNotFound
 
-    async def moders_select(self, *target_ids: Union[int, str]
-                            ) -> Tuple[BlogModer, ...]:
+    async def moders_select(self, *target_ids: Union[int, str],
+                            page: Page=None) -> Tuple[BlogModer, ...]:
 
         return await BlogModer.select(
-            self._conn, self._uid, self.id, *target_ids)
+            self._conn, self._uid, self.id, *target_ids, page=page)
 
     async def moders_insert(self, fields: dict) -> Tuple[int, int]:
 
@@ -406,11 +389,11 @@ class Blog(Obj):
         except (IndexError, ValueError):
             raise ObjectNotFound
 
-    async def bans_select(self, *target_ids: Union[int, str]
-                          ) -> Tuple[BlogBanned, ...]:
+    async def bans_select(self, *target_ids: Union[int, str],
+                          page: Page=None) -> Tuple[BlogBanned, ...]:
 
         return await BlogBanned.select(
-            self._conn, self._uid, self.id, *target_ids)
+            self._conn, self._uid, self.id, *target_ids, page=page)
 
     async def bans_insert(self, fields: dict) -> Tuple[int, int]:
 
@@ -421,11 +404,11 @@ class Blog(Obj):
 
     # Posts
 
-    async def posts_select(self, *target_ids: Union[int, str]
-                           ) -> Tuple[Post, ...]:
+    async def posts_select(self, *target_ids: Union[int, str],
+                           page: Page=None) -> Tuple[Post, ...]:
 
         return await Post.select(
-            self._conn, self._uid, self.id, 0, *target_ids)
+            self._conn, self._uid, self.id, 0, *target_ids, page=page)
 
     async def posts_insert(self, fields: dict) -> int:
 
@@ -434,8 +417,8 @@ class Blog(Obj):
 
     # Comments
 
-    async def comments_select(self, *target_ids: Union[int, str]
-                              ) -> Tuple[Comment, ...]:
+    async def comments_select(self, *target_ids: Union[int, str],
+                              page: Page=None) -> Tuple[Comment, ...]:
 
         return await Comment.select(
-            self._conn, self._uid, 0, self.id, 0, *target_ids)
+            self._conn, self._uid, 0, self.id, 0, *target_ids, page=page)
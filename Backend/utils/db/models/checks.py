@@ -3,69 +3,109 @@
 
 import asyncpg
 
-__all__ = ('user', 'admin',
-           'fandom_moder', 'fandom_banned',
-           'blog_moder', 'blog_banned', 'blog_owner')
-
-_sqls = dict(
-    user="SELECT EXISTS (SELECT 1 FROM users WHERE id=$1)",
-
-    user_admin="SELECT EXISTS (SELECT 1 FROM admins WHERE user_id=$1)",
-
-    fandom_moder="SELECT EXISTS (SELECT 1 FROM fandom_moders "
-                 "WHERE user_id=$1 AND target_id=$2 %s)",
-
-    fandom_banned="SELECT EXISTS (SELECT 1 FROM fandom_bans "
-                  "WHERE user_id=$1 AND target_id=$2)",
-
-    blog_moder="SELECT EXISTS (SELECT 1 FROM blog_moders "
-               "WHERE user_id=$1 AND target_id=$2 %s)",
-
-    blog_banned="SELECT EXISTS (SELECT 1 FROM blog_bans "
-                "WHERE user_id=$1 AND target_id=$2)",
-
-    blog_owner="SELECT EXISTS (SELECT 1 FROM blogs "
-               "WHERE owner=$1 AND id=$2)"
+from .. import cache
+from .base import Commands
+from ...web.exceptions import Forbidden, ObjectNotFound
+
+__all__ = ('USER', 'OWNER', 'ADMIN', 'BLOG_MODER', 'FANDOM_MODER',
+           'BLOG_BANNED', 'FANDOM_BANNED', 'BLOG', 'FANDOM',
+           'perms', 'can', 'guarded')
+
+# Биты маски, которую возвращает perms()
+USER = 1 << 0
+OWNER = 1 << 1
+ADMIN = 1 << 2
+BLOG_MODER = 1 << 3
+FANDOM_MODER = 1 << 4
+BLOG_BANNED = 1 << 5
+FANDOM_BANNED = 1 << 6
+
+# Права модераторов: колонка *_moders -> бит
+BLOG = {x: 1 << (8 + i) for (i, x) in enumerate((
+    'edit_b', 'manage_b', 'ban_b', 'create_p', 'edit_p', 'edit_c'))}
+
+FANDOM = {x: 1 << (16 + i) for (i, x) in enumerate((
+    'edit_f', 'manage_f', 'ban_f', 'create_b', 'edit_b', 'edit_p', 'edit_c'))}
+
+# SQLSTATE проверок внутри SQL (миграция 9e1b4c7d2f60)
+_SQLSTATES = {'AF403': Forbidden, 'AF404': ObjectNotFound}
+
+
+def _bit(cond: str, bit: int) -> str:
+    return f"(CASE WHEN {cond} THEN {bit} ELSE 0 END)"
+
+
+def _moder(table: str, target: str, bit: int, flags: dict) -> str:
+    # В Postgres | и << одного приоритета, поэтому все в скобках
+    bits = ' | '.join(f"(m.{x}::INT << {y.bit_length() - 1})"
+                      for (x, y) in flags.items())
+
+    return f"COALESCE((SELECT {bit} | {bits} FROM {table} AS m " \
+           f"WHERE m.user_id=$1 AND m.target_id={target}), 0)"
+
+
+_c = Commands(
+    # args: user_id, blog_id, fandom_id
+    perms="SELECT " + ' | '.join((
+        _bit("EXISTS (SELECT 1 FROM users WHERE id=$1)", USER),
+        _bit("EXISTS (SELECT 1 FROM blogs WHERE owner=$1 AND id=$2)", OWNER),
+        _bit("EXISTS (SELECT 1 FROM admins WHERE user_id=$1)", ADMIN),
+        _moder('blog_moders', '$2', BLOG_MODER, BLOG),
+        _moder('fandom_moders', '$3', FANDOM_MODER, FANDOM),
+        _bit("EXISTS (SELECT 1 FROM blog_bans "
+             "WHERE user_id=$1 AND target_id=$2)", BLOG_BANNED),
+        _bit("EXISTS (SELECT 1 FROM fandom_bans "
+             "WHERE user_id=$1 AND target_id=$3)", FANDOM_BANNED),
+    )) + " AS perms",
 )
 
 
-async def user(conn: asyncpg.connection.Connection, user_id: int) -> bool:
-    return await conn.fetchval(_sqls['user'], user_id)
-
-
-async def admin(conn: asyncpg.connection.Connection, user_id: int) -> bool:
-    return await conn.fetchval(_sqls['user_admin'], user_id)
-
-
-async def fandom_moder(conn: asyncpg.connection.Connection, user_id: int,
-                       fandom_id: int, perm: str=None) -> bool:
-
-    return await conn.fetchval(
-        _sqls['fandom_moder'] % ('AND %s=TRUE' % perm) if perm else '',
-        user_id, fandom_id)
+async def perms(conn: asyncpg.connection.Connection, user_id: int,
+                blog_id: int=0, fandom_id: int=0) -> int:
+    """Все права юзера в блоге и фандоме одним запросом, маской битов
 
+    Маски кэшируются в воркере (cache.perms) до NOTIFY perms или TTL.
+    """
+    if not user_id:
+        return 0
 
-async def fandom_banned(conn: asyncpg.connection.Connection, user_id: int,
-                        fandom_id: int) -> bool:
+    key = (blog_id or 0, fandom_id or 0)
+    mask = cache.perms.get(user_id, key)
 
-    return await conn.fetchval(_sqls['fandom_banned'], user_id, fandom_id)
+    if mask is None:
+        epoch = cache.perms.epoch
+        mask = await _c.v.perms(conn, user_id, *key)
 
+        # Реплика может отставать от NOTIFY с мастера
+        if not conn.replica:
+            cache.perms.put(user_id, key, mask, epoch)
 
-async def blog_moder(conn: asyncpg.connection.Connection, user_id: int,
-                     blog_id: int, perm: str=None) -> bool:
+    return mask
 
-    return await conn.fetchval(
-        _sqls['blog_moder'] % ('AND %s=TRUE' % perm) if perm else '',
-        user_id, blog_id)
 
+def can(mask: int, perm: str=None) -> bool:
+    """Владелец блога, админ или модератор с правом perm
 
-async def blog_banned(conn: asyncpg.connection.Connection, user_id: int,
-                      blog_id: int) -> bool:
+    Без perm подходит любой модератор. Модераторы фандома попадают в маску,
+    только если perms() получил fandom_id.
+    """
+    if perm is None:
+        need = OWNER | ADMIN | BLOG_MODER | FANDOM_MODER
+    else:
+        need = OWNER | ADMIN | BLOG.get(perm, 0) | FANDOM.get(perm, 0)
 
-    return await conn.fetchval(_sqls['blog_banned'], user_id, blog_id)
+    return bool(mask & need)
 
 
-async def blog_owner(conn: asyncpg.connection.Connection, user_id: int,
-                     blog_id: int) -> bool:
+async def guarded(coro):
+    """Выполняет запрос с content_guard() и *_create_guarded()
 
-    return await conn.fetchval(_sqls['blog_owner'], user_id, blog_id)
+    Их ошибки с собственным SQLSTATE превращаются в исключения API.
+    """
+    try:
+        return await coro
+    except asyncpg.PostgresError as exc:
+        error = _SQLSTATES.get(exc.sqlstate)
+        if error is None:
+            raise
+        raise error
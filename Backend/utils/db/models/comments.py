@@ -6,53 +6,77 @@ from typing import Union, Tuple
 import asyncpg
 
 from . import checks as C
-from .base import Obj, SelectResult, Commands
+from .. import metrics, statements, votes
+from .base import Obj, Commands, Page, SelectResult, StreamResult
 from ...web.exceptions import Forbidden, ObjectNotFound
 
-__all__ = ('Comment', 'CommentVote')
+__all__ = ('Comment', 'CommentNode', 'CommentVote')
 
 
 class Comment(Obj):
     _c = Commands(
-        select="SELECT * FROM comments ORDER BY id ASC",
+        stream="SELECT * FROM comments_counted ORDER BY id ASC",
+
+        # args: after_id, limit
+        select="SELECT * FROM comments_counted WHERE id > $1 "
+               "ORDER BY id ASC LIMIT $2",
 
         # args: comment_ids
-        select_by_id="SELECT * FROM comments WHERE id = ANY($1::BIGINT[]) "
-                     "ORDER BY id ASC",
+        select_by_id="SELECT * FROM comments_counted "
+                     "WHERE id = ANY($1::BIGINT[]) ORDER BY id ASC",
+
+        # args: comment_id
+        version="SELECT id, edited_at, votes_up, votes_down "
+                "FROM comments_counted WHERE id = $1",
+
+        # args: post_id, after_id, limit
+        select_by_post="SELECT * FROM comments_counted WHERE post_id = $1 "
+                       "AND id > $2 ORDER BY id ASC LIMIT $3",
 
-        # args: post_id
-        select_by_post="SELECT * FROM comments WHERE post_id = $1 "
-                       "ORDER BY id ASC",
+        # args: blog_id, after_id, limit
+        select_by_blog="SELECT * FROM comments_counted WHERE blog_id = $1 "
+                       "AND id > $2 ORDER BY id ASC LIMIT $3",
 
-        # args: blog_id
-        select_by_blog="SELECT * FROM comments WHERE blog_id = $1 "
-                       "ORDER BY id ASC",
+        # args: fandom_id, after_id, limit
+        select_by_fandom="SELECT * FROM comments_counted WHERE fandom_id = $1 "
+                         "AND id > $2 ORDER BY id ASC LIMIT $3",
 
-        # args: fandom_id
-        select_by_fandom="SELECT * FROM comments WHERE fandom_id = $1 "
-                         "ORDER BY id ASC",
+        # args: user_id, after_id, limit
+        select_by_owner="SELECT * FROM comments_counted WHERE owner = $1 "
+                        "AND id > $2 ORDER BY id ASC LIMIT $3",
 
-        # args: user_id
-        select_by_owner="SELECT * FROM comments WHERE owner = $1 "
-                        "ORDER BY id ASC",
+        # args: post_id, depth, after_path, limit
+        thread="SELECT * FROM comments_counted WHERE post_id = $1 "
+               "AND cardinality(path) <= $2 AND path > $3::BIGINT[] "
+               "ORDER BY path ASC LIMIT $4",
 
         # args: user_id, post_id, blog_id, fandom_id, parent_id, content
-        insert="SELECT comments_create ($1, $2, $3, $4, $5, $6)",
+        insert="SELECT comments_create_guarded ($1, $2, $3, $4, $5, $6)",
 
         # args: user_id, post_id, content
         update="UPDATE comments SET edited_by=$1, content=$3 WHERE id = $2",
 
-        # args: parent_id
-        answers="SELECT * FROM comments WHERE parent_id = $1 ORDER BY id ASC",
+        # args: parent_id, after_id, limit
+        answers="SELECT * FROM comments_counted WHERE parent_id = $1 "
+                "AND id > $2 ORDER BY id ASC LIMIT $3",
 
-        # args: post_id
+        # args: comment_id, before_edited_at, limit
         history="SELECT id, created_at, edited_at, edited_by, post_id, "
                 "blog_id, fandom_id, owner, content "
-                "FROM comments_history ($1) ORDER BY edited_at DESC"
+                "FROM comments_history ($1) WHERE edited_at < $2 "
+                "ORDER BY edited_at DESC LIMIT $3"
     )
 
     _type = 'comments'
     _meta = ('votes_up', 'votes_down')
+    _hidden = ('path',)
+    _fields = ('created_at', 'edited_at', 'edited_by', 'post_id', 'blog_id',
+               'fandom_id', 'owner', 'parent_id', 'content', 'votes_up',
+               'votes_down')
+    _includes = {'owner': ('users', 'owner'), 'post': ('posts', 'post_id'),
+                 'blog': ('blogs', 'blog_id'),
+                 'fandom': ('fandoms', 'fandom_id'),
+                 'parent': ('comments', 'parent_id')}
 
     @classmethod
     async def id_u(cls, request) -> 'Comment':
@@ -68,38 +92,80 @@ class Comment(Obj):
     @classmethod
     async def select(cls, conn: asyncpg.connection.Connection, user_id: int,
                      post_id: int, blog_id: int, fandom_id: int,
-                     *target_ids: Union[int, str]) -> Tuple['Comment', ...]:
+                     *target_ids: Union[int, str],
+                     page: Page=None) -> Tuple['Comment', ...]:
 
         # Ищем по ID
         if target_ids:
             resp = await cls._c.select_by_id(conn, tuple(map(int, target_ids)))
+            return cls._result(resp, conn, user_id)
 
         # Ищем по посту
         elif post_id:
-            resp = await cls._c.select_by_post(conn, post_id)
+            return await cls._fetch_page(
+                cls._c.select_by_post, conn, user_id, page or Page(), post_id)
 
         # Ищем по блогу
-        elif post_id:
-            resp = await cls._c.select_by_blog(conn, blog_id)
+        elif blog_id:
+            return await cls._fetch_page(
+                cls._c.select_by_blog, conn, user_id, page or Page(), blog_id)
 
         # Ищем по фандому
-        elif post_id:
-            resp = await cls._c.select_by_fandom(conn, fandom_id)
+        elif fandom_id:
+            return await cls._fetch_page(
+                cls._c.select_by_fandom, conn, user_id, page or Page(),
+                fandom_id)
 
         # Возвращаем все
         else:
-            resp = await cls._c.select(conn)
+            return await cls._fetch_page(
+                cls._c.select, conn, user_id, page or Page())
+
+    @classmethod
+    def stream(cls, user_id: int) -> StreamResult:
+        return StreamResult(cls, cls._c.c.stream, user_id=user_id)
 
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+    @classmethod
+    async def thread(cls, conn: asyncpg.connection.Connection, user_id: int,
+                     post_id: int, depth: int, page: Page=None
+                     ) -> Tuple['CommentNode', ...]:
+        """Ветка поста деревом за один проход по индексу (post_id, path)
+
+        Строки приходят в порядке обхода в глубину, так что родитель всегда
+        раньше ответов. Курсор - path последней строки; ответ, чей родитель
+        остался на прошлой странице, становится корнем этой.
+        """
+        page = page or Page()
+        sql = cls._sparse_sql('thread', page, ('parent_id', 'path'))
+
+        name = statements.name(cls._c.sql['thread'])
+        args = (int(post_id), depth, list(page.after or ()), page.limit + 1)
+        rows = await metrics.timed(name, args, conn.fetch(
+            sql, *args, timeout=conn.timeout()))
+
+        nodes = dict()
+        roots = list()
+        for row in rows[:page.limit]:
+            node = CommentNode(row, conn, user_id)
+            parent = nodes.get(row['parent_id'])
+            (roots if parent is None else parent.children).append(node)
+            nodes[node.id] = node
+
+        result = SelectResult(roots)
+        # Узел без ответов - та же версия, что у плоского Comment
+        result.variant = ('tree', depth)
+        if len(rows) > page.limit:
+            result.cursor = Page.encode(tuple(rows[page.limit - 1]['path']))
+
+        return result
 
     @classmethod
     async def select_by_owner(cls, conn: asyncpg.connection.Connection,
-                              user_id: int, target_id: int
+                              user_id: int, target_id: int, page: Page=None
                               ) -> Tuple['Comment', ...]:
 
-        resp = await cls._c.select_by_owner(conn, target_id)
-
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+        return await cls._fetch_page(
+            cls._c.select_by_owner, conn, user_id, page or Page(), target_id)
 
     @classmethod
     async def insert(cls, conn: asyncpg.connection.Connection, user_id: int,
@@ -107,95 +173,134 @@ class Comment(Obj):
                      parent_id: int, fields: dict
                      ) -> int:
 
-        # Проверка
-        if (
-            not user_id or
-            await C.blog_banned(conn, user_id, blog_id) or
-            await C.fandom_banned(conn, user_id, fandom_id)
-        ):
+        # Проверка: баны и принадлежность поста и ответа - внутри
+        # comments_create_guarded
+        if not user_id:
             raise Forbidden
 
-        return await cls._c.v.insert(
+        return await C.guarded(cls._c.v.insert(
             conn, user_id, post_id, blog_id, fandom_id, parent_id,
-            fields['content'])
+            fields['content']))
 
     async def update(self, fields: dict):
 
         # Проверка
         if (
             self.attrs['owner'] != self._uid and
-            not await C.blog_owner(
-                self._conn, self._uid, self.attrs['blog_id']) and
-            not await C.blog_moder(
-                self._conn, self._uid, self.attrs['blog_id'], 'edit_c') and
-            not await C.fandom_moder(
-                self._conn, self._uid, self.attrs['fandom_id'], 'edit_c') and
-            not await C.admin(
-                self._conn, self._uid)
+            not C.can(await C.perms(
+                self._conn, self._uid, self.attrs['blog_id'],
+                self.attrs['fandom_id']), 'edit_c')
         ):
             raise Forbidden
 
         await self._c.e.update(
             self._conn, self._uid, self.id, fields['content'])
 
-    async def answers(self) -> Tuple['Comment', ...]:
-
-        resp = await self._c.answers(self._conn, self.id)
+    async def answers(self, page: Page=None) -> Tuple['Comment', ...]:
 
-        return SelectResult(self.__class__(x) for x in resp)
+        return await self._fetch_page(
+            self._c.answers, self._conn, None, page or Page(), self.id)
 
     async def insert_answer(self, fields: dict) -> int:
         return await self.insert(
             self._conn, self._uid, self.attrs['post_id'],
             self.attrs['blog_id'], self.attrs['fandom_id'], self.id, fields)
 
-    async def history(self) -> Tuple['Comment', ...]:
+    async def history(self, page: Page=None) -> Tuple['Comment', ...]:
 
         # Проверка
         if (
             self.attrs['owner'] != self._uid and
-            not await C.blog_owner(
-                self._conn, self._uid, self.attrs['blog_id']) and
-            not await C.blog_moder(
-                self._conn, self._uid, self.attrs['blog_id'], 'edit_c') and
-            not await C.fandom_moder(
-                self._conn, self._uid, self.attrs['fandom_id'], 'edit_c') and
-            not await C.admin(
-                self._conn, self._uid)
+            not C.can(await C.perms(
+                self._conn, self._uid, self.attrs['blog_id'],
+                self.attrs['fandom_id']), 'edit_c')
         ):
             raise Forbidden
 
-        resp = await self._c.history(self._conn, self.id)
+        page = page or Page()
+        resp = await self._c.history(
+            self._conn, self.id, *page.args(Page.LATEST))
 
-        return SelectResult(self.__class__(x) for x in resp)
+        return self._result(resp, page=page, key=('edited_at',))
 
     # Votes
 
-    async def votes_select(self) -> Tuple['CommentVote', ...]:
-        return await CommentVote.select(self._conn, self._uid, self.id)
+    async def votes_select(self, page: Page=None
+                           ) -> Tuple['CommentVote', ...]:
+        return await CommentVote.select(
+            self._conn, self._uid, self.id, page=page)
 
     async def votes_insert(self, fields: dict):
         await CommentVote.insert(
             self._conn, self._uid, self.id,
-            self.arrts['blog_id'], self.attrs['fandom_id'], fields)
+            self.attrs['blog_id'], self.attrs['fandom_id'], fields)
+
+
+class CommentNode(Comment):
+    """Комментарий с ответами (Comment.thread)"""
+
+    __slots__ = ('children',)
+
+    def __init__(self, record, conn=None, user_id=None):
+        super().__init__(record, conn, user_id)
+        self.children = list()
+
+    @property
+    def _data(self) -> dict:
+        data = super()._data
+        data['children'] = [x._data for x in self.children]
+
+        return data
+
+    @property
+    def version(self) -> tuple:
+        # ETag меняется и при правке любого ответа
+        return super().version + \
+            tuple(x for child in self.children for x in child.version)
 
 
 class CommentVote(Obj):
     _c = Commands(
-        # args: comment_id
+        # args: comment_id, after_id, limit
         select="SELECT u.*, cv.target_id AS comment_id, cv.vote "
-               "FROM comment_votes AS cv "
+               "FROM comments_votes AS cv "
                "INNER JOIN users AS u ON cv.user_id = u.id "
-               "WHERE target_id = $1 ORDER BY cv.user_id ASC",
+               "WHERE target_id = $1 AND cv.user_id > $2 "
+               "ORDER BY cv.user_id ASC LIMIT $3",
 
         # args: user_id, comment_id
         select_by_id="SELECT u.*, cv.target_id AS comment_id, cv.vote "
-                     "FROM comment_votes AS cv "
+                     "FROM comments_votes AS cv "
                      "INNER JOIN users AS u ON cv.user_id = u.id "
                      "WHERE user_id = $1 AND target_id = $2",
 
-        # args: user_id, target_id, vote
-        insert="SELECT comments_vote ($1, $2, $3)"
+        # args: user_id, comment_id, vote, blog_id, fandom_id
+        # Только строка голоса, сдвиг счетчиков - в votes.comments
+        vote="INSERT INTO comments_votes AS cv (target_id, user_id, vote) "
+             "SELECT $2::BIGINT, $1::BIGINT, $3::BOOLEAN "
+             "WHERE content_guard($1, $4, $5) "
+             "ON CONFLICT (target_id, user_id) DO UPDATE "
+             "SET vote = EXCLUDED.vote WHERE cv.vote != EXCLUDED.vote "
+             "RETURNING cv.xmax = 0 AS created",
+
+        # args: user_id, comment_id, vote, blog_id, fandom_id
+        # Как функция comments_vote (миграция 7a3c5e9b1d48), но с проверкой
+        # банов и готовым выражением: SQL-функция планирует тело на каждый
+        # вызов
+        insert="WITH v AS ("
+               "INSERT INTO comments_votes AS cv (target_id, user_id, vote) "
+               "SELECT $2::BIGINT, $1::BIGINT, $3::BOOLEAN "
+               "WHERE content_guard($1, $4, $5) "
+               "ON CONFLICT (target_id, user_id) DO UPDATE "
+               "SET vote = EXCLUDED.vote WHERE cv.vote != EXCLUDED.vote "
+               "RETURNING cv.xmax = 0 AS created) "
+               "INSERT INTO comments_vote_slots AS s "
+               "(target_id, slot, up, down) "
+               "SELECT $2, $1 % 16, "
+               "CASE WHEN $3 THEN 1 WHEN v.created THEN 0 ELSE -1 END, "
+               "CASE WHEN NOT $3 THEN 1 WHEN v.created THEN 0 ELSE -1 END "
+               "FROM v ON CONFLICT (target_id, slot) DO UPDATE "
+               "SET up = s.up + EXCLUDED.up, down = s.down + EXCLUDED.down"
     )
 
     _type = 'users'
@@ -203,27 +308,35 @@ class CommentVote(Obj):
 
     @classmethod
     async def select(cls, conn: asyncpg.connection.Connection, user_id: int,
-                     comment_id: int) -> Tuple['CommentVote', ...]:
+                     comment_id: int,
+                     page: Page=None) -> Tuple['CommentVote', ...]:
 
         # Только админам можно смотреть кто голосовал
-        if await C.admin(conn, user_id):
-            resp = await cls._c.select(conn, int(comment_id))
+        if await C.perms(conn, user_id) & C.ADMIN:
+            page = page or Page()
+            resp = await cls._c.select(conn, int(comment_id), *page.args(0))
         else:
+            page = None
             resp = await cls._c.select_by_id(conn, user_id, int(comment_id))
 
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+        return cls._result(resp, conn, user_id, page)
 
     @classmethod
     async def insert(cls, conn: asyncpg.connection.Connection, user_id: int,
                      comment_id: int, blog_id: int, fandom_id: int,
                      fields: dict):
 
-        # Проверка
-        if (
-            not user_id or
-            await C.blog_banned(conn, user_id, blog_id) or
-            await C.fandom_banned(conn, user_id, fandom_id)
-        ):
+        # Проверка: баны - внутри запроса (content_guard)
+        if not user_id:
             raise Forbidden
 
-        await cls._c.insert(conn, user_id, comment_id, fields['vote'])
+        args = (user_id, comment_id, fields['vote'], blog_id, fandom_id)
+
+        if not votes.comments.active:
+            await C.guarded(cls._c.e.insert(conn, *args))
+            return
+
+        # None - голос не изменился
+        created = await C.guarded(cls._c.v.vote(conn, *args))
+        if created is not None:
+            votes.comments.vote(int(comment_id), fields['vote'], created)
@@ -6,7 +6,7 @@ from typing import Union, Tuple
 import asyncpg
 
 from . import checks as C
-from .base import Obj, SelectResult, Commands
+from .base import Obj, Commands, Page
 from ...web.exceptions import (Forbidden, ObjectNotFound, UserIsBanned,
                                UserIsModer, FandomUrlAlreadyTaken)
 from .blogs import Blog
@@ -21,12 +21,13 @@ class FandomModer(Obj):
              'create_b', 'edit_b', 'edit_p', 'edit_c')
 
     _c = Commands(
-        # args: fandom_id
+        # args: fandom_id, after_id, limit
         select="SELECT u.*, fm.target_id AS fandom_id, fm.edit_f, fm.manage_f,"
                "fm.ban_f, fm.create_b, fm.edit_b, fm.edit_p, fm.edit_c "
                "FROM fandom_moders AS fm "
                "INNER JOIN users AS u ON fm.user_id=u.id "
-               "WHERE fm.target_id=$1 ORDER BY u.id ASC",
+               "WHERE fm.target_id=$1 AND fm.user_id > $2 "
+               "ORDER BY fm.user_id ASC LIMIT $3",
 
         # args: fandom_id, user_ids
         select_by_id="SELECT u.*, fm.target_id AS fandom_id, fm.edit_f, "
@@ -57,8 +58,8 @@ class FandomModer(Obj):
 
     @classmethod
     async def select(cls, conn: asyncpg.connection.Connection, user_id: int,
-                     fandom_id: int, *target_ids: Union[int, str]
-                     ) -> Tuple['FandomModer', ...]:
+                     fandom_id: int, *target_ids: Union[int, str],
+                     page: Page=None) -> Tuple['FandomModer', ...]:
 
         # Ищем по ID
         if target_ids:
@@ -67,29 +68,27 @@ class FandomModer(Obj):
 
         # Возвращаем все
         else:
-            resp = await cls._c.select(conn, fandom_id)
+            page = page or Page()
+            resp = await cls._c.select(conn, fandom_id, *page.args(0))
 
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+        return cls._result(resp, conn, user_id, page)
 
     @classmethod
     async def insert(cls, conn: asyncpg.connection.Connection, user_id: int,
                      fandom_id: int, fields: dict):
 
         # Проверка
-        if (
-            not await C.fandom_moder(
-                conn, user_id, fandom_id, 'manage_f') and
-            not await C.admin(
-                conn, user_id)
-        ):
+        if not C.can(await C.perms(conn, user_id, 0, fandom_id), 'manage_f'):
             raise Forbidden
 
+        target = await C.perms(conn, fields['user_id'], 0, fandom_id)
+
         # Существует ли юзер
-        if not await C.user(conn, fields['user_id']):
+        if not target & C.USER:
             raise ObjectNotFound
 
         # А не забанен ли он?
-        if await C.fandom_banned(conn, fields['user_id'], fandom_id):
+        if target & C.FANDOM_BANNED:
             raise UserIsBanned('moder', 'fandom')
 
         try:
@@ -104,12 +103,8 @@ class FandomModer(Obj):
     async def update(self, fields: dict):
 
         # Проверка
-        if (
-            not await C.fandom_moder(
-                self._conn, self._uid, self.meta['fandom_id'], 'manage_f') and
-            not await C.admin(
-                self._conn, self._uid)
-        ):
+        if not C.can(await C.perms(
+                self._conn, self._uid, 0, self.meta['fandom_id']), 'manage_f'):
             raise Forbidden
 
         await self._c.e.update(
@@ -121,12 +116,8 @@ class FandomModer(Obj):
     async def delete(self):
 
         # Проверка
-        if (
-            not await C.fandom_moder(
-                self._conn, self._uid, self.meta['fandom_id'], 'manage_f') and
-            not await C.admin(
-                self._conn, self._uid)
-        ):
+        if not C.can(await C.perms(
+                self._conn, self._uid, 0, self.meta['fandom_id']), 'manage_f'):
             raise Forbidden
 
         await self._c.e.delete(self._conn, self.id, self.meta['fandom_id'])
@@ -136,11 +127,12 @@ class FandomBanned(Obj):
     _meta = ('fandom_id', 'set_by', 'reason')
 
     _c = Commands(
-        # args: fandom_id
+        # args: fandom_id, after_id, limit
         select="SELECT u.*, fb.target_id as fandom_id, fb.set_by, fb.reason "
                "FROM fandom_bans AS fb "
                "INNER JOIN users AS u ON fb.user_id=u.id "
-               "WHERE fb.target_id=$1 ORDER BY u.id ASC",
+               "WHERE fb.target_id=$1 AND fb.user_id > $2 "
+               "ORDER BY fb.user_id ASC LIMIT $3",
 
         # args: fandom_id, user_ids
         select_by_id="SELECT u.*, fb.target_id as fandom_id, fb.set_by,"
@@ -162,8 +154,8 @@ class FandomBanned(Obj):
 
     @classmethod
     async def select(cls, conn: asyncpg.connection.Connection, user_id: int,
-                     fandom_id: int, *target_ids: Union[int, str]
-                     ) -> Tuple['FandomBanned', ...]:
+                     fandom_id: int, *target_ids: Union[int, str],
+                     page: Page=None) -> Tuple['FandomBanned', ...]:
 
         # Ищем по ID
         if target_ids:
@@ -172,29 +164,27 @@ class FandomBanned(Obj):
 
         # Возвращаем все
         else:
-            resp = await cls._c.select(conn, fandom_id)
+            page = page or Page()
+            resp = await cls._c.select(conn, fandom_id, *page.args(0))
 
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+        return cls._result(resp, conn, user_id, page)
 
     @classmethod
     async def insert(cls, conn: asyncpg.connection.Connection, user_id: int,
                      fandom_id: int, fields: dict):
 
         # Проверка
-        if (
-            not await C.fandom_moder(
-                conn, user_id, fandom_id, 'ban_f') and
-            not await C.admin(
-                conn, user_id)
-        ):
+        if not C.can(await C.perms(conn, user_id, 0, fandom_id), 'ban_f'):
             raise Forbidden
 
+        target = await C.perms(conn, fields['user_id'], 0, fandom_id)
+
         # Существует ли юзер
-        if not await C.user(conn, fields['user_id']):
+        if not target & C.USER:
             raise ObjectNotFound
 
         # А не модер ли он?
-        if await C.fandom_moder(conn, fields['user_id'], fandom_id):
+        if target & C.FANDOM_MODER:
             raise UserIsModer('ban', 'fandom')
 
         try:
@@ -206,12 +196,8 @@ class FandomBanned(Obj):
     async def delete(self):
 
         # Проверка
-        if (
-            not await C.fandom_moder(
-                self._conn, self._uid, self.meta['fandom_id'], 'ban_f') and
-            not await C.admin(
-                self._conn, self._uid)
-        ):
+        if not C.can(await C.perms(
+                self._conn, self._uid, 0, self.meta['fandom_id']), 'ban_f'):
             raise Forbidden
 
         await self._c.e.delete(self._conn, self.id, self.meta['fandom_id'])
@@ -219,7 +205,8 @@ class FandomBanned(Obj):
 
 class Fandom(Obj):
     _c = Commands(
-        select="SELECT * FROM fandoms ORDER BY id ASC",
+        # args: after_id, limit
+        select="SELECT * FROM fandoms WHERE id > $1 ORDER BY id ASC LIMIT $2",
 
         # args: fandom_urls
         select_by_u="SELECT * FROM fandoms WHERE url = ANY($1::CITEXT[]) "
@@ -229,6 +216,9 @@ class Fandom(Obj):
         select_by_id="SELECT * FROM fandoms WHERE id = ANY($1::BIGINT[]) "
                      "ORDER BY id",
 
+        # args: fandom_id
+        version="SELECT id, edited_at FROM fandoms WHERE id = $1",
+
         # args: user_id, url, title, description, avatar
         insert="SELECT fandoms_create($1, $2, $3, $4, $5)",
 
@@ -236,8 +226,9 @@ class Fandom(Obj):
         update="UPDATE fandoms SET edited_by=$1,"
                "title=$3, description=$4, avatar=$5 WHERE id=$2",
 
-        # args: fandom_id
-        history="SELECT * FROM fandoms_history($1) ORDER BY edited_at DESC"
+        # args: fandom_id, before_edited_at, limit
+        history="SELECT * FROM fandoms_history($1) WHERE edited_at < $2 "
+                "ORDER BY edited_at DESC LIMIT $3"
     )
 
     _type = 'fandoms'
@@ -259,11 +250,11 @@ class Fandom(Obj):
     @classmethod
     async def select(cls, conn: asyncpg.connection.Connection,
                      user_id: int, *target_ids: Union[int, str],
-                     u: bool=False) -> Tuple['Fandom', ...]:
+                     u: bool=False, page: Page=None) -> Tuple['Fandom', ...]:
 
         # Ищем по url
         if u and target_ids:
-            resp = await cls._c.select_by_url(conn, target_ids)
+            resp = await cls._c.select_by_u(conn, target_ids)
 
         # Ищем по ID
         elif target_ids:
@@ -271,16 +262,17 @@ class Fandom(Obj):
 
         # Возвращаем все
         else:
-            resp = await cls._c.select(conn)
+            page = page or Page()
+            resp = await cls._c.select(conn, *page.args(0))
 
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+        return cls._result(resp, conn, user_id, page)
 
     @classmethod
     async def insert(cls, conn: asyncpg.connection.Connection,
                      user_id: int, fields: dict) -> int:
 
         # Проверка
-        if not await C.admin(conn, user_id):
+        if not await C.perms(conn, user_id) & C.ADMIN:
             raise Forbidden
 
         try:
@@ -294,32 +286,26 @@ class Fandom(Obj):
     async def update(self, fields: dict):
 
         # Проверка
-        if (
-            not await C.fandom_moder(
-                self._conn, self._uid, self.id, 'edit_f') and
-            not await C.admin(
-                self._conn, self._uid)
-        ):
+        if not C.can(await C.perms(
+                self._conn, self._uid, 0, self.id), 'edit_f'):
             raise Forbidden
 
         await self._c.e.update(
             self._conn, self._uid, self.id,
             fields['title'], fields['description'], fields['avatar'])
 
-    async def history(self) -> Tuple['Fandom', ...]:
+    async def history(self, page: Page=None) -> Tuple['Fandom', ...]:
 
         # Проверка
-        if (
-            not await C.fandom_moder(
-                self._conn, self._uid, self.id, 'edit_f') and
-            not await C.admin(
-                self._conn, self._uid)
-        ):
+        if not C.can(await C.perms(
+                self._conn, self._uid, 0, self.id), 'edit_f'):
             raise Forbidden
 
-        resp = await self._c.history(self._conn, self.id)
+        page = page or Page()
+        resp = await self._c.history(
+            self._conn, self.id, *page.args(Page.LATEST))
 
-        return SelectResult(self.__class__(x) for x in resp)
+        return self._result(resp, page=page, key=('edited_at',))
 
     # Moders
 
@@ -331,11 +317,11 @@ class Fandom(Obj):
         except (IndexError, ValueError):
             raise ObjectNotFound
 
-    async def moders_select(self, *target_ids: Union[int, str]
-                            ) -> Tuple[FandomModer, ...]:
+    async def moders_select(self, *target_ids: Union[int, str],
+                            page: Page=None) -> Tuple[FandomModer, ...]:
 
         return await FandomModer.select(
-            self._conn, self._uid, self.id, *target_ids)
+            self._conn, self._uid, self.id, *target_ids, page=page)
 
     async def moders_insert(self, fields: dict) -> Tuple[int, int]:
 
@@ -354,11 +340,11 @@ class Fandom(Obj):
         except (IndexError, ValueError):
             raise ObjectNotFound
 
-    async def bans_select(self, *target_ids: Union[int, str]
-                          ) -> Tuple[FandomBanned, ...]:
+    async def bans_select(self, *target_ids: Union[int, str],
+                          page: Page=None) -> Tuple[FandomBanned, ...]:
 
         return await FandomBanned.select(
-            self._conn, self._uid, self.id, *target_ids)
+            self._conn, self._uid, self.id, *target_ids, page=page)
 
     async def bans_insert(self, fields: dict) -> Tuple[int, int]:
 
@@ -380,11 +366,11 @@ class Fandom(Obj):
         except (IndexError, ValueError):
             raise ObjectNotFound
 
-    async def blogs_select(self, *target_ids: Union[int, str], u: bool=False
-                           ) -> Tuple['Blog', ...]:
+    async def blogs_select(self, *target_ids: Union[int, str], u: bool=False,
+                           page: Page=None) -> Tuple['Blog', ...]:
 
         return await Blog.select(
-            self._conn, self.id, self._uid, *target_ids, u=u)
+            self._conn, self._uid, self.id, *target_ids, u=u, page=page)
 
     async def blogs_insert(self, fields: dict) -> int:
 
@@ -393,16 +379,16 @@ class Fandom(Obj):
 
     # Posts
 
-    async def posts_select(self, *target_ids: Union[int, str]
-                           ) -> Tuple[Post, ...]:
+    async def posts_select(self, *target_ids: Union[int, str],
+                           page: Page=None) -> Tuple[Post, ...]:
 
         return await Post.select(
-            self._conn, self._uid, 0, self.id, *target_ids)
+            self._conn, self._uid, 0, self.id, *target_ids, page=page)
 
     # Comments
 
-    async def comments_select(self, *target_ids: Union[int, str]
-                              ) -> Tuple[Comment, ...]:
+    async def comments_select(self, *target_ids: Union[int, str],
+                              page: Page=None) -> Tuple[Comment, ...]:
 
         return await Comment.select(
-            self._conn, self._uid, 0, 0, self.id, *target_ids)
+            self._conn, self._uid, 0, 0, self.id, *target_ids, page=page)
@@ -6,7 +6,8 @@ from typing import Union, Tuple
 import asyncpg
 
 from . import checks as C
-from .base import Obj, SelectResult, Commands
+from .. import votes
+from .base import Obj, Commands, Page, StreamResult
 from ...web.exceptions import Forbidden, ObjectNotFound
 
 from .comments import Comment
@@ -16,38 +17,52 @@ __all__ = ('Post', 'PostVote')
 
 class Post(Obj):
     _c = Commands(
-        select="SELECT * FROM posts ORDER BY id ASC",
+        stream="SELECT * FROM posts_counted ORDER BY id ASC",
+
+        # args: after_id, limit
+        select="SELECT * FROM posts_counted WHERE id > $1 "
+               "ORDER BY id ASC LIMIT $2",
 
         # args: post_ids
-        select_by_id="SELECT * FROM posts WHERE id = ANY($1::BIGINT[]) "
-                     "ORDER BY id ASC",
+        select_by_id="SELECT * FROM posts_counted "
+                     "WHERE id = ANY($1::BIGINT[]) ORDER BY id ASC",
+
+        # args: post_id
+        version="SELECT id, edited_at, votes_up, votes_down "
+                "FROM posts_counted WHERE id = $1",
 
-        # args: blog_id
-        select_by_blog="SELECT * FROM posts WHERE blog_id = $1 "
-                       "ORDER BY id ASC",
+        # args: blog_id, after_id, limit
+        select_by_blog="SELECT * FROM posts_counted WHERE blog_id = $1 "
+                       "AND id > $2 ORDER BY id ASC LIMIT $3",
 
-        # args: fandom_id
-        select_by_fandom="SELECT * FROM posts WHERE fandom_id = $1 "
-                         "ORDER BY id ASC",
+        # args: fandom_id, after_id, limit
+        select_by_fandom="SELECT * FROM posts_counted WHERE fandom_id = $1 "
+                         "AND id > $2 ORDER BY id ASC LIMIT $3",
 
-        # args: user_id
-        select_by_owner="SELECT * FROM posts WHERE owner = $1 ORDER BY id ASC",
+        # args: user_id, after_id, limit
+        select_by_owner="SELECT * FROM posts_counted WHERE owner = $1 "
+                        "AND id > $2 ORDER BY id ASC LIMIT $3",
 
         # args: user_id, blog_id, fandom_id, title, content
-        insert="SELECT posts_create($1, $2, $3, $4, $5)",
+        insert="SELECT posts_create_guarded($1, $2, $3, $4, $5)",
 
         # args: user_id, post_id, title, content
         update="UPDATE posts SET edited_by=$1, "
                "title=$3, content=$4 WHERE id=$2",
 
-        # args: post_id
+        # args: post_id, before_edited_at, limit
         history="SELECT id, created_at, edited_at, edited_by, blog_id, "
                 "fandom_id, owner, title, content "
-                "FROM posts_history($1) ORDER BY edited_at DESC"
+                "FROM posts_history($1) WHERE edited_at < $2 "
+                "ORDER BY edited_at DESC LIMIT $3"
     )
 
     _type = 'posts'
     _meta = ('votes_up', 'votes_down')
+    _fields = ('created_at', 'edited_at', 'edited_by', 'blog_id', 'fandom_id',
+               'owner', 'title', 'content', 'votes_up', 'votes_down')
+    _includes = {'owner': ('users', 'owner'), 'blog': ('blogs', 'blog_id'),
+                 'fandom': ('fandoms', 'fandom_id')}
 
     @classmethod
     async def id_u(cls, request) -> 'Post':
@@ -63,64 +78,62 @@ class Post(Obj):
     @classmethod
     async def select(cls, conn: asyncpg.connection.Connection, user_id: int,
                      blog_id: int, fandom_id: int,
-                     *target_ids: Union[int, str]) -> Tuple['Post', ...]:
+                     *target_ids: Union[int, str],
+                     page: Page=None) -> Tuple['Post', ...]:
 
         # Ищем по ID
         if target_ids:
             resp = await cls._c.select_by_id(conn, tuple(map(int, target_ids)))
+            return cls._result(resp, conn, user_id)
 
         # Ищем по блогу
         elif blog_id:
-            resp = await cls._c.select_by_blog(conn, blog_id)
+            return await cls._fetch_page(
+                cls._c.select_by_blog, conn, user_id, page or Page(), blog_id)
 
         # Ищем по фандому
         elif fandom_id:
-            resp = await cls._c.select_by_fandom(conn, fandom_id)
+            return await cls._fetch_page(
+                cls._c.select_by_fandom, conn, user_id, page or Page(),
+                fandom_id)
 
         # Возвращаем все
         else:
-            resp = await cls._c.select(conn)
+            return await cls._fetch_page(
+                cls._c.select, conn, user_id, page or Page())
 
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+    @classmethod
+    def stream(cls, user_id: int) -> StreamResult:
+        return StreamResult(cls, cls._c.c.stream, user_id=user_id)
 
     @classmethod
     async def select_by_owner(cls, conn: asyncpg.connection.Connection,
-                              user_id: int, target_id: int
+                              user_id: int, target_id: int, page: Page=None
                               ) -> Tuple['Post', ...]:
 
-        resp = await cls._c.select_by_owner(conn, target_id)
-
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+        return await cls._fetch_page(
+            cls._c.select_by_owner, conn, user_id, page or Page(), target_id)
 
     @classmethod
     async def insert(cls, conn: asyncpg.connection.Connection, user_id: int,
                      blog_id: int, fandom_id: int, fields: dict) -> int:
 
-        # Проверка
-        if (
-            not user_id or
-            await C.blog_banned(conn, user_id, blog_id) or
-            await C.fandom_banned(conn, user_id, fandom_id)
-        ):
+        # Проверка: баны и блог в фандоме - внутри posts_create_guarded
+        if not user_id:
             raise Forbidden
 
-        return await cls._c.v.insert(
+        return await C.guarded(cls._c.v.insert(
             conn, user_id, blog_id, fandom_id,
-            fields['title'], fields['content'])
+            fields['title'], fields['content']))
 
     async def update(self, fields: dict):
 
         # Проверка
         if (
             self.attrs['owner'] != self._uid and
-            not await C.blog_owner(
-                self._conn, self._uid, self.attrs['blog_id']) and
-            not await C.blog_moder(
-                self._conn, self._uid, self.attrs['blog_id'], 'edit_p') and
-            not await C.fandom_moder(
-                self._conn, self._uid, self.attrs['fandom_id'], 'edit_p') and
-            not await C.admin(
-                self._conn, self._uid)
+            not C.can(await C.perms(
+                self._conn, self._uid, self.attrs['blog_id'],
+                self.attrs['fandom_id']), 'edit_p')
         ):
             raise Forbidden
 
@@ -128,30 +141,28 @@ class Post(Obj):
             self._conn, self._uid, self.id,
             fields['title'], fields['content'])
 
-    async def history(self) -> Tuple['Post', ...]:
+    async def history(self, page: Page=None) -> Tuple['Post', ...]:
 
         # Проверка
         if (
             self.attrs['owner'] != self._uid and
-            not await C.blog_owner(
-                self._conn, self._uid, self.attrs['blog_id']) and
-            not await C.blog_moder(
-                self._conn, self._uid, self.attrs['blog_id'], 'edit_p') and
-            not await C.fandom_moder(
-                self._conn, self._uid, self.attrs['fandom_id'], 'edit_p') and
-            not await C.admin(
-                self._conn, self._uid)
+            not C.can(await C.perms(
+                self._conn, self._uid, self.attrs['blog_id'],
+                self.attrs['fandom_id']), 'edit_p')
         ):
             raise Forbidden
 
-        resp = await self._c.history(self._conn, self.id)
+        page = page or Page()
+        resp = await self._c.history(
+            self._conn, self.id, *page.args(Page.LATEST))
 
-        return SelectResult(self.__class__(x) for x in resp)
+        return self._result(resp, page=page, key=('edited_at',))
 
     # Votes
 
-    async def votes_select(self) -> Tuple['PostVote', ...]:
-        return await PostVote.select(self._conn, self._uid, self.id)
+    async def votes_select(self, page: Page=None) -> Tuple['PostVote', ...]:
+        return await PostVote.select(
+            self._conn, self._uid, self.id, page=page)
 
     async def votes_insert(self, fields: dict):
         await PostVote.insert(
@@ -160,11 +171,17 @@ class Post(Obj):
 
     # Comments
 
-    async def comments_select(self, *target_ids: Union[int, str]
-                              ) -> Tuple[Comment, ...]:
+    async def comments_select(self, *target_ids: Union[int, str],
+                              page: Page=None) -> Tuple[Comment, ...]:
 
         return await Comment.select(
-            self._conn, self._uid, self.id, 0, 0, *target_ids)
+            self._conn, self._uid, self.id, 0, 0, *target_ids, page=page)
+
+    async def comments_thread(self, depth: int, page: Page=None
+                              ) -> Tuple[Comment, ...]:
+
+        return await Comment.thread(
+            self._conn, self._uid, self.id, depth, page=page)
 
     async def comments_insert(self, fields: dict) -> int:
 
@@ -175,11 +192,12 @@ class Post(Obj):
 
 class PostVote(Obj):
     _c = Commands(
-        # args: post_id
+        # args: post_id, after_id, limit
         select="SELECT u.*, pv.target_id AS post_id, pv.vote "
                "FROM posts_votes AS pv "
                "INNER JOIN users AS u ON pv.user_id=u.id "
-               "WHERE target_id=$1 ORDER BY pv.user_id ASC",
+               "WHERE target_id=$1 AND pv.user_id > $2 "
+               "ORDER BY pv.user_id ASC LIMIT $3",
 
         # args: user_id, post_id
         select_by_id="SELECT u.*, pv.target_id AS post_id, pv.vote "
@@ -187,8 +205,32 @@ class PostVote(Obj):
                      "INNER JOIN users AS u ON pv.user_id=u.id "
                      "WHERE user_id=$1 AND target_id=$2",
 
-        # args: user_id, post_id, vote
-        insert="SELECT posts_vote ($1, $2, $3)"
+        # args: user_id, post_id, vote, blog_id, fandom_id
+        # Только строка голоса, сдвиг счетчиков - в votes.posts
+        vote="INSERT INTO posts_votes AS pv (target_id, user_id, vote) "
+             "SELECT $2::BIGINT, $1::BIGINT, $3::BOOLEAN "
+             "WHERE content_guard($1, $4, $5) "
+             "ON CONFLICT (target_id, user_id) DO UPDATE "
+             "SET vote = EXCLUDED.vote WHERE pv.vote != EXCLUDED.vote "
+             "RETURNING pv.xmax = 0 AS created",
+
+        # args: user_id, post_id, vote, blog_id, fandom_id
+        # Как функция posts_vote (миграция 7a3c5e9b1d48), но с проверкой
+        # банов и готовым выражением: SQL-функция планирует тело на каждый
+        # вызов
+        insert="WITH v AS ("
+               "INSERT INTO posts_votes AS pv (target_id, user_id, vote) "
+               "SELECT $2::BIGINT, $1::BIGINT, $3::BOOLEAN "
+               "WHERE content_guard($1, $4, $5) "
+               "ON CONFLICT (target_id, user_id) DO UPDATE "
+               "SET vote = EXCLUDED.vote WHERE pv.vote != EXCLUDED.vote "
+               "RETURNING pv.xmax = 0 AS created) "
+               "INSERT INTO posts_vote_slots AS s (target_id, slot, up, down) "
+               "SELECT $2, $1 % 16, "
+               "CASE WHEN $3 THEN 1 WHEN v.created THEN 0 ELSE -1 END, "
+               "CASE WHEN NOT $3 THEN 1 WHEN v.created THEN 0 ELSE -1 END "
+               "FROM v ON CONFLICT (target_id, slot) DO UPDATE "
+               "SET up = s.up + EXCLUDED.up, down = s.down + EXCLUDED.down"
     )
 
     _type = 'users'
@@ -196,26 +238,34 @@ class PostVote(Obj):
 
     @classmethod
     async def select(cls, conn: asyncpg.connection.Connection, user_id: int,
-                     post_id: Union[int, str]) -> Tuple['PostVote', ...]:
+                     post_id: Union[int, str],
+                     page: Page=None) -> Tuple['PostVote', ...]:
 
         # Только админам можно смотреть кто голосовал
-        if await C.admin(conn, user_id):
-            resp = await cls._c.select(conn, int(post_id))
+        if await C.perms(conn, user_id) & C.ADMIN:
+            page = page or Page()
+            resp = await cls._c.select(conn, int(post_id), *page.args(0))
         else:
+            page = None
             resp = await cls._c.select_by_id(conn, user_id, int(post_id))
 
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+        return cls._result(resp, conn, user_id, page)
 
     @classmethod
     async def insert(cls, conn: asyncpg.connection.Connection, user_id: int,
                      post_id: int, blog_id: int, fandom_id: int, fields: dict):
 
-        # Проверка
-        if (
-            not user_id or
-            await C.blog_banned(conn, user_id, blog_id) or
-            await C.fandom_banned(conn, user_id, fandom_id)
-        ):
+        # Проверка: баны - внутри запроса (content_guard)
+        if not user_id:
             raise Forbidden
 
-        await cls._c.e.insert(conn, user_id, post_id, fields['vote'])
+        args = (user_id, post_id, fields['vote'], blog_id, fandom_id)
+
+        if not votes.posts.active:
+            await C.guarded(cls._c.e.insert(conn, *args))
+            return
+
+        # None - голос не изменился
+        created = await C.guarded(cls._c.v.vote(conn, *args))
+        if created is not None:
+            votes.posts.vote(int(post_id), fields['vote'], created)
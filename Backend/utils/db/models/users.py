@@ -6,7 +6,7 @@ from typing import Union, Tuple
 import asyncpg
 
 from . import checks as C
-from .base import Obj, SelectResult, Commands
+from .base import Obj, Commands, Page
 from ...web.exceptions import Forbidden, ObjectNotFound
 
 from .posts import Post
@@ -18,8 +18,8 @@ __all__ = ('User',)
 
 class User(Obj):
     _c = Commands(
-        # args: offset
-        select="SELECT * FROM users ORDER BY id LIMIT 20 OFFSET $1",
+        # args: after_id, limit
+        select="SELECT * FROM users WHERE id > $1 ORDER BY id LIMIT $2",
 
         # args: usernames
         select_by_u="SELECT * FROM users WHERE username = ANY($1::CITEXT[]) "
@@ -29,13 +29,16 @@ class User(Obj):
         select_by_id="SELECT * FROM users WHERE id = ANY($1::BIGINT[]) "
                      "ORDER BY id",
 
+        # args: user_id
+        version="SELECT id, edited_at FROM users WHERE id = $1",
+
         # args: edited_by, user_id, description, avatar
         update="UPDATE users SET edited_by=$1, description=$3, "
                "avatar=$4 WHERE id=$2",
 
-        # args: user_id, offset
-        history="SELECT * FROM users_history ($1) ORDER BY edited_at DESC "
-                "LIMIT 20 OFFSET $2"
+        # args: user_id, before_edited_at, limit
+        history="SELECT * FROM users_history ($1) WHERE edited_at < $2 "
+                "ORDER BY edited_at DESC LIMIT $3"
     )
 
     _type = 'users'
@@ -62,7 +65,7 @@ class User(Obj):
     @classmethod
     async def select(cls, conn: asyncpg.connection.Connection,
                      user_id: int, *target_ids: Union[int, str],
-                     u: bool=False, page: int=0) -> Tuple['User', ...]:
+                     u: bool=False, page: Page=None) -> Tuple['User', ...]:
 
         # Ищем по имени
         if u and target_ids:
@@ -74,16 +77,17 @@ class User(Obj):
 
         # Возвращаем все
         else:
-            resp = await cls._c.select(conn, page * 20)
+            page = page or Page()
+            resp = await cls._c.select(conn, *page.args(0))
 
-        return SelectResult(cls(x, conn, user_id) for x in resp)
+        return cls._result(resp, conn, user_id, page)
 
     async def update(self, fields: dict):
 
         # Проверка
         if (
             self.id != self._uid and
-            not await C.admin(self._conn, self._uid)
+            not await C.perms(self._conn, self._uid) & C.ADMIN
         ):
             raise Forbidden
 
@@ -91,24 +95,29 @@ class User(Obj):
             self._conn, self._uid, self.id,
             fields['description'], fields['avatar'])
 
-    async def history(self) -> Tuple['User', ...]:
+    async def history(self, page: Page=None) -> Tuple['User', ...]:
 
         # Проверка
         if (
             self.id != self._uid and
-            not await C.admin(self._conn, self._uid)
+            not await C.perms(self._conn, self._uid) & C.ADMIN
         ):
             raise Forbidden
 
-        resp = await self._c.history(self._conn, self.id)
+        page = page or Page()
+        resp = await self._c.history(
+            self._conn, self.id, *page.args(Page.LATEST))
 
-        return SelectResult(self.__class__(x) for x in resp)
+        return self._result(resp, page=page, key=('edited_at',))
 
-    async def blogs(self) -> Tuple[Blog, ...]:
-        return await Blog.select_by_owner(self._conn, self._uid, self.id)
+    async def blogs(self, page: Page=None) -> Tuple[Blog, ...]:
+        return await Blog.select_by_owner(
+            self._conn, self._uid, self.id, page=page)
 
-    async def posts(self) -> Tuple[Post, ...]:
-        return await Post.select_by_owner(self._conn, self._uid, self.id)
+    async def posts(self, page: Page=None) -> Tuple[Post, ...]:
+        return await Post.select_by_owner(
+            self._conn, self._uid, self.id, page=page)
 
-    async def comments(self) -> Tuple[Comment, ...]:
-        return await Comment.select_by_owner(self._conn, self._uid, self.id)
+    async def comments(self, page: Page=None) -> Tuple[Comment, ...]:
+        return await Comment.select_by_owner(
+            self._conn, self._uid, self.id, page=page)
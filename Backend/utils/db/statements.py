@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Реестр SQL всех Commands и checks
+
+Каждое соединение пула (Connection) готовит весь реестр при создании, а
+Commands ходят через готовые PreparedStatement. Счетчики hits/misses по
+каждому выражению показывают, насколько прогрев себя оправдывает.
+"""
+
+import asyncio
+import traceback
+from collections import Counter
+
+import asyncpg
+
+from . import metrics
+
+__all__ = ('register', 'name', 'run', 'stats', 'Connection')
+
+# sql -> имя (ключ Commands), порядок регистрации сохраняется
+_sqls = dict()
+
+hits = Counter()
+misses = Counter()
+
+
+def register(name: str, sql: str) -> str:
+    _sqls.setdefault(sql, name)
+    return sql
+
+
+def name(sql: str) -> str:
+    return _sqls.get(sql) or sql[:60]
+
+
+async def run(conn: asyncpg.connection.Connection, sql: str, action: str,
+              args: tuple):
+    """Выполняет готовое выражение sql методом action, с метриками"""
+    stmt = await conn.statement(sql)
+    return await metrics.timed(name(sql), args, getattr(stmt, action)(
+        *args, timeout=conn.timeout()))
+
+
+def stats() -> list:
+    resp = list()
+
+    for sql, name in _sqls.items():
+        total = hits[sql] + misses[sql]
+        resp.append(dict(
+            name=name, sql=sql, hits=hits[sql], misses=misses[sql],
+            hit_rate=round(hits[sql] / total, 4) if total else None))
+
+    return resp
+
+
+class Connection(asyncpg.connection.Connection):
+    """Соединение со своим набором подготовленных выражений реестра"""
+
+    __slots__ = ('_prepared', 'replica', '_deadline')
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._prepared = dict()
+        # Соединение с репликой: читать можно, кэшировать прочитанное - нет
+        self.replica = False
+        # Срок запроса, который держит соединение (loop.time()), см. DB
+        self._deadline = None
+
+    def set_deadline(self, deadline: float) -> None:
+        self._deadline = deadline
+
+    def timeout(self) -> float:
+        """Остаток срока для timeout= в asyncpg; None - без ограничения"""
+        if self._deadline is None:
+            return None
+
+        left = self._deadline - self._loop.time()
+        if left <= 0:
+            raise asyncio.TimeoutError
+
+        return left
+
+    async def prepare_replica(self) -> None:
+        """init-хук пулов реплик"""
+        self.replica = True
+        await self.prepare_all()
+
+    async def prepare_all(self) -> None:
+        """init-хук пула: готовит все выражения реестра"""
+        for sql in _sqls:
+            if sql in self._prepared:
+                continue
+
+            try:
+                self._prepared[sql] = await self.prepare(sql)
+            except asyncpg.PostgresError:
+                # Ошибка в SQL всплывет при вызове, как и без прогрева
+                traceback.print_exc()
+
+    async def statement(self, sql: str
+                        ) -> asyncpg.prepared_stmt.PreparedStatement:
+        stmt = self._prepared.get(sql)
+
+        if stmt is not None:
+            hits[sql] += 1
+            return stmt
+
+        misses[sql] += 1
+        stmt = self._prepared[sql] = await self.prepare(
+            sql, timeout=self.timeout())
+
+        return stmt
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Буфер сдвигов счетчиков голосов внутри воркера (write-behind)
+
+Строка голоса (*_votes) пишется сразу, а сдвиг votes_up/votes_down
+копится здесь по id цели. DB раз в vote_flush_ms переносит накопленное
+одним UPDATE ... FROM unnest на таблицу. В отличие от слотов (миграция
+7a3c5e9b1d48) счетчики отстают на период, а при падении воркера
+несброшенное теряется. Пока период не задан, буфер выключен.
+"""
+
+from typing import Tuple
+
+import asyncpg
+
+from . import statements
+
+__all__ = ('VoteBuffer', 'posts', 'comments', 'buffers')
+
+# args: ids, ups, downs
+_FLUSH = "UPDATE {0} AS t SET votes_up = t.votes_up + d.up, " \
+         "votes_down = t.votes_down + d.down " \
+         "FROM unnest($1::BIGINT[], $2::INT[], $3::INT[]) " \
+         "AS d (id, up, down) WHERE t.id = d.id"
+
+
+class VoteBuffer:
+    def __init__(self, table: str) -> None:
+        self._sql = statements.register(
+            f'votes.{table}.flush', _FLUSH.format(table))
+        self.active = False
+        # target_id -> [up, down]
+        self._deltas = dict()
+
+    def __len__(self) -> int:
+        return len(self._deltas)
+
+    def vote(self, target_id: int, vote: bool, created: bool):
+        """Голос записан: новый - +1, смена - перенос между счетчиками"""
+        back = 0 if created else -1
+        self.add(target_id, 1 if vote else back, back if vote else 1)
+
+    def add(self, target_id: int, up: int, down: int):
+        delta = self._deltas.get(target_id)
+
+        if delta is None:
+            self._deltas[target_id] = [up, down]
+        else:
+            delta[0] += up
+            delta[1] += down
+
+    def take(self) -> Tuple[list, list, list]:
+        deltas, self._deltas = self._deltas, dict()
+
+        # Один порядок блокировок у всех воркеров
+        ids = sorted(x for (x, y) in deltas.items() if y != [0, 0])
+
+        return ids, [deltas[x][0] for x in ids], [deltas[x][1] for x in ids]
+
+    async def flush(self, conn: asyncpg.connection.Connection):
+        ids, ups, downs = self.take()
+        if not ids:
+            return
+
+        try:
+            await statements.run(conn, self._sql, 'fetch', (ids, ups, downs))
+        except Exception:
+            # Вернуть в буфер до следующей попытки
+            for args in zip(ids, ups, downs):
+                self.add(*args)
+            raise
+
+
+posts = VoteBuffer('posts')
+comments = VoteBuffer('comments')
+
+buffers = (posts, comments)
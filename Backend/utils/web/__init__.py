@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from .rewrites import JsonResponse, json_response, Router, BaseView
+from .rewrites import JsonResponse, json_response, conditional, compound, \
+    Router, BaseView
 
 __all__ = ('exceptions', 'middlewares', 'validators', 'other',
-           'JsonResponse', 'json_response', 'Router', 'BaseView')
+           'JsonResponse', 'json_response', 'conditional', 'compound',
+           'Router', 'BaseView')
@@ -163,3 +163,14 @@ class InternalServerError(ErrorException):
 class NotYetImplemented(ErrorException):
     status_code = 501
     description = 'Soon™.'
+
+
+class ServiceUnavailable(ErrorException):
+    status_code = 503
+    description = 'No database connection became free before the ' \
+                  'request deadline. Try again later.'
+
+
+class DeadlineExceeded(ErrorException):
+    status_code = 504
+    description = 'The request did not complete before its deadline.'
@@ -1,15 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import zlib
 import time
 import socket
 import asyncio
 import traceback
+from collections import OrderedDict
 
-from aiohttp import web
+from aiohttp import web, hdrs
 from aiohttp.web_request import Request
 
 from .tkn import decode_timed
+from ..db.db import LSN_COOKIE, LSN_HEADER
 from .exceptions import (JsonException, InternalServerError,
                          InvalidToken, InvalidHeaderValue)
 
@@ -67,3 +70,143 @@ async def auth_middleware(app: web.Application, handler):
 
         return await handler(request)
     return middleware_handler
+
+
+_MIN_SIZE = 1024  # меньше - заголовки gzip съедят весь выигрыш
+_OFFLOAD_SIZE = 64 * 1024  # больше - сжимаем в пуле потоков, не в цикле
+_CACHE_SIZE = 32 * 1024 * 1024
+
+# gzip и deflate - это один zlib, разница в обертке (wbits)
+_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+
+def _encoding(accept: str) -> str:
+    accepted = {}
+    for item in accept.lower().split(','):
+        coding, *params = [x.strip() for x in item.split(';')]
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+
+    for coding in ('gzip', 'deflate'):
+        if accepted.get(coding, accepted.get('*', 0.0)) > 0:
+            return coding
+
+    return None
+
+
+def _level(size: int) -> int:
+    # На больших телах время сжатия растет быстрее выигрыша
+    if size < 16 * 1024:
+        return 6
+    elif size < 256 * 1024:
+        return 4
+
+    return 1
+
+
+def _compress(body: bytes, coding: str) -> bytes:
+    c = zlib.compressobj(_level(len(body)), zlib.DEFLATED, _WBITS[coding])
+    return c.compress(body) + c.flush()
+
+
+class _BodyCache:
+    """LRU сжатых тел по (метод, URL, ETag, кодировка), ограничен
+    суммарным размером"""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.used = 0
+        self._items = OrderedDict()
+
+    def get(self, key: tuple) -> bytes:
+        body = self._items.get(key)
+        if body is not None:
+            self._items.move_to_end(key)
+
+        return body
+
+    def put(self, key: tuple, body: bytes) -> None:
+        if len(body) > self.size or key in self._items:
+            return
+
+        self._items[key] = body
+        self.used += len(body)
+
+        while self.used > self.size:
+            self.used -= len(self._items.popitem(last=False)[1])
+
+
+_cache = _BodyCache(_CACHE_SIZE)
+
+
+async def compression_middleware(app: web.Application, handler):
+    async def middleware_handler(request: Request):
+        resp = await handler(request)
+
+        # Потоковые ответы уже отправлены, 304/204 без тела
+        if not isinstance(resp, web.Response) or resp.prepared or \
+                hdrs.CONTENT_ENCODING in resp.headers:
+            return resp
+
+        body = resp.body
+        if not isinstance(body, (bytes, bytearray)) or len(body) < _MIN_SIZE:
+            return resp
+
+        resp.headers[hdrs.VARY] = hdrs.ACCEPT_ENCODING
+
+        coding = _encoding(request.headers.get(hdrs.ACCEPT_ENCODING, ''))
+        if coding is None:
+            return resp
+
+        # ETag однозначен только в пределах URL: у списков с теми же
+        # строками и курсором он общий, а ссылка next в теле - разная
+        etag = resp.headers.get(hdrs.ETAG)
+        key = (request.method, request.path_qs, etag, coding)
+
+        compressed = _cache.get(key) if etag else None
+        if compressed is None:
+            if len(body) >= _OFFLOAD_SIZE:
+                compressed = await app.loop.run_in_executor(
+                    None, _compress, body, coding)
+            else:
+                compressed = _compress(body, coding)
+
+            if etag:
+                _cache.put(key, compressed)
+
+        resp.body = compressed
+        resp.headers[hdrs.CONTENT_ENCODING] = coding
+
+        # Другие байты - сильный ETag нельзя, но If-None-Match сравнит W/
+        if etag and not etag.startswith('W/'):
+            resp.headers[hdrs.ETAG] = 'W/' + etag
+
+        return resp
+    return middleware_handler
+
+
+_LSN_TTL = 300  # дольше реплики не отстают, дальше читаем откуда угодно
+
+
+async def lsn_middleware(app: web.Application, handler):
+    """Отдает клиенту водяной знак записи (db.postgres кладет request.lsn)
+
+    Заголовок - для API-клиентов, кука - для браузера. Следующие GET
+    с ним не пойдут на реплику, которая эту запись еще не проиграла.
+    """
+    async def middleware_handler(request: Request):
+        resp = await handler(request)
+
+        lsn = getattr(request, 'lsn', None)
+        if lsn is not None:
+            resp.headers[LSN_HEADER] = lsn
+            resp.set_cookie(LSN_COOKIE, lsn, max_age=_LSN_TTL, httponly=True)
+
+        return resp
+    return middleware_handler
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import re
 import json
+import hashlib
+import asyncio
+import traceback
 from datetime import datetime
 from collections import Sequence
+from email.utils import format_datetime
 
 from aiohttp import web, hdrs, web_urldispatcher
 from multidict import CIMultiDict
@@ -11,7 +16,8 @@ from multidict import CIMultiDict
 
 class JsonResponse(web.Response):
     def __init__(self, body=None, status_code=None, headers=None, *,
-                 status: str='success', **kwargs) -> None:
+                 status: str='success', meta: dict=None, pretty: bool=False,
+                 included: list=None, **kwargs) -> None:
         if headers is None:
             headers = CIMultiDict()
 
@@ -21,48 +27,521 @@ class JsonResponse(web.Response):
         kwargs.pop('content-type', None)
         headers[hdrs.CONTENT_TYPE] = 'application/json; charset=utf-8'
 
-        body = Encoder(indent=4)(
-            {'status': status, 'data': body}).encode('utf-8')
+        body = _render(body, status, meta, pretty, included)
 
         super().__init__(body=body, status=status_code,
                          headers=headers, **kwargs)
 
 
-from ..db.models.base import Obj, SelectResult  # noqa
+from ..db.models.base import (Obj, SelectResult, StreamResult,  # noqa
+                              JsonResult)
+from ..db.db import watermark  # noqa
+from .validators.validators import Fieldsets  # noqa
+
+
+def _render(body, status: str, meta: dict, pretty: bool,
+            included: list=None) -> bytes:
+    # Строки от Postgres вклеиваются как есть
+    if isinstance(body, JsonResult):
+        data = b'[' + b','.join(body.rows) + b']'
+
+        if pretty:
+            body = json.loads(data.decode('utf-8'))
+        else:
+            out = b'{"status":' + engine.dumps(status) + b',"data":' + data
+            if meta:
+                out += b',"meta":' + engine.dumps(meta)
+            if included is not None:
+                out += b',"included":' + engine.dumps(
+                    [x._data for x in included])
+
+            return out + b'}'
+
+    # Obj разворачиваем сразу, чтобы не ходить за ними в default()
+    elif isinstance(body, Obj):
+        body = body._data
+    elif isinstance(body, SelectResult):
+        body = [x._data for x in body]
+
+    body = {'status': status, 'data': body}
+    if meta:
+        body['meta'] = meta
+    if included is not None:
+        body['included'] = [x._data for x in included]
+
+    return engine.dumps(body, pretty)
+
+
+# Размер порции, после которой буфер отправляется клиенту
+_STREAM_CHUNK = 64 * 1024
+
+
+async def _stream_response(request, result: StreamResult):
+    resp = web.StreamResponse(headers={
+        hdrs.CONTENT_TYPE: 'application/json; charset=utf-8'})
+    await resp.prepare(request)
+
+    dumps = engine.dumps
+    buf = [b'{"status":"success","data":[']
+    size = 0
+    sep = b''
+
+    try:
+        db = request.app['db']
+        async with db.acquire(True, watermark(request)) as conn:
+            async with conn.transaction(readonly=True):
+                async for obj in result.iterate(conn):
+                    buf.append(sep)
+                    buf.append(dumps(obj._data))
+                    sep = b','
+
+                    size += len(buf[-1]) + 1
+
+                    if size >= _STREAM_CHUNK:
+                        resp.write(b''.join(buf))
+                        await resp.drain()
+                        buf.clear()
+                        size = 0
+
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        # Заголовки уже ушли - обрываем соединение, оставляя JSON неполным
+        traceback.print_exc()
+        resp.force_close()
+        return resp
+
+    buf.append(b']}')
+    resp.write(b''.join(buf))
+    await resp.write_eof()
+
+    return resp
+
+
+def _page_meta(request, resp) -> dict:
+    if resp.cursor is None:
+        return None
+
+    query = dict(request.query)
+    query['after'] = resp.cursor
+
+    return {'after': resp.cursor,
+            'next': str(request.rel_url.with_query(query))}
 
 
 def json_response(func):
     async def wrapped(*args, **kwargs):
         resp = await func(*args, **kwargs)
 
-        if isinstance(resp, SelectResult):
-            return JsonResponse(resp)
+        if isinstance(args[0], web.Request):
+            request = args[0]
+        else:
+            request = args[0].request
+
+        pretty = request.query.get('pretty') == '1'
+
+        if isinstance(resp, StreamResult):
+            return await _stream_response(request, resp)
+        elif request.method == hdrs.METH_GET and \
+                isinstance(resp, (Obj, SelectResult)):
+            versions = _versions(resp)
+            headers = _cache_headers(versions, pretty, _fieldsets(request))
+
+            # 304 отдаем до сериализации - тело тут не нужно вовсе
+            if _not_modified(request, headers[hdrs.ETAG]):
+                return web.Response(status=304, headers=headers)
+
+            if isinstance(resp, Obj):
+                return JsonResponse(resp, headers=headers, pretty=pretty,
+                                    included=resp.included)
+
+            return JsonResponse(resp, headers=headers, pretty=pretty,
+                                meta=_page_meta(request, resp),
+                                included=resp.included)
+        elif isinstance(resp, (SelectResult, JsonResult)):
+            return JsonResponse(resp, meta=_page_meta(request, resp),
+                                pretty=pretty, included=resp.included)
         elif isinstance(resp, Sequence):
             assert len(resp) <= 3, "Resp > 3"
-            return JsonResponse(*resp)
+            return JsonResponse(*resp, pretty=pretty)
         else:
-            return JsonResponse(resp)
+            return JsonResponse(resp, pretty=pretty)
     return wrapped
 
 
-class Encoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, datetime):
-            return o.isoformat()
-        elif isinstance(o, Obj):
-            return o._data
-        super().default(o)
+def _versions(resp) -> tuple:
+    included = tuple(x.version for x in resp.included or ())
+
+    if isinstance(resp, Obj):
+        return (resp.version,) + included
+
+    # курсор входит в версию: та же страница с другим next - другое тело
+    return tuple(x.version for x in resp) + ((resp.cursor,),) + \
+        ((resp.variant,) if resp.variant else ()) + included
+
+
+def _fieldsets(request) -> tuple:
+    """fields[type] запроса без учета порядка колонок и повторов
+
+    Набор колонок выбирает модель (_sparse_sql), порядок в запросе на
+    тело не влияет.
+    """
+    return tuple(sorted((k, tuple(sorted(set(x))))
+                        for (k, x) in Fieldsets()(request.query).items()))
+
+
+def _cache_headers(versions: tuple, pretty: bool,
+                   fields: tuple=()) -> CIMultiDict:
+    """ETag по (type, id, edited_at, votes) каждого объекта
+
+    Голоса не трогают edited_at, поэтому Last-Modified только для
+    справки, а 304 выдается лишь по If-None-Match. fields[type] входят
+    в ETag: у строки с частью колонок та же версия, но другое тело.
+    """
+    digest = hashlib.sha1(
+        repr((pretty, fields) + versions).encode('utf-8'))
+
+    headers = CIMultiDict()
+    headers[hdrs.ETAG] = f'"{digest.hexdigest()}"'
+
+    modified = [v[2] for v in versions if len(v) > 2 and v[2]]
+    if modified:
+        headers[hdrs.LAST_MODIFIED] = format_datetime(max(modified),
+                                                      usegmt=True)
+
+    return headers
+
+
+def _not_modified(request, etag: str) -> bool:
+    header = request.headers.get(hdrs.IF_NONE_MATCH)
+    if not header:
+        return False
+
+    for tag in header.split(','):
+        tag = tag.strip()
+
+        if tag == '*' or tag == etag or tag == 'W/' + etag:
+            return True
+
+    return False
+
+
+def conditional(model, key: str):
+    """Проверка If-None-Match одним легким запросом версии объекта
+
+    Ставится под @postgres. Если у клиента актуальная копия, отвечает 304,
+    не загружая строку целиком; иначе все решит json_response.
+    """
+    def decorator(func):
+        async def wrapped(*args, **kwargs):
+            if isinstance(args[0], web.Request):
+                request = args[0]
+            else:
+                request = args[0].request
+
+            target = request.match_info.get(key, '')
+
+            # С include версия зависит и от связанных объектов
+            if request.headers.get(hdrs.IF_NONE_MATCH) and \
+                    target.isdigit() and 'include' not in request.query:
+                version = await model.version_by_id(request.conn, int(target))
+
+                if version is not None:
+                    headers = _cache_headers(
+                        (version,), request.query.get('pretty') == '1',
+                        _fieldsets(request))
+
+                    if _not_modified(request, headers[hdrs.ETAG]):
+                        raise web.HTTPNotModified(headers=headers)
+
+            return await func(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def _nodes(data: list) -> list:
+    """Элементы вместе со вложенными children (дерево комментариев)"""
+    nodes = list()
+
+    for x in data:
+        nodes.append(x)
+        nodes.extend(_nodes(x.get('children', ())))
+
+    return nodes
+
+
+def compound(model):
+    """?include=a,b: связанные объекты в included (ставится под @postgres)"""
+    def decorator(func):
+        async def wrapped(*args, **kwargs):
+            if isinstance(args[0], web.Request):
+                request = args[0]
+            else:
+                request = args[0].request
+
+            resp = await func(*args, **kwargs)
+
+            names = tuple(
+                x for x in request.query.get('include', '').split(',') if x)
+            if not names:
+                return resp
+
+            if isinstance(resp, Obj):
+                data = [resp._data]
+            elif isinstance(resp, SelectResult):
+                data = _nodes([x._data for x in resp])
+            elif isinstance(resp, JsonResult):
+                data = [json.loads(x.decode('utf-8')) for x in resp.rows]
+            else:
+                return resp
+
+            resp.included = await model.include(request.conn, data, names)
+
+            return resp
+        return wrapped
+    return decorator
+
+
+def _default(o):
+    # asyncpg отдает ровно datetime, так что isinstance почти не нужен
+    if type(o) is datetime or isinstance(o, datetime):
+        return o.isoformat()
+    elif isinstance(o, Obj):
+        return o._data
+    elif isinstance(o, tuple):
+        # SelectResult и прочие наследники tuple, которых не знает orjson
+        return list(o)
 
-    def __call__(self, *args, **kwargs):
-        return self.encode(*args, **kwargs)
+    raise TypeError(f'{type(o).__name__} is not JSON serializable')
+
+
+class JsonEngine:
+    """Стандартный json; компактный вывод, отступы только для pretty"""
+
+    name = 'json'
+
+    def __init__(self) -> None:
+        self._compact = json.JSONEncoder(
+            default=_default, ensure_ascii=False, separators=(',', ':'))
+        self._pretty = json.JSONEncoder(
+            default=_default, ensure_ascii=False, indent=4)
+
+    def dumps(self, obj, pretty: bool=False) -> bytes:
+        encoder = self._pretty if pretty else self._compact
+        return encoder.encode(obj).encode('utf-8')
+
+
+class OrjsonEngine(JsonEngine):
+    """orjson: datetime кодируется нативно, в default попадают только Obj"""
+
+    name = 'orjson'
+
+    def __init__(self) -> None:
+        import orjson
+
+        self._dumps = orjson.dumps
+        self._indent = orjson.OPT_INDENT_2
+
+    def dumps(self, obj, pretty: bool=False) -> bytes:
+        return self._dumps(
+            obj, default=_default, option=self._indent if pretty else 0)
+
+
+def _best_engine() -> JsonEngine:
+    try:
+        return OrjsonEngine()
+    except ImportError:
+        return JsonEngine()
+
+
+engine = _best_engine()
+
+
+def set_engine(new: JsonEngine):
+    global engine
+    engine = new
 
 
 from .exceptions import (ResourceNotFound, MethodNotAllowed,
                          ExpectationFailed)  # noqa
 
 
+class _Node:
+    __slots__ = ('static', 'dynamic', 'leaves')
+
+    def __init__(self) -> None:
+        self.static = dict()
+        self.dynamic = list()
+        self.leaves = list()
+
+
+class _Leaf:
+    __slots__ = ('index', 'resource', 'methods', 'any', 'allowed')
+
+    def __init__(self, index: int, resource) -> None:
+        self.index = index
+        self.resource = resource
+        self.methods = dict()
+        self.any = None
+        self.allowed = set()
+
+        # Повторяем порядок обхода ResourceRoute в AbstractResource.resolve
+        for route in resource:
+            self.allowed.add(route.method)
+
+            if route.method == hdrs.METH_ANY:
+                if self.any is None:
+                    self.any = route
+            elif route.method not in self.methods:
+                self.methods[route.method] = self.any or route
+
+    def route(self, method: str):
+        return self.methods.get(method, self.any)
+
+
+_ROUTE_PART = re.compile(r'(\{[_a-zA-Z][^{}]*(?:\{[^{}]*\}[^{}]*)*\})')
+_DYN = re.compile(r'\{(?P<var>[_a-zA-Z][_a-zA-Z0-9]*)\}')
+_DYN_WITH_RE = re.compile(
+    r'\{(?P<var>[_a-zA-Z][_a-zA-Z0-9]*):(?P<re>.+)\}')
+_SPANNING = ('/', '.', '[^', '\\W', '\\S', '\\D')
+
+
+def _segments(path: str):
+    """Разбивает шаблон пути на сегменты: (regex | None, текст, spanning)"""
+    segments = [['', [], False]]
+
+    for part in _ROUTE_PART.split(path):
+        match = _DYN.fullmatch(part) or _DYN_WITH_RE.fullmatch(part)
+
+        if match:
+            var_re = match.groupdict().get('re') or '[^{}/]+'
+            segments[-1][1].append(f'(?:{var_re})')
+            segments[-1][2] |= any(x in var_re for x in _SPANNING)
+            segments[-1][0] = None
+            continue
+
+        for i, text in enumerate(part.split('/')):
+            if i:
+                segments.append(['', [], False])
+            if segments[-1][0] is not None:
+                segments[-1][0] += text
+            segments[-1][1].append(re.escape(text))
+
+    # Первый сегмент всегда пустой - путь начинается с '/'
+    return [(None if lit is not None else re.compile(''.join(regex)),
+             lit, spanning) for lit, regex, spanning in segments[1:]]
+
+
+def _walk(node: _Node, path: str, pos: int, found: list):
+    length = len(path)
+
+    if pos == length:
+        found.extend(node.leaves)
+        return
+
+    if path[pos] != '/':
+        return
+
+    end = path.find('/', pos + 1)
+    if end == -1:
+        end = length
+
+    child = node.static.get(path[pos + 1:end])
+    if child is not None:
+        _walk(child, path, end, found)
+
+    for regex, spanning, child in node.dynamic:
+        if not spanning:
+            if regex.fullmatch(path, pos + 1, end):
+                _walk(child, path, end, found)
+            continue
+
+        # Параметр может захватывать '/', пробуем каждую границу сегмента
+        stop = end
+        while True:
+            if regex.fullmatch(path, pos + 1, stop):
+                _walk(child, path, stop, found)
+            if stop == length:
+                break
+            stop = path.find('/', stop + 1)
+            if stop == -1:
+                stop = length
+
+
 class Router(web_urldispatcher.UrlDispatcher):
+    """
+    Роутер с таблицей маршрутов, скомпилированной в префиксное дерево
+    по сегментам пути. Если compiled=False (или зарегистрирован ресурс,
+    который дерево не умеет описать), используется линейный обход.
+    """
+
+    def __init__(self, *, compiled: bool=True) -> None:
+        super().__init__()
+
+        self._compiled = compiled
+        self._paths = dict()
+        self._tree = None
+
+    def compile(self):
+        self._tree = False
+
+        if not self._compiled:
+            return
+
+        root = _Node()
+
+        for index, resource in enumerate(self._resources):
+            path = self._paths.get(id(resource))
+            if path is None:
+                return
+
+            node = root
+            for regex, literal, spanning in _segments(path):
+                if regex is None:
+                    node = node.static.setdefault(literal, _Node())
+                    continue
+
+                for _regex, _spanning, child in node.dynamic:
+                    if _regex.pattern == regex.pattern:
+                        node = child
+                        break
+                else:
+                    child = _Node()
+                    node.dynamic.append((regex, spanning, child))
+                    node = child
+
+            node.leaves.append(_Leaf(index, resource))
+
+        self._tree = root
+
     async def resolve(self, request):
+        if self._tree is None:
+            self.compile()
+
+        if self._tree is False:
+            return await self._resolve_linear(request)
+
+        path = request.rel_url.raw_path
+        found = list()
+        _walk(self._tree, path, 0, found)
+
+        allowed_methods = set()
+
+        for leaf in sorted(found, key=lambda x: x.index):
+            match_dict = leaf.resource._match(path)
+            if match_dict is None:
+                continue
+
+            route = leaf.route(request.method)
+            if route is not None:
+                return web_urldispatcher.UrlMappingMatchInfo(
+                    match_dict, route)
+
+            allowed_methods |= leaf.allowed
+
+        return self._no_match(allowed_methods)
+
+    async def _resolve_linear(self, request):
         allowed_methods = set()
 
         for resource in self._resources:
@@ -71,17 +550,36 @@ class Router(web_urldispatcher.UrlDispatcher):
                 return match_dict
             else:
                 allowed_methods |= allowed
+
+        return self._no_match(allowed_methods)
+
+    @staticmethod
+    def _no_match(allowed_methods: set):
+        if allowed_methods:
+            return web_urldispatcher.MatchInfoError(
+                MethodNotAllowed(allowed_methods))
         else:
-            if allowed_methods:
-                return web_urldispatcher.MatchInfoError(
-                    MethodNotAllowed(allowed_methods))
-            else:
-                return web_urldispatcher.MatchInfoError(
-                    ResourceNotFound())
+            return web_urldispatcher.MatchInfoError(
+                ResourceNotFound())
+
+    def register_resource(self, resource):
+        super().register_resource(resource)
+        self._tree = None
+
+    def add_resource(self, path, *, name=None):
+        resource = super().add_resource(path, name=name)
+
+        if isinstance(resource, web_urldispatcher.PlainResource):
+            self._paths[id(resource)] = resource._path
+        elif isinstance(resource, web_urldispatcher.DynamicResource):
+            self._paths[id(resource)] = path
+
+        return resource
 
     def add_route(self, method, path, handler,
                   *, name=None, expect_handler=None):
         resource = self.add_resource(path, name=name)
+        self._tree = None
         return resource.add_route(method, handler,
                                   expect_handler=_expect_handler)
 
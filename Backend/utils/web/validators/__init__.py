@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from . import base, auth, users, fandoms, blogs, posts, comments
+from . import base, auth, users, fandoms, blogs, posts, comments, batch
 from .validators import get_body, get_query
 
 __all__ = ('get_body', 'get_query', 'base', 'auth', 'users', 'fandoms',
-           'blogs', 'posts', 'comments')
+           'blogs', 'posts', 'comments', 'batch')
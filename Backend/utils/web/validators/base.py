@@ -1,9 +1,19 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from .validators import Validator, Field, qinteger
+from .validators import Validator, Field, Fieldsets, qinteger, cursor
 
 
 page = Validator(
-    Field(False, 'page', qinteger, default=0)
+    Field(False, 'after', cursor),
+    Field(False, 'limit', qinteger, default=20, mn=1, mx=100),
+    Fieldsets()
+)
+
+# Как page, но stream=1 отдает всю выборку потоком, без пагинации
+listing = Validator(
+    Field(False, 'after', cursor),
+    Field(False, 'limit', qinteger, default=20, mn=1, mx=100),
+    Field(False, 'stream', qinteger, default=0, mn=0, mx=1),
+    Fieldsets()
 )
@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from .validators import Validator, Array, Field, string, choice, anything
+
+
+request = Validator(
+    Field(True, 'method', choice,
+          values=('GET', 'POST', 'PUT', 'PATCH', 'DELETE')),
+    Field(True, 'path', string, mn=1, mx=2048),
+    Field(False, 'body', anything)
+)
+
+batch = Array(request, mn=1, mx=20)
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from .validators import Validator, Field, string, boolean
+from .validators import Validator, Field, Fieldsets, string, boolean, \
+    qinteger, cursor
 
 
 insert = Validator(
@@ -15,3 +16,12 @@ update = Validator(
 votes_insert = Validator(
     Field(True, 'vote', boolean)
 )
+
+# Как base.page, но tree=1 отдает ветку поста деревом до глубины depth
+thread = Validator(
+    Field(False, 'after', cursor),
+    Field(False, 'limit', qinteger, default=20, mn=1, mx=100),
+    Field(False, 'tree', qinteger, default=0, mn=0, mx=1),
+    Field(False, 'depth', qinteger, default=8, mn=1, mx=64),
+    Fieldsets()
+)
@@ -2,11 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import json
-from typing import Any, Callable
+import struct
+import binascii
+from typing import Any, Callable, Tuple
 
 from aiohttp.web_request import Request
 
 from ..exceptions import ValidationError, InvalidJson
+from ...db.models.base import Page
 
 
 class _ValErr(Exception):
@@ -35,12 +38,34 @@ def integer(val: Any) -> int:
     return val
 
 
-def qinteger(val: Any) -> int:
+def qinteger(val: Any, mn: int=None, mx: int=None) -> int:
     try:
-        return int(val)
+        val = int(val)
     except ValueError:
         raise _ValErr('Expected int, got str')
 
+    if mn is not None and mx is not None:
+        _check(mn <= val <= mx,
+               f'Must be between {mn} and {mx}. Got {val}')
+
+    return val
+
+
+def cursor(val: Any) -> tuple:
+    try:
+        return Page.decode(val)
+    except (ValueError, TypeError, binascii.Error, struct.error):
+        raise _ValErr('Invalid cursor')
+
+
+def choice(val: Any, values: tuple) -> str:
+    _check(val in values, f'Must be one of {", ".join(values)}')
+    return val
+
+
+def anything(val: Any) -> Any:
+    return val
+
 
 def boolean(val: Any) -> bool:
     _check(isinstance(val, bool), f'Expected bool, got {type(val).__name__}')
@@ -67,14 +92,34 @@ class Field:
         return self._func(val, **self._args)
 
 
+class Fieldsets(Field):
+    """fields[type]=a,b -> {type: (a, b)}; имена колонок проверяет модель"""
+
+    def __init__(self) -> None:
+        super().__init__(False, 'fields', None)
+
+    def __call__(self, obj: dict) -> dict:
+        resp = dict()
+
+        for key, val in obj.items():
+            if key.startswith('fields[') and key.endswith(']'):
+                resp[key[7:-1]] = tuple(
+                    x.strip() for x in val.split(',') if x.strip())
+
+        return resp
+
+
 class Validator:
     def __init__(self, *fields: Field) -> None:
         self._f = fields
 
-    def __call__(self, obj: dict) -> dict:
+    def parse(self, obj: dict) -> Tuple[dict, list]:
         resp = dict()
         errs = list()
 
+        if not isinstance(obj, dict):
+            return resp, [f'Expected object, got {type(obj).__name__}']
+
         for field in self._f:
             try:
                 parsed = field(obj)
@@ -84,6 +129,44 @@ class Validator:
 
             resp[field.name] = parsed
 
+        return resp, errs
+
+    def __call__(self, obj: dict) -> dict:
+        resp, errs = self.parse(obj)
+
+        if errs:
+            raise ValidationError(details=errs)
+
+        return resp
+
+
+class Array:
+    """Список объектов, каждый проверяется validator"""
+
+    def __init__(self, validator: Validator, mn: int, mx: int) -> None:
+        self._v = validator
+        self._mn = mn
+        self._mx = mx
+
+    def __call__(self, obj: list) -> list:
+        if not isinstance(obj, list):
+            raise ValidationError(
+                details=[f'Expected list, got {type(obj).__name__}'])
+
+        if not self._mn <= len(obj) <= self._mx:
+            raise ValidationError(details=[
+                f'Must contain between {self._mn} and {self._mx} items. '
+                f'Got {len(obj)}'])
+
+        resp = list()
+        errs = list()
+
+        for i, item in enumerate(obj):
+            parsed, item_errs = self._v.parse(item)
+
+            resp.append(parsed)
+            errs.extend(f'{i}.{x}' for x in item_errs)
+
         if errs:
             raise ValidationError(details=errs)
 
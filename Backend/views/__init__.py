@@ -9,6 +9,8 @@ from .fandoms import *  # noqa
 from .blogs import *  # noqa
 from .posts import *  # noqa
 from .comments import *  # noqa
+from .batches import *  # noqa
+from .internal import *  # noqa
 
 __all__ = (tests.__all__ +  # noqa
            root.__all__ +  # noqa
@@ -17,4 +19,6 @@ __all__ = (tests.__all__ +  # noqa
            fandoms.__all__ +  # noqa
            blogs.__all__ +  # noqa
            posts.__all__ +  # noqa
-           comments.__all__)  # noqa
+           comments.__all__ +  # noqa
+           batches.__all__ +  # noqa
+           internal.__all__)  # noqa
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import asyncio
+
+from aiohttp import hdrs
+from multidict import CIMultiDict
+
+from ..utils import db
+from ..utils.db.models.base import JsonResult
+from ..utils.web import json_response
+from ..utils.web import validators as v
+from ..utils.web.exceptions import ValidationError, InvalidJson
+
+__all__ = ('batch',)
+
+# Подзапросу не нужны ни сжатие, ни условный GET, ни тело родителя
+_SKIP_HEADERS = (hdrs.ACCEPT_ENCODING, hdrs.IF_NONE_MATCH,
+                 hdrs.CONTENT_LENGTH, hdrs.TRANSFER_ENCODING)
+
+
+def _check_paths(items: list):
+    errs = list()
+
+    for i, item in enumerate(items):
+        path = item['path']
+
+        if not path.startswith('/'):
+            errs.append(f'{i}.path: Must start with /')
+
+    if errs:
+        raise ValidationError(details=errs)
+
+
+def _check_subs(subs: list):
+    # Смотрим на разобранный запрос, как Router и view, а не на строку:
+    # /batch#x тоже придет в batch
+    errs = list()
+
+    for i, sub in enumerate(subs):
+        if sub.rel_url.raw_path.rstrip('/') == '/batch':
+            errs.append(f'{i}.path: Nested batches are not allowed')
+        # Поток ушел бы прямо в сокет, мимо общего ответа. stream=0 -
+        # обычный список
+        elif v.base.listing.parse(sub.query)[0].get('stream'):
+            errs.append(f'{i}.path: Streaming is not allowed in batches')
+
+    if errs:
+        raise ValidationError(details=errs)
+
+
+def _sub_request(template, conn, item: dict):
+    headers = CIMultiDict(template.headers)
+    for name in _SKIP_HEADERS:
+        headers.popall(name, None)
+    if item['body'] is not None:
+        headers[hdrs.CONTENT_TYPE] = 'application/json'
+
+    sub = template.clone(method=item['method'], rel_url=item['path'],
+                         headers=headers)
+    sub._read_bytes = b'' if item['body'] is None else \
+        json.dumps(item['body']).encode('utf-8')
+    sub.conn = conn
+
+    return sub
+
+
+async def _dispatch(request, sub) -> bytes:
+    # Тот же путь, что у обычного запроса: Router, middlewares, view
+    resp = await request.app._handle(sub)
+
+    if not resp.body:
+        body = b'null'
+    elif resp.content_type == 'application/json':
+        body = resp.body
+    else:
+        body = json.dumps(resp.text, ensure_ascii=False).encode('utf-8')
+
+    return b'{"status":%d,"body":' % resp.status + body + b'}'
+
+
+@json_response
+@db.deadline(30.0)
+@db.postgres
+async def batch(request):
+    """Несколько запросов за один: чтения подряд идут параллельно"""
+    # clone() запрещен после чтения тела, так что шаблон берем заранее
+    template = request.clone()
+
+    try:
+        items = v.batch.batch(await request.json())
+    except json.decoder.JSONDecodeError as exc:
+        raise InvalidJson(details=str(exc))
+
+    _check_paths(items)
+
+    conn = db.SharedConnection(request.conn, request.app.loop)
+    subs = [_sub_request(template, conn, x) for x in items]
+    _check_subs(subs)
+
+    results = list()
+
+    i = 0
+    while i < len(items):
+        j = i + 1
+        if items[i]['method'] == hdrs.METH_GET:
+            while j < len(items) and items[j]['method'] == hdrs.METH_GET:
+                j += 1
+
+        results.extend(await asyncio.gather(
+            *(_dispatch(request, x) for x in subs[i:j]),
+            loop=request.app.loop))
+        i = j
+
+    return JsonResult(results)
@@ -2,7 +2,8 @@
 # -*- coding: utf-8 -*-
 
 from ..utils.db import models as m, postgres
-from ..utils.web import BaseView, json_response, validators as v
+from ..utils.web import BaseView, json_response, conditional, compound, \
+    validators as v
 
 __all__ = ('BlogList', 'Blog', 'BlogHistory',
            'BlogModerList', 'BlogModer',
@@ -12,14 +13,22 @@ __all__ = ('BlogList', 'Blog', 'BlogHistory',
 
 class BlogList(BaseView):
     @json_response
+    @v.get_query(v.base.listing)
     @postgres
-    async def get(self):
-        return await m.Blog.select(self.request.conn, self.request.uid, 0)
+    @compound(m.Blog)
+    async def get(self, query):
+        if query.pop('stream'):
+            return m.Blog.stream(self.request.uid)
+
+        return await m.Blog.select(
+            self.request.conn, self.request.uid, 0, page=m.Page(**query))
 
 
 class Blog(BaseView):
     @json_response
     @postgres
+    @conditional(m.Blog, 'blog')
+    @compound(m.Blog)
     async def get(self):
         return await m.Blog.id_u(self.request)
 
@@ -32,16 +41,20 @@ class Blog(BaseView):
 
 class BlogHistory(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Blog.id_u(self.request)).history()
+    async def get(self, query):
+        return await (await m.Blog.id_u(self.request)).history(
+            page=m.Page(**query))
 
 
 class BlogModerList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Blog.id_u(self.request)).moders_select()
+    async def get(self, query):
+        return await (await m.Blog.id_u(self.request)).moders_select(
+            page=m.Page(**query))
 
     @json_response
     @v.get_body(v.blogs.moders_insert)
@@ -76,9 +89,11 @@ class BlogModer(BaseView):
 
 class BlogBannedList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Blog.id_u(self.request)).bans_select()
+    async def get(self, query):
+        return await (await m.Blog.id_u(self.request)).bans_select(
+            page=m.Page(**query))
 
     @json_response
     @v.get_body(v.blogs.bans_insert)
@@ -103,9 +118,12 @@ class BlogBanned(BaseView):
 
 class BlogPostList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Blog.id_u(self.request)).posts_select()
+    @compound(m.Post)
+    async def get(self, query):
+        return await (await m.Blog.id_u(self.request)).posts_select(
+            page=m.Page(**query))
 
     @json_response
     @v.get_body(v.posts.insert)
@@ -119,6 +137,9 @@ class BlogPostList(BaseView):
 
 class BlogCommentList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Blog.id_u(self.request)).comments_select()
+    @compound(m.Comment)
+    async def get(self, query):
+        return await (await m.Blog.id_u(self.request)).comments_select(
+            page=m.Page(**query))
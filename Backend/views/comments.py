@@ -2,7 +2,8 @@
 # -*- coding: utf-8 -*-
 
 from ..utils.db import models as m, postgres
-from ..utils.web import BaseView, json_response, validators as v
+from ..utils.web import BaseView, json_response, conditional, compound, \
+    validators as v
 
 __all__ = ('CommentList', 'Comment', 'CommentAnswers', 'CommentHistory',
            'CommentVoteList')
@@ -10,15 +11,23 @@ __all__ = ('CommentList', 'Comment', 'CommentAnswers', 'CommentHistory',
 
 class CommentList(BaseView):
     @json_response
+    @v.get_query(v.base.listing)
     @postgres
-    async def get(self):
+    @compound(m.Comment)
+    async def get(self, query):
+        if query.pop('stream'):
+            return m.Comment.stream(self.request.uid)
+
         return await m.Comment.select(
-            self.request.conn, self.request.uid, 0, 0, 0)
+            self.request.conn, self.request.uid, 0, 0, 0,
+            page=m.Page(**query))
 
 
 class Comment(BaseView):
     @json_response
     @postgres
+    @conditional(m.Comment, 'comment')
+    @compound(m.Comment)
     async def get(self):
         return await m.Comment.id_u(self.request)
 
@@ -31,9 +40,12 @@ class Comment(BaseView):
 
 class CommentAnswers(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Comment.id_u(self.request)).answers()
+    @compound(m.Comment)
+    async def get(self, query):
+        return await (await m.Comment.id_u(self.request)).answers(
+            page=m.Page(**query))
 
     @json_response
     @v.get_body(v.comments.insert)
@@ -47,16 +59,20 @@ class CommentAnswers(BaseView):
 
 class CommentHistory(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Comment.id_u(self.request)).history()
+    async def get(self, query):
+        return await (await m.Comment.id_u(self.request)).history(
+            page=m.Page(**query))
 
 
 class CommentVoteList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Comment.id_u(self.request)).votes_select()
+    async def get(self, query):
+        return await (await m.Comment.id_u(self.request)).votes_select(
+            page=m.Page(**query))
 
     @json_response
     @v.get_body(v.comments.votes_insert)
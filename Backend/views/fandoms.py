@@ -2,7 +2,8 @@
 # -*- coding: utf-8 -*-
 
 from ..utils.db import models as m, postgres
-from ..utils.web import BaseView, json_response, validators as v
+from ..utils.web import BaseView, json_response, conditional, compound, \
+    validators as v
 
 __all__ = ('FandomList', 'Fandom', 'FandomHistory',
            'FandomModerList', 'FandomModer',
@@ -13,9 +14,11 @@ __all__ = ('FandomList', 'Fandom', 'FandomHistory',
 
 class FandomList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await m.Fandom.select(self.request.conn, self.request.uid)
+    async def get(self, query):
+        return await m.Fandom.select(
+            self.request.conn, self.request.uid, page=m.Page(**query))
 
     @json_response
     @v.get_body(v.fandoms.insert)
@@ -32,6 +35,7 @@ class FandomList(BaseView):
 class Fandom(BaseView):
     @json_response
     @postgres
+    @conditional(m.Fandom, 'fandom')
     async def get(self):
         return await m.Fandom.id_u(self.request)
 
@@ -44,16 +48,20 @@ class Fandom(BaseView):
 
 class FandomHistory(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Fandom.id_u(self.request)).history()
+    async def get(self, query):
+        return await (await m.Fandom.id_u(self.request)).history(
+            page=m.Page(**query))
 
 
 class FandomModerList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Fandom.id_u(self.request)).moders_select()
+    async def get(self, query):
+        return await (await m.Fandom.id_u(self.request)).moders_select(
+            page=m.Page(**query))
 
     @json_response
     @v.get_body(v.fandoms.moders_insert)
@@ -88,9 +96,11 @@ class FandomModer(BaseView):
 
 class FandomBannedList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Fandom.id_u(self.request)).bans_select()
+    async def get(self, query):
+        return await (await m.Fandom.id_u(self.request)).bans_select(
+            page=m.Page(**query))
 
     @json_response
     @v.get_body(v.fandoms.bans_insert)
@@ -118,9 +128,12 @@ class FandomBanned(BaseView):
 
 class FandomBlogList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Fandom.id_u(self.request)).blogs_select()
+    @compound(m.Blog)
+    async def get(self, query):
+        return await (await m.Fandom.id_u(self.request)).blogs_select(
+            page=m.Page(**query))
 
     @json_response
     @v.get_body(v.blogs.insert)
@@ -135,6 +148,7 @@ class FandomBlogList(BaseView):
 class FandomBlog(BaseView):
     @json_response
     @postgres
+    @compound(m.Blog)
     async def get(self):
         return await (await m.Fandom.id_u(self.request)).blogs_id_u(
             self.request)
@@ -142,13 +156,19 @@ class FandomBlog(BaseView):
 
 class FandomPostList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Fandom.id_u(self.request)).posts_select()
+    @compound(m.Post)
+    async def get(self, query):
+        return await (await m.Fandom.id_u(self.request)).posts_select(
+            page=m.Page(**query))
 
 
 class FandomCommentList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Fandom.id_u(self.request)).comments_select()
+    @compound(m.Comment)
+    async def get(self, query):
+        return await (await m.Fandom.id_u(self.request)).comments_select(
+            page=m.Page(**query))
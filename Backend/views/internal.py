@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from ..utils.db import metrics as m
+from ..utils.web import json_response
+
+__all__ = ('metrics',)
+
+
+@json_response
+async def metrics(request):
+    """Метрики воркера, который принял запрос (наружу nginx не пускает)"""
+    return m.snapshot()
@@ -2,7 +2,8 @@
 # -*- coding: utf-8 -*-
 
 from ..utils.db import models as m, postgres
-from ..utils.web import BaseView, json_response, validators as v
+from ..utils.web import BaseView, json_response, conditional, compound, \
+    validators as v
 
 __all__ = ('PostList', 'Post', 'PostHistory', 'PostVoteList',
            'PostCommentList')
@@ -10,14 +11,22 @@ __all__ = ('PostList', 'Post', 'PostHistory', 'PostVoteList',
 
 class PostList(BaseView):
     @json_response
+    @v.get_query(v.base.listing)
     @postgres
-    async def get(self):
-        return await m.Post.select(self.request.conn, self.request.uid, 0, 0)
+    @compound(m.Post)
+    async def get(self, query):
+        if query.pop('stream'):
+            return m.Post.stream(self.request.uid)
+
+        return await m.Post.select(
+            self.request.conn, self.request.uid, 0, 0, page=m.Page(**query))
 
 
 class Post(BaseView):
     @json_response
     @postgres
+    @conditional(m.Post, 'post')
+    @compound(m.Post)
     async def get(self):
         return await m.Post.id_u(self.request)
 
@@ -30,16 +39,20 @@ class Post(BaseView):
 
 class PostHistory(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Post.id_u(self.request)).history()
+    async def get(self, query):
+        return await (await m.Post.id_u(self.request)).history(
+            page=m.Page(**query))
 
 
 class PostVoteList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.Post.id_u(self.request)).votes_select()
+    async def get(self, query):
+        return await (await m.Post.id_u(self.request)).votes_select(
+            page=m.Page(**query))
 
     @json_response
     @v.get_body(v.posts.votes_insert)
@@ -52,9 +65,17 @@ class PostVoteList(BaseView):
 
 class PostCommentList(BaseView):
     @json_response
+    @v.get_query(v.comments.thread)
     @postgres
-    async def get(self):
-        return await (await m.Post.id_u(self.request)).comments_select()
+    @compound(m.Comment)
+    async def get(self, query):
+        post = await m.Post.id_u(self.request)
+        depth = query.pop('depth')
+
+        if query.pop('tree'):
+            return await post.comments_thread(depth, page=m.Page(**query))
+
+        return await post.comments_select(page=m.Page(**query))
 
     @json_response
     @v.get_body(v.comments.insert)
@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from ..utils.db import db
+from ..utils.db import db, statements as stmts
 from ..utils.web import json_response
 
-__all__ = ('clear_db', 'execute', 'logout')
+__all__ = ('clear_db', 'execute', 'statements', 'logout')
 
 
 @json_response
@@ -28,3 +28,7 @@ async def execute(request):
 
     return dict(sql=sql)
 
+
+@json_response
+async def statements(request):
+    return dict(statements=stmts.stats())
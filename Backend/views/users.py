@@ -2,7 +2,8 @@
 # -*- coding: utf-8 -*-
 
 from ..utils.db import models as m, postgres
-from ..utils.web import BaseView, json_response, validators as v
+from ..utils.web import BaseView, json_response, conditional, compound, \
+    validators as v
 
 __all__ = ('UserList', 'User', 'UserHistory', 'UserBlogList', 'UserPostList',
            'UserCommentList')
@@ -14,12 +15,13 @@ class UserList(BaseView):
     @postgres
     async def get(self, query):
         return await m.User.select(
-            self.request.conn, self.request.uid, page=query['page'])
+            self.request.conn, self.request.uid, page=m.Page(**query))
 
 
 class User(BaseView):
     @json_response
     @postgres
+    @conditional(m.User, 'user')
     async def get(self):
         return await m.User.id_u(self.request)
 
@@ -32,27 +34,38 @@ class User(BaseView):
 
 class UserHistory(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.User.id_u(self.request)).history()
+    async def get(self, query):
+        return await (await m.User.id_u(self.request)).history(
+            page=m.Page(**query))
 
 
 class UserBlogList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.User.id_u(self.request)).blogs()
+    @compound(m.Blog)
+    async def get(self, query):
+        return await (await m.User.id_u(self.request)).blogs(
+            page=m.Page(**query))
 
 
 class UserPostList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.User.id_u(self.request)).posts()
+    @compound(m.Post)
+    async def get(self, query):
+        return await (await m.User.id_u(self.request)).posts(
+            page=m.Page(**query))
 
 
 class UserCommentList(BaseView):
     @json_response
+    @v.get_query(v.base.page)
     @postgres
-    async def get(self):
-        return await (await m.User.id_u(self.request)).comments()
+    @compound(m.Comment)
+    async def get(self, query):
+        return await (await m.User.id_u(self.request)).comments(
+            page=m.Page(**query))
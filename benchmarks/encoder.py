@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Пропускная способность движков JSON на типичных ответах /posts и /comments.
+
+    python3 -m benchmarks.encoder
+
+legacy - прежний Encoder(indent=4) с диспетчеризацией через default().
+"""
+
+import json
+import time
+from datetime import datetime, timezone
+
+from Backend.utils.db import models as m
+from Backend.utils.db.models.base import SelectResult
+from Backend.utils.web import rewrites
+
+ROWS = 500
+ROUNDS = 20
+
+
+class _Legacy(json.JSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        elif isinstance(o, m.Post) or isinstance(o, m.Comment):
+            return o._data
+        super().default(o)
+
+
+def _legacy(body) -> bytes:
+    return _Legacy(indent=4).encode(
+        {'status': 'success', 'data': body}).encode('utf-8')
+
+
+def _row(i: int, **extra) -> dict:
+    now = datetime.now(timezone.utc)
+    return dict(id=i, created_at=now, edited_at=now, edited_by=i,
+                blog_id=1, fandom_id=1, owner=i, votes_up=i, votes_down=0,
+                **extra)
+
+
+def _payloads() -> dict:
+    posts = SelectResult(m.Post(_row(
+        i, title='Заголовок поста', content='Текст поста. ' * 200))
+        for i in range(ROWS))
+    comments = SelectResult(m.Comment(_row(
+        i, post_id=1, parent_id=0, content='Комментарий. ' * 10))
+        for i in range(ROWS))
+
+    return dict(posts=posts, comments=comments)
+
+
+def _measure(func, body) -> tuple:
+    size = len(func(body))
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(body)
+    spent = time.perf_counter() - start
+
+    return size, ROWS * ROUNDS / spent, size * ROUNDS / spent / 2 ** 20
+
+
+def main():
+    engines = dict(legacy=_legacy)
+    for cls in (rewrites.JsonEngine, rewrites.OrjsonEngine):
+        try:
+            engine = cls()
+        except ImportError:
+            continue
+
+        engines[cls.name] = lambda body, engine=engine: engine.dumps(
+            {'status': 'success', 'data': [x._data for x in body]})
+
+    print(f'{"payload":>9} {"engine":>8} {"bytes":>9} '
+          f'{"rows/s":>10} {"MiB/s":>8}')
+    for name, body in _payloads().items():
+        for engine, func in engines.items():
+            size, rows, mib = _measure(func, body)
+            print(f'{name:>9} {engine:>8} {size:>9} {rows:>10.0f} {mib:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Лента блога: SELECT * против fields[posts]=title,owner,votes_up.
+
+    python3 -m benchmarks.fieldsets
+
+Берет db_* из окружения (как manage.py run). Блог на POSTS постов по
+~CONTENT символов создается внутри транзакции, которая в конце
+откатывается. Лента проходится целиком страницами по LIMIT.
+"""
+
+import os
+import time
+import asyncio
+
+import asyncpg
+
+from Backend.utils.db import models as m, statements
+from Backend.utils.web import rewrites
+
+POSTS = 10000
+CONTENT = 60000
+LIMIT = 100
+ROUNDS = 3
+
+
+async def _seed(conn) -> int:
+    blog = await conn.fetchval(
+        "SELECT blogs_create(1, 1, 'bench-blog', 'Bench', '', '')")
+
+    # Случайный текст, чтобы TOAST не сжал его в ничто
+    await conn.execute(
+        "SELECT posts_create(1, $1, 1, 'Post ' || i, "
+        "(SELECT string_agg(md5(random()::TEXT), '') "
+        " FROM generate_series(1, $2 / 32 + i * 0))) "
+        "FROM generate_series(1, $3) AS i",
+        blog, CONTENT, POSTS)
+
+    return blog
+
+
+async def _walk(conn, blog: int, fields: dict) -> tuple:
+    start = time.perf_counter()
+    size = 0
+
+    for _ in range(ROUNDS):
+        after = None
+
+        while True:
+            page = m.Page(after=after, limit=LIMIT, fields=fields)
+            resp = await m.Post.select(conn, 0, blog, 0, page=page)
+            size += len(rewrites._render(resp, 'success', None, False))
+
+            if resp.cursor is None:
+                break
+            after = m.Page.decode(resp.cursor)
+
+    pages = ROUNDS * -(-POSTS // LIMIT)
+
+    return ((time.perf_counter() - start) / pages * 1e3,
+            size / pages / 1024)
+
+
+async def main():
+    conn = await asyncpg.connect(
+        host=os.environ['db_host'], port=int(os.environ['db_port']),
+        database=os.environ['db_database'], user=os.environ['db_user'],
+        password=os.environ['db_password'],
+        server_settings={'timezone': 'UTC'},
+        connection_class=statements.Connection)
+
+    tr = conn.transaction()
+    await tr.start()
+
+    try:
+        blog = await _seed(conn)
+        await conn.execute('ANALYZE posts')
+
+        print(f'{"fields":>22} {"ms/page":>9} {"KiB/page":>9}')
+        for name, fields in (
+                ('*', None),
+                ('title,owner,votes_up',
+                 {'posts': ('title', 'owner', 'votes_up')})):
+            ms, kib = await _walk(conn, blog, fields)
+            print(f'{name:>22} {ms:>9.2f} {kib:>9.1f}')
+    finally:
+        await tr.rollback()
+        await conn.close()
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Создание постов под нагрузкой: perms() + posts_create против одного
+вызова posts_create_guarded.
+
+    python3 -m benchmarks.guarded_writes
+
+Берет db_* из окружения (как manage.py run). CONCURRENCY корутин
+DURATION секунд создают посты через пул в POOL соединений (как pool_max).
+Кэш прав не запущен, как у первого запроса юзера. Посты коммитятся и
+удаляются в конце.
+"""
+
+import os
+import time
+import asyncio
+
+import asyncpg
+
+from Backend.utils.db import models as m, statements
+from Backend.utils.db.models import checks as C
+
+CONCURRENCY = 50
+DURATION = 10
+POOL = 20
+
+_USER = 10 ** 9
+_FANDOM = 1
+
+
+async def _checks(conn, blog: int):
+    # Прежний Post.insert: проверка отдельным запросом, потом вставка
+    if await C.perms(conn, _USER, blog, _FANDOM) & \
+            (C.BLOG_BANNED | C.FANDOM_BANNED):
+        raise RuntimeError('banned')
+
+    return await conn.fetchval(
+        "SELECT posts_create($1, $2, $3, 'Bench', '')",
+        _USER, blog, _FANDOM)
+
+
+async def _guarded(conn, blog: int):
+    return await m.Post.insert(
+        conn, _USER, blog, _FANDOM, dict(title='Bench', content=''))
+
+
+async def _run(pool, blog: int, write) -> tuple:
+    times = list()
+    end = time.perf_counter() + DURATION
+
+    async def writer():
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            async with pool.acquire() as conn:
+                await write(conn, blog)
+            times.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(writer() for _ in range(CONCURRENCY)))
+
+    times.sort()
+
+    return (len(times) / DURATION, times[len(times) // 2] * 1e3,
+            times[int(len(times) * 0.99)] * 1e3)
+
+
+async def main():
+    pool = await asyncpg.create_pool(
+        host=os.environ['db_host'], port=int(os.environ['db_port']),
+        database=os.environ['db_database'], user=os.environ['db_user'],
+        password=os.environ['db_password'], min_size=POOL, max_size=POOL,
+        server_settings={'timezone': 'UTC'},
+        connection_class=statements.Connection,
+        init=statements.Connection.prepare_all)
+
+    blog = await pool.fetchval(
+        "SELECT blogs_create($1, $2, 'bench-guarded', 'Bench', '', '')",
+        _USER, _FANDOM)
+
+    try:
+        print(f'{"insert":>8} {"posts/s":>9} {"p50, ms":>9} {"p99, ms":>9}')
+        for name, write in (('checks', _checks), ('guarded', _guarded)):
+            rate, p50, p99 = await _run(pool, blog, write)
+            print(f'{name:>8} {rate:>9.0f} {p50:>9.2f} {p99:>9.2f}')
+    finally:
+        await pool.execute("DELETE FROM posts WHERE blog_id = $1", blog)
+        await pool.execute("DELETE FROM blogs WHERE id = $1", blog)
+        await pool.close()
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Списки /posts и /comments: Record -> Obj -> engine против JSON из Postgres.
+
+    python3 -m benchmarks.pg_json
+
+Берет db_* из окружения (как manage.py run). Данные создаются внутри
+транзакции, которая в конце откатывается.
+"""
+
+import os
+import time
+import asyncio
+
+import asyncpg
+
+from Backend.utils.db import models as m, statements
+from Backend.utils.db.models import base
+from Backend.utils.web import rewrites
+
+ROWS = 2000
+LIMIT = 100
+ROUNDS = 50
+
+
+async def _seed(conn):
+    blog = await conn.fetchval(
+        "SELECT blogs_create(1, 1, 'bench-blog', 'Bench', '', '')")
+
+    for i in range(ROWS):
+        post = await conn.fetchval(
+            "SELECT posts_create(1, $1, 1, $2, $3)",
+            blog, f'Post {i}', 'Текст поста. ' * 100)
+        await conn.fetchval(
+            "SELECT comments_create(1, $1, $2, 1, 0, $3)",
+            post, blog, 'Комментарий. ' * 10)
+
+
+async def _measure(conn, select) -> float:
+    start = time.perf_counter()
+
+    for _ in range(ROUNDS):
+        resp = await select(conn, 0, m.Page(limit=LIMIT))
+        rewrites._render(resp, 'success', None, False)
+
+    return (time.perf_counter() - start) / ROUNDS * 1e3
+
+
+async def main():
+    conn = await asyncpg.connect(
+        host=os.environ['db_host'], port=int(os.environ['db_port']),
+        database=os.environ['db_database'], user=os.environ['db_user'],
+        password=os.environ['db_password'],
+        server_settings={'timezone': 'UTC'},
+        connection_class=statements.Connection)
+
+    selects = dict(
+        posts=lambda c, u, p: m.Post.select(c, u, 0, 0, page=p),
+        comments=lambda c, u, p: m.Comment.select(c, u, 0, 0, 0, page=p))
+
+    tr = conn.transaction()
+    await tr.start()
+
+    try:
+        await _seed(conn)
+
+        print(f'{"list":>9} {"python, ms":>11} {"postgres, ms":>13}')
+        for name, select in selects.items():
+            base.pg_json(False)
+            python = await _measure(conn, select)
+            base.pg_json(True)
+            postgres = await _measure(conn, select)
+
+            print(f'{name:>9} {python:>11.2f} {postgres:>13.2f}')
+    finally:
+        await tr.rollback()
+        await conn.close()
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
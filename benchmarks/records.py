@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Obj поверх Record (__slots__) против прежнего Obj с копированием в dict.
+
+    python3 -m benchmarks.records
+
+Берет db_* из окружения (как manage.py run). Строки в форме comments
+генерирует сам Postgres, таблицы не нужны. Время - создание объектов и
+рендер ответа, память - пик tracemalloc на удержание страницы объектов.
+"""
+
+import os
+import time
+import asyncio
+import tracemalloc
+
+import asyncpg
+
+from Backend.utils.db import models as m
+from Backend.utils.db.models.base import SelectResult
+from Backend.utils.web import rewrites
+
+ROWS = 5000
+ROUNDS = 20
+
+SQL = "SELECT i::BIGINT AS id, now() AS created_at, now() AS edited_at, " \
+      "1::BIGINT AS edited_by, i::BIGINT AS post_id, 1::BIGINT AS blog_id, " \
+      "1::BIGINT AS fandom_id, 1::BIGINT AS owner, 0::BIGINT AS parent_id, " \
+      "repeat('Комментарий. ', 10) AS content, 0 AS votes_up, " \
+      "0 AS votes_down FROM generate_series(1, $1) AS i"
+
+
+class LegacyComment:
+    """Obj до перехода на __slots__: dict(record) + _map"""
+
+    _type = m.Comment._type
+    _meta = m.Comment._meta
+
+    def __init__(self, data, conn=None, user_id=None):
+        self._data = self._map(dict(data))
+        self._conn = conn
+        self._uid = user_id
+
+    @classmethod
+    def _map(cls, data: dict) -> dict:
+        resp = dict(type=cls._type, id=data.pop('id'))
+
+        if cls._meta is not None:
+            _m = {x: data.pop(x) for x in cls._meta if x in data}
+            if _m:
+                resp['meta'] = _m
+
+        resp['attributes'] = data
+
+        return resp
+
+
+def _page(cls, rows):
+    return SelectResult(cls(x) for x in rows)
+
+
+def _measure(cls, rows) -> tuple:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        page = _page(cls, rows)
+    build = (time.perf_counter() - start) / ROUNDS * 1e3
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        rewrites._render(_page(cls, rows), 'success', None, False)
+    total = (time.perf_counter() - start) / ROUNDS * 1e3
+
+    del page
+    tracemalloc.start()
+    page = _page(cls, rows)  # noqa
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return build, total, peak / 1024
+
+
+async def main():
+    conn = await asyncpg.connect(
+        host=os.environ['db_host'], port=int(os.environ['db_port']),
+        database=os.environ['db_database'], user=os.environ['db_user'],
+        password=os.environ['db_password'],
+        server_settings={'timezone': 'UTC'})
+
+    try:
+        rows = await conn.fetch(SQL, ROWS)
+    finally:
+        await conn.close()
+
+    print(f'{"obj":>8} {"build, ms":>10} {"+render, ms":>12} {"KiB":>9}')
+    for name, cls in (('legacy', LegacyComment), ('slots', m.Comment)):
+        build, total, kib = _measure(cls, rows)
+        print(f'{name:>8} {build:>10.2f} {total:>12.2f} {kib:>9.0f}')
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Сравнение Router.resolve в линейном и скомпилированном режимах.
+
+    python3 -m benchmarks.router
+
+Для каждого размера таблицы регистрируется N одинаковых по форме
+групп маршрутов, после чего резолвится путь из последней группы -
+худший случай для линейного обхода.
+"""
+
+import time
+import asyncio
+
+from aiohttp.test_utils import make_mocked_request
+
+from Backend.utils.web import Router
+
+SIZES = (10, 50, 100, 500, 1000)
+ROUNDS = 2000
+
+
+async def _handler(request):
+    pass
+
+
+def _router(compiled: bool, groups: int) -> Router:
+    router = Router(compiled=compiled)
+
+    for i in range(groups):
+        router.add_route('*', f'/r{i}', _handler)
+        router.add_route('*', f'/r{i}/{{item:\\w+}}', _handler)
+        router.add_route('*', f'/r{i}/{{item:\\w+}}/votes', _handler)
+        router.add_route('*', f'/r{i}/{{item:(\\w+)|(u\\/\\w+)}}/history',
+                         _handler)
+
+    router.compile()
+    return router
+
+
+async def _measure(router: Router, path: str) -> float:
+    request = make_mocked_request('GET', path)
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await router.resolve(request)
+
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def main():
+    loop = asyncio.get_event_loop()
+
+    print(f'{"routes":>8} {"linear, us":>12} {"compiled, us":>14}')
+    for size in SIZES:
+        path = f'/r{size - 1}/u/someone/history'
+        linear = loop.run_until_complete(
+            _measure(_router(False, size), path))
+        compiled = loop.run_until_complete(
+            _measure(_router(True, size), path))
+
+        print(f'{size * 4:>8} {linear:>12.2f} {compiled:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Участок nginx -> бэкенд: TCP на loopback против unix-сокета, с keepalive
+и без.
+
+    python3 -m benchmarks.upstream
+
+Сервер - отдельный процесс с тем же Router и JsonResponse, но без базы
+(маршрут '/'), так что разница приходится на соединения. 'tcp, close' -
+то, как nginx ходил в бэкенд раньше, 'unix, keepalive' - сейчас.
+"""
+
+import os
+import time
+import signal
+import socket
+import asyncio
+import tempfile
+
+import uvloop
+import aiohttp
+from aiohttp import web
+
+from Backend import views
+from Backend.main import _unix_socket
+from Backend.utils.web import Router
+
+REQUESTS = 20000
+CONCURRENCY = 64
+
+
+def _serve(port: int, path: str):
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    app = web.Application(loop=loop, router=Router())
+    app.router.add_route('*', '/', views.root.Root)
+    app.router.compile()
+
+    handler = app.make_handler(access_log=None)
+    loop.run_until_complete(loop.create_server(handler, '127.0.0.1', port))
+    loop.run_until_complete(loop.create_unix_server(
+        handler, sock=_unix_socket(path)))
+
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    loop.run_forever()
+
+
+async def _load(loop, connector, url: str) -> float:
+    left = REQUESTS
+
+    async def client(session):
+        nonlocal left
+        while left > 0:
+            left -= 1
+            async with session.get(url) as resp:
+                await resp.read()
+
+    async with aiohttp.ClientSession(connector=connector, loop=loop) as s:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(s) for _ in range(CONCURRENCY)),
+                             loop=loop)
+
+        return REQUESTS / (time.perf_counter() - start)
+
+
+def main():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    path = os.path.join(tempfile.mkdtemp(), 'backend.sock')
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _serve(port, path)
+        finally:
+            os._exit(0)
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    loop = asyncio.get_event_loop()
+
+    while not os.path.exists(path):
+        time.sleep(0.05)
+
+    tcp = f'http://127.0.0.1:{port}/'
+    unix = 'http://backend/'
+
+    modes = (
+        ('tcp, close', lambda: aiohttp.TCPConnector(
+            force_close=True, limit=CONCURRENCY, loop=loop), tcp),
+        ('tcp, keepalive', lambda: aiohttp.TCPConnector(
+            limit=CONCURRENCY, loop=loop), tcp),
+        ('unix, close', lambda: aiohttp.UnixConnector(
+            path, force_close=True, limit=CONCURRENCY, loop=loop), unix),
+        ('unix, keepalive', lambda: aiohttp.UnixConnector(
+            path, limit=CONCURRENCY, loop=loop), unix),
+    )
+
+    try:
+        print(f'{"upstream":>16} {"req/s":>9}')
+        for name, connector, url in modes:
+            rps = loop.run_until_complete(_load(loop, connector(), url))
+            print(f'{name:>16} {rps:>9.0f}')
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Голоса под постоянной нагрузкой: слоты счетчиков против буфера воркера.
+
+    python3 -m benchmarks.vote_buffer
+
+Берет db_* из окружения (как manage.py run). CONCURRENCY корутин
+DURATION секунд голосуют через PostVote.insert за POSTS постов случайными
+юзерами, буфер сбрасывается раз в FLUSH_MS, как в DB. В конце счетчики
+сверяются с числом голосов (drift) и все созданное удаляется.
+"""
+
+import os
+import time
+import random
+import asyncio
+
+import asyncpg
+
+from Backend.utils.db import models as m, statements, votes
+
+POSTS = 10
+USERS = 100000
+CONCURRENCY = 200
+DURATION = 10
+FLUSH_MS = 100
+POOL = 20
+
+# Первые 1e9 id оставлены настоящим юзерам
+_USER = 10 ** 9
+
+
+async def _flush(pool):
+    async with pool.acquire() as conn:
+        for buffer in votes.buffers:
+            await buffer.flush(conn)
+
+
+async def _flusher(pool, stop: asyncio.Event):
+    while not stop.is_set():
+        await asyncio.sleep(FLUSH_MS / 1e3)
+        await _flush(pool)
+
+
+async def _reset(pool, posts: list):
+    await pool.execute(
+        "DELETE FROM posts_votes WHERE target_id = ANY($1)", posts)
+    await pool.execute(
+        "DELETE FROM posts_vote_slots WHERE target_id = ANY($1)", posts)
+    await pool.execute(
+        "UPDATE posts SET votes_up = 0, votes_down = 0 WHERE id = ANY($1)",
+        posts)
+
+
+async def _drift(pool, posts: list) -> int:
+    return await pool.fetchval(
+        "SELECT (SELECT sum(votes_up + votes_down) FROM posts_counted "
+        "        WHERE id = ANY($1)) - "
+        "       (SELECT count(*) FROM posts_votes WHERE target_id = ANY($1))",
+        posts)
+
+
+async def _run(pool, blog: int, posts: list, buffered: bool) -> tuple:
+    await _reset(pool, posts)
+    votes.posts.active = buffered
+    stop = asyncio.Event()
+    flusher = asyncio.ensure_future(_flusher(pool, stop)) \
+        if buffered else None
+
+    times = list()
+    end = time.perf_counter() + DURATION
+
+    async def voter():
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            async with pool.acquire() as conn:
+                await m.PostVote.insert(
+                    conn, _USER + random.randrange(USERS),
+                    random.choice(posts), blog, 1,
+                    dict(vote=random.random() < 0.8))
+            times.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(voter() for _ in range(CONCURRENCY)))
+
+    if flusher is not None:
+        stop.set()
+        await flusher
+        await _flush(pool)
+    votes.posts.active = False
+
+    times.sort()
+
+    return (len(times) / DURATION, times[int(len(times) * 0.99)] * 1e3,
+            await _drift(pool, posts))
+
+
+async def main():
+    pool = await asyncpg.create_pool(
+        host=os.environ['db_host'], port=int(os.environ['db_port']),
+        database=os.environ['db_database'], user=os.environ['db_user'],
+        password=os.environ['db_password'], min_size=POOL, max_size=POOL,
+        server_settings={'timezone': 'UTC'},
+        connection_class=statements.Connection)
+
+    blog = await pool.fetchval(
+        "SELECT blogs_create(1, 1, 'bench-vote-buffer', 'Bench', '', '')")
+    posts = [await pool.fetchval(
+        "SELECT posts_create(1, $1, 1, 'Bench', '')", blog)
+        for _ in range(POSTS)]
+
+    try:
+        print(f'{"counters":>9} {"votes/s":>9} {"p99, ms":>9} {"drift":>6}')
+        for name, buffered in (('slots', False), ('buffer', True)):
+            rate, p99, drift = await _run(pool, blog, posts, buffered)
+            print(f'{name:>9} {rate:>9.0f} {p99:>9.2f} {drift:>6}')
+    finally:
+        await _reset(pool, posts)
+        await pool.execute("DELETE FROM posts WHERE id = ANY($1)", posts)
+        await pool.execute("DELETE FROM blogs WHERE id = $1", blog)
+        await pool.close()
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
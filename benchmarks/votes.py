@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Голоса за один пост: EXCEPTION-функция, INSERT ... ON CONFLICT со
+сдвигом счетчика в строке поста и он же со слотами счетчиков.
+
+    python3 -m benchmarks.votes
+
+Берет db_* из окружения (как manage.py run). VOTERS юзеров голосуют
+одновременно через пул в POOL соединений (как pool_max): сначала за, потом
+против - вторая половина голосов идет по ветке повторного голоса. Пост и
+голоса коммитятся (иначе нет конкуренции) и удаляются в конце.
+"""
+
+import os
+import time
+import asyncio
+
+import asyncpg
+
+from Backend.utils.db import models as m, statements
+
+VOTERS = 1000
+POOL = 20
+ROUNDS = 3
+
+# Первые 1e9 id оставлены настоящим юзерам
+_USER = 10 ** 9
+
+# posts_vote из e430be9a4bf1, временной функцией в каждом соединении
+_OLD = """
+CREATE FUNCTION pg_temp.posts_vote_old (
+  user_id BIGINT, target_id BIGINT, vote BOOLEAN
+) RETURNS void AS $$
+  #variable_conflict use_variable
+  BEGIN
+    INSERT INTO posts_votes VALUES (target_id, user_id, vote);
+    IF vote THEN
+      UPDATE posts SET votes_up = votes_up + 1 WHERE id = target_id;
+    ELSE
+      UPDATE posts SET votes_down = votes_down + 1 WHERE id = target_id;
+    END IF;
+  EXCEPTION
+    WHEN unique_violation THEN
+      UPDATE posts_votes SET vote = vote WHERE target_id = target_id
+      AND user_id = user_id AND vote != vote;
+      IF FOUND THEN
+        IF vote THEN
+          UPDATE posts SET votes_up = votes_up + 1, votes_down = votes_down - 1
+          WHERE id = target_id;
+        ELSE
+          UPDATE posts SET votes_up = votes_up - 1, votes_down = votes_down + 1
+          WHERE id = target_id;
+        END IF;
+      END IF;
+  END;
+$$ LANGUAGE plpgsql
+"""
+
+# posts_vote из 2d6f0c9a8e15: все голосующие ждут блокировку строки поста
+_ROW = """
+CREATE FUNCTION pg_temp.posts_vote_row (
+  user_id BIGINT, target_id BIGINT, vote BOOLEAN
+) RETURNS void AS $$
+  WITH v AS (
+    INSERT INTO posts_votes AS pv (target_id, user_id, vote)
+    VALUES ($2, $1, $3)
+    ON CONFLICT (target_id, user_id) DO UPDATE SET vote = EXCLUDED.vote
+    WHERE pv.vote != EXCLUDED.vote
+    RETURNING pv.xmax = 0 AS created
+  )
+  UPDATE posts SET
+    votes_up = votes_up +
+      CASE WHEN $3 THEN 1 WHEN v.created THEN 0 ELSE -1 END,
+    votes_down = votes_down +
+      CASE WHEN NOT $3 THEN 1 WHEN v.created THEN 0 ELSE -1 END
+  FROM v WHERE posts.id = $2
+$$ LANGUAGE sql
+"""
+
+
+async def _init(conn):
+    await conn.execute(_OLD)
+    await conn.execute(_ROW)
+
+
+def _old(conn, user_id: int, post: int, vote: bool):
+    return conn.execute(
+        "SELECT pg_temp.posts_vote_old($1, $2, $3)", user_id, post, vote)
+
+
+def _row(conn, user_id: int, post: int, vote: bool):
+    return conn.execute(
+        "SELECT pg_temp.posts_vote_row($1, $2, $3)", user_id, post, vote)
+
+
+def _slots(conn, user_id: int, post: int, vote: bool):
+    # Баны проверяются и здесь, блог и фандом для этого не важны
+    return m.PostVote._c.e.insert(conn, user_id, post, vote, 0, 0)
+
+
+async def _run(pool, post: int, vote) -> tuple:
+    times = list()
+
+    async def voter(user_id):
+        for value in (True, False):
+            start = time.perf_counter()
+            async with pool.acquire() as conn:
+                await vote(conn, user_id, post, value)
+            times.append(time.perf_counter() - start)
+
+    await pool.execute("DELETE FROM posts_votes WHERE target_id = $1", post)
+    await pool.execute(
+        "DELETE FROM posts_vote_slots WHERE target_id = $1", post)
+    await pool.execute(
+        "UPDATE posts SET votes_up = 0, votes_down = 0 WHERE id = $1", post)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(voter(_USER + i) for i in range(VOTERS)))
+    elapsed = time.perf_counter() - start
+
+    times.sort()
+
+    return len(times) / elapsed, times[int(len(times) * 0.99)] * 1e3
+
+
+async def main():
+    pool = await asyncpg.create_pool(
+        host=os.environ['db_host'], port=int(os.environ['db_port']),
+        database=os.environ['db_database'], user=os.environ['db_user'],
+        password=os.environ['db_password'], min_size=POOL, max_size=POOL,
+        server_settings={'timezone': 'UTC'},
+        connection_class=statements.Connection, init=_init)
+
+    blog = await pool.fetchval(
+        "SELECT blogs_create(1, 1, 'bench-votes', 'Bench', '', '')")
+    post = await pool.fetchval(
+        "SELECT posts_create(1, $1, 1, 'Bench', '')", blog)
+
+    try:
+        print(f'{"vote":>9} {"votes/s":>9} {"p99, ms":>9}')
+        for name, vote in (('exception', _old), ('upsert', _row),
+                           ('slots', _slots)):
+            for _ in range(ROUNDS):
+                rate, p99 = await _run(pool, post, vote)
+                print(f'{name:>9} {rate:>9.0f} {p99:>9.2f}')
+    finally:
+        await pool.execute("DELETE FROM posts_votes WHERE target_id = $1",
+                           post)
+        await pool.execute(
+            "DELETE FROM posts_vote_slots WHERE target_id = $1", post)
+        await pool.execute("DELETE FROM posts WHERE id = $1", post)
+        await pool.execute("DELETE FROM blogs WHERE id = $1", blog)
+        await pool.close()
+
+
+if __name__ == '__main__':
+    asyncio.get_event_loop().run_until_complete(main())
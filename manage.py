@@ -14,10 +14,14 @@ def cli():
 
 
 @cli.command()
-def run():
+@click.option('--workers', type=int, default=1, envvar='workers',
+              help='Number of pre-forked worker processes')
+def run(workers):
     config_keys = ['access_key', 'refresh_key', 'server_host',
-                   'server_port', 'db_host', 'db_port', 'db_database',
-                   'db_user', 'db_password', 'pool_min', 'pool_max', 'test']
+                   'server_port', 'server_socket', 'db_host', 'db_port',
+                   'db_database', 'db_user', 'db_password', 'db_replicas',
+                   'pool_min', 'pool_max', 'test', 'pg_json', 'metrics',
+                   'slow_query_ms', 'request_deadline', 'vote_flush_ms']
 
     config = dict()
 
@@ -29,7 +33,7 @@ def run():
     if config_keys:
         raise Exception(str(config_keys))
 
-    main(config)
+    main(config, workers)
 
 
 if __name__ == '__main__':
@@ -167,6 +167,15 @@ class TestAuth:
         r = requests.post(url+'/auth/refresh', json=options)
         assert r.status_code == 400
 
+    def test_refresh_with_invalid_token_without_connection(self, url):
+        def acquired():
+            r = requests.get(url+'/metrics').json()['data']
+            return r['acquire']['primary']['count']
+
+        before = acquired()
+        requests.post(url+'/auth/refresh', json=dict(refresh_token='A'*44))
+        assert acquired() == before
+
     # TODO: Добавить тесты для истекшего токена
 
     def test_refresh(self, url):
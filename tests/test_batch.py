@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+import requests
+
+user_id = ''
+
+
+class TestBatch:
+    def test_init(self, url, conf):
+        global user_id
+
+        r = requests.post(url+'/clear_db')
+        if r.status_code != 200:
+            pytest.exit('Server must be running in test mode')
+
+        options = dict(
+            username=conf['username'],
+            password=conf['password']
+        )
+
+        user_id = requests.post(
+            url+'/auth/register', json=options).json()['data']['Location'][7:]
+
+    def test_batch(self, url):
+        global user_id
+        r = requests.post(url+'/batch', json=[
+            dict(method='GET', path='/users/'+user_id),
+            dict(method='GET', path='/users/'+user_id+'/blogs'),
+            dict(method='GET', path='/users/0'),
+        ])
+        assert r.status_code == 200
+
+        data = r.json()['data']
+        assert [x['status'] for x in data] == [200, 200, 404]
+        assert data[0]['body']['data']['id'] == int(user_id)
+
+    def test_batch_with_body(self, url):
+        r = requests.post(url+'/batch', json=[
+            dict(method='POST', path='/auth/login', body=dict()),
+        ])
+        assert r.status_code == 200
+        assert r.json()['data'][0]['status'] == 400
+
+    def test_batch_not_list(self, url):
+        r = requests.post(url+'/batch', json=dict())
+        assert r.status_code == 400
+
+    def test_batch_empty(self, url):
+        r = requests.post(url+'/batch', json=[])
+        assert r.status_code == 400
+
+    def test_batch_nested(self, url):
+        r = requests.post(url+'/batch', json=[
+            dict(method='POST', path='/batch', body=[]),
+        ])
+        assert r.status_code == 400
+
+    def test_batch_nested_with_fragment(self, url):
+        r = requests.post(url+'/batch', json=[
+            dict(method='POST', path='/batch#x', body=[]),
+        ])
+        assert r.status_code == 400
+
+    def test_batch_stream(self, url):
+        r = requests.post(url+'/batch', json=[
+            dict(method='GET', path='/posts?stream=1'),
+        ])
+        assert r.status_code == 400
+
+    def test_batch_stream_disabled(self, url):
+        r = requests.post(url+'/batch', json=[
+            dict(method='GET', path='/posts?stream=0'),
+        ])
+        assert r.status_code == 200
+        assert r.json()['data'][0]['status'] == 200
+
+    def test_batch_stream_encoded(self, url):
+        r = requests.post(url+'/batch', json=[
+            dict(method='GET', path='/posts?%73tream=1'),
+        ])
+        assert r.status_code == 400
+
+    def test_batch_upstream_param(self, url):
+        r = requests.post(url+'/batch', json=[
+            dict(method='GET', path='/posts?upstream=1'),
+        ])
+        assert r.status_code == 200
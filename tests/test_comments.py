@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+import requests
+
+post_id = ''
+
+
+class TestComments:
+    def test_init(self, url):
+        global post_id
+
+        r = requests.post(url+'/clear_db')
+        if r.status_code != 200:
+            pytest.exit('Server must be running in test mode')
+
+        requests.post(url+'/execute', json=dict(
+            sql="SELECT posts_create(1, blogs_create("
+                "1, 1, 'comments', 'Comments', '', ''), 1, 'Post', 'Text')"))
+        post_id = str(requests.get(url+'/posts').json()['data'][0]['id'])
+
+        # Корень, ответ на него, ответ на ответ и второй корень
+        for parent, content in (('0', 'Root'),
+                                ('(SELECT max(id) FROM comments)', 'Answer'),
+                                ('(SELECT max(id) FROM comments)', 'Deep'),
+                                ('0', 'Second')):
+            requests.post(url+'/execute', json=dict(
+                sql="SELECT comments_create(1, p.id, p.blog_id, p.fandom_id, "
+                    "%s, '%s') FROM posts AS p" % (parent, content)))
+
+    def _tree(self, url, **query):
+        global post_id
+        r = requests.get(url+'/posts/'+post_id+'/comments',
+                         params=dict(tree=1, **query))
+        assert r.status_code == 200
+        return r.json()['data']
+
+    def _shape(self, nodes):
+        return [(x['attributes']['content'], self._shape(x['children']))
+                for x in nodes]
+
+    def test_tree(self, url):
+        data = self._tree(url)
+        assert self._shape(data) == [
+            ('Root', [('Answer', [('Deep', [])])]), ('Second', [])]
+        assert 'path' not in data[0]['attributes']
+
+    def test_tree_depth(self, url):
+        assert self._shape(self._tree(url, depth=2)) == [
+            ('Root', [('Answer', [])]), ('Second', [])]
+
+    def test_tree_pages(self, url):
+        global post_id
+        body = requests.get(url+'/posts/'+post_id+'/comments',
+                            params=dict(tree=1, limit=2)).json()
+        assert self._shape(body['data']) == [('Root', [('Answer', [])])]
+
+        # Ответ, чей родитель на прошлой странице, - корень этой
+        data = self._tree(url, limit=2, after=body['meta']['after'])
+        assert self._shape(data) == [('Deep', []), ('Second', [])]
+
+    def test_flat(self, url):
+        global post_id
+        data = requests.get(
+            url+'/posts/'+post_id+'/comments').json()['data']
+        assert [x['attributes']['content'] for x in data] == [
+            'Root', 'Answer', 'Deep', 'Second']
+        assert 'children' not in data[0]
+
+    def test_sparse_etag(self, url):
+        global post_id
+        full = requests.get(url+'/posts/'+post_id+'/comments')
+        sparse = requests.get(url+'/posts/'+post_id+'/comments', params={
+            'fields[comments]': 'content,edited_at,votes_up,votes_down'})
+        assert 'owner' not in sparse.json()['data'][0]['attributes']
+        assert full.headers['ETag'] != sparse.headers['ETag']
+
+    def test_tree_etag(self, url):
+        global post_id
+        flat = requests.get(url+'/posts/'+post_id+'/comments')
+        tree = requests.get(url+'/posts/'+post_id+'/comments',
+                            params=dict(tree=1))
+        deep = requests.get(url+'/posts/'+post_id+'/comments',
+                            params=dict(tree=1, depth=2))
+        assert len({flat.headers['ETag'], tree.headers['ETag'],
+                    deep.headers['ETag']}) == 3
+
+    def test_tree_include(self, url):
+        global post_id
+        r = requests.get(url+'/posts/'+post_id+'/comments',
+                         params=dict(tree=1, include='post'))
+        assert r.status_code == 200
+        assert [x['id'] for x in r.json()['included']] == [int(post_id)]
+
+    def test_sparse_include_without_column(self, url):
+        global post_id
+        r = requests.get(url+'/posts/'+post_id+'/comments', params={
+            'fields[comments]': 'content', 'include': 'post'})
+        assert r.status_code == 400
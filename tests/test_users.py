@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import time
+
 import pytest
 import requests
 
@@ -32,6 +34,32 @@ class TestUsers:
         r = requests.get(url+'/users')
         assert r.status_code == 200
 
+    def test_users_get_with_limit(self, url):
+        r = requests.get(url+'/users', params=dict(limit=1))
+        assert r.status_code == 200
+        assert len(r.json()['data']) == 1
+
+    def test_users_get_with_wrong_limit(self, url):
+        r = requests.get(url+'/users', params=dict(limit=0))
+        assert r.status_code == 400
+
+    def test_users_get_with_wrong_cursor(self, url):
+        r = requests.get(url+'/users', params=dict(after='!'))
+        assert r.status_code == 400
+
+    def test_users_get_next_page(self, url, conf):
+        requests.post(url+'/auth/register', json=dict(
+            username=conf['username']+'2', password=conf['password']))
+
+        r = requests.get(url+'/users', params=dict(limit=1))
+        body = r.json()
+        assert 'next' in body['meta']
+
+        r = requests.get(url+'/users', params=dict(
+            limit=1, after=body['meta']['after']))
+        assert r.status_code == 200
+        assert r.json()['data'][0]['id'] != body['data'][0]['id']
+
     def test_users_get_with_wrong_id(self, url):
         r = requests.get(url+'/users/0')
         assert r.status_code == 404
@@ -59,6 +87,38 @@ class TestUsers:
             Authorization='Token '+access_token))
         assert r.status_code == 200
 
+    def test_users_get_not_modified(self, url):
+        global user_id
+        r = requests.get(url+'/users/'+user_id)
+        assert 'ETag' in r.headers
+
+        r = requests.get(url+'/users/'+user_id, headers={
+            'If-None-Match': r.headers['ETag']})
+        assert r.status_code == 304
+
+    def test_users_get_not_modified_with_username(self, url, conf):
+        r = requests.get(url+'/users/u/'+conf['username'])
+
+        r = requests.get(url+'/users/u/'+conf['username'], headers={
+            'If-None-Match': r.headers['ETag']})
+        assert r.status_code == 304
+
+    def test_users_get_with_stale_etag(self, url):
+        global user_id
+        r = requests.get(url+'/users/'+user_id, headers={
+            'If-None-Match': '"stale"'})
+        assert r.status_code == 200
+
+    def test_users_get_own_write_from_replica(self, url, conf):
+        r = requests.post(url+'/auth/register', json=dict(
+            username=conf['username']+'4', password=conf['password']))
+        if 'X-LSN' not in r.headers:
+            pytest.skip('Server is running without replicas')
+
+        r = requests.get(url+r.json()['data']['Location'], headers={
+            'X-LSN': r.headers['X-LSN']})
+        assert r.status_code == 200
+
     # --- USERS PATCH --- #
 
     def test_users_patch_by_id_without_token(self, url):
@@ -84,6 +144,39 @@ class TestUsers:
                 Authorization='Token '+access_token))
         assert r.status_code == 200
 
+    def test_users_patch_by_another_user(self, url, conf):
+        global user_id
+        options = dict(username=conf['username']+'3',
+                       password=conf['password'])
+        requests.post(url+'/auth/register', json=options)
+        token = requests.post(
+            url+'/auth/login', json=options).json()['data']['access_token']
+
+        r = requests.patch(
+            url+'/users/'+user_id, json=dict(), headers=dict(
+                Authorization='Token '+token))
+        assert r.status_code == 403
+
+    def test_users_patch_after_becoming_admin(self, url, conf):
+        global user_id
+        options = dict(username=conf['username']+'3',
+                       password=conf['password'])
+        r = requests.post(url+'/auth/login', json=options).json()['data']
+        token = r['access_token']
+
+        # Запрет уже лежит в кэше прав, NOTIFY должен его сбросить
+        requests.post(url+'/execute', json=dict(
+            sql="INSERT INTO admins SELECT id FROM users "
+                "WHERE username='%s3'" % conf['username']))
+        time.sleep(0.1)
+
+        r = requests.patch(
+            url+'/users/'+user_id, json=dict(), headers=dict(
+                Authorization='Token '+token))
+        assert r.status_code == 200
+
+        requests.post(url+'/execute', json=dict(sql="DELETE FROM admins"))
+
     # --- USERS HISTORY GET --- #
 
     def test_users_history_get_by_id_without_token(self, url):
@@ -108,3 +201,26 @@ class TestUsers:
             url+'/users/u/'+conf['username']+'/history', headers=dict(
                 Authorization='Token ' + access_token))
         assert r.status_code == 200
+
+    # --- PREPARED STATEMENTS --- #
+
+    def test_statements_prepared_in_advance(self, url):
+        r = requests.get(url+'/statements')
+        assert r.status_code == 200
+
+        stats = r.json()['data']['statements']
+        assert sum(x['hits'] for x in stats) > 0
+        assert sum(x['misses'] for x in stats) == 0
+
+    # --- METRICS --- #
+
+    def test_metrics(self, url):
+        global user_id
+        requests.get(url+'/users/'+user_id)
+
+        r = requests.get(url+'/metrics')
+        assert r.status_code == 200
+
+        data = r.json()['data']
+        assert data['acquire']['primary']['count'] > 0
+        assert any(x.startswith('users.User.') for x in data['queries'])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+
+import pytest
+import requests
+
+post_id = ''
+access_token = ''
+
+
+class TestVotes:
+    def test_init(self, url, conf):
+        global post_id, access_token
+
+        r = requests.post(url+'/clear_db')
+        if r.status_code != 200:
+            pytest.exit('Server must be running in test mode')
+
+        options = dict(
+            username=conf['username'],
+            password=conf['password']
+        )
+
+        requests.post(url+'/auth/register', json=options)
+        access_token = requests.post(
+            url+'/auth/login', json=options).json()['data']['access_token']
+
+        requests.post(url+'/execute', json=dict(
+            sql="SELECT posts_create(1, blogs_create("
+                "1, 1, 'votes', 'Votes', '', ''), 1, 'Post', 'Text')"))
+        post_id = str(requests.get(url+'/posts').json()['data'][0]['id'])
+
+    def _counters(self, url):
+        global post_id
+        meta = requests.get(url+'/posts/'+post_id).json()['data']['meta']
+        return meta['votes_up'], meta['votes_down']
+
+    def _vote(self, url, vote):
+        global post_id, access_token
+        return requests.post(
+            url+'/posts/'+post_id+'/votes', json=dict(vote=vote),
+            headers=dict(Authorization='Token '+access_token))
+
+    def test_vote_without_token(self, url):
+        global post_id
+        r = requests.post(url+'/posts/'+post_id+'/votes',
+                          json=dict(vote=True))
+        assert r.status_code == 403
+
+    def test_vote(self, url):
+        r = self._vote(url, True)
+        assert r.status_code == 201
+        assert self._counters(url) == (1, 0)
+
+    def test_vote_again(self, url):
+        r = self._vote(url, True)
+        assert r.status_code == 201
+        assert self._counters(url) == (1, 0)
+
+    def test_vote_changed(self, url):
+        r = self._vote(url, False)
+        assert r.status_code == 201
+        assert self._counters(url) == (0, 1)
+
+    def test_vote_rolled_up(self, url):
+        # Слоты переносятся в счетчики раз в секунду, сумма не меняется
+        time.sleep(1.5)
+        assert self._counters(url) == (0, 1)
+
+    def test_vote_by_banned_user(self, url, conf):
+        global post_id
+        requests.post(url+'/execute', json=dict(
+            sql="INSERT INTO blog_bans SELECT u.id, p.blog_id, 0, '' "
+                "FROM users AS u, posts AS p WHERE u.username='%s' "
+                "AND p.id=%s" % (conf['username'], post_id)))
+
+        r = self._vote(url, True)
+        assert r.status_code == 403
+        assert self._counters(url) == (0, 1)
+
+    def test_post_insert_by_banned_user(self, url):
+        global post_id, access_token
+        blog_id = requests.get(url+'/posts/'+post_id).json()[
+            'data']['attributes']['blog_id']
+
+        r = requests.post(
+            url+'/blogs/%s/posts' % blog_id,
+            json=dict(title='Banned post', content='Banned post'),
+            headers=dict(Authorization='Token '+access_token))
+        assert r.status_code == 403
+
+        requests.post(url+'/execute', json=dict(sql="DELETE FROM blog_bans"))